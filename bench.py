@@ -0,0 +1,225 @@
+# bench.py — Banc d'essai MKV → HLS : sources synthétiques (lavfi testsrc2/sine), vrai pipeline convert_one_file,
+# mesures JSON (fps, vitesse, temps par résolution, CPU/RSS, octets produits) + comparaison à une référence.
+# Usage : python bench.py [--quick] [--mode ts|fmp4|cmaf] [--baseline bench_baseline.json] [--save-baseline] [--tolerance 0.10]
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import List, Dict, Optional, Any
+
+try:
+    import resource  # Unix : CPU/RSS des ffmpeg (RUSAGE_CHILDREN)
+except ImportError:
+    resource = None
+
+import main as m
+
+# ==========================
+# CONFIG
+# ==========================
+BENCH_DIR = "bench"                    # sources générées (réutilisées) + sorties temporaires
+BASELINE_FILE = "bench_baseline.json"  # référence pour la détection de régressions
+BENCH_BACKEND = "x264"                 # encodeur CPU : résultats comparables d'une machine GPU à l'autre
+DEFAULT_TOLERANCE = 0.10               # écart toléré avant de signaler une régression (10 %)
+
+# (nom, taille, fps, durée s, pistes audio) — testsrc2 + sine : contenu déterministe, sources réencodées bit-exact
+CASES: List[Dict[str, Any]] = [
+    {"name": "1080p25_60s_2a", "size": "1920x1080", "fps": 25, "duration": 60, "audio": 2},
+    {"name": "720p30_120s_1a", "size": "1280x720",  "fps": 30, "duration": 120, "audio": 1},
+    {"name": "480p24_90s_3a",  "size": "854x480",   "fps": 24, "duration": 90, "audio": 3},
+]
+QUICK_CASES: List[Dict[str, Any]] = [
+    {"name": "720p25_20s_2a", "size": "1280x720", "fps": 25, "duration": 20, "audio": 2},
+    {"name": "480p25_20s_1a", "size": "854x480",  "fps": 25, "duration": 20, "audio": 1},
+]
+
+# Métriques comparées à la référence : +1 = plus haut est mieux, -1 = plus bas est mieux
+COMPARED = {"speed": +1, "fps": +1, "cpu_seconds": -1, "output_bytes": -1}
+
+LANGS = ["fre", "eng", "spa", "ger"]
+
+# ==========================
+# SOURCES
+# ==========================
+
+def make_source(case: Dict[str, Any], out_dir: Path) -> Path:
+    # Générée une fois puis réutilisée (nom = paramètres du cas)
+    src = out_dir / f"{case['name']}.mkv"
+    if src.exists():
+        return src
+    out_dir.mkdir(parents=True, exist_ok=True)
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc2=s={case['size']}:r={case['fps']}:d={case['duration']}"]
+    for k in range(case["audio"]):
+        args += ["-f", "lavfi", "-i", f"sine=f={330 + 110 * k}:sample_rate=48000:d={case['duration']}"]
+    args += ["-map", "0:v"]
+    for k in range(case["audio"]):
+        args += ["-map", f"{k + 1}:a", f"-metadata:s:a:{k}", f"language={LANGS[k % len(LANGS)]}"]
+    tmp = src.with_suffix(".tmp.mkv")
+    args += ["-c:v", "libx264", "-preset", "veryfast", "-crf", "18", "-pix_fmt", "yuv420p",
+             "-c:a", "ac3", "-b:a", "192k",  # AC3 : l'audio est réellement réencodé (pas de passthrough AAC)
+             "-fflags", "+bitexact", "-flags:v", "+bitexact", "-flags:a", "+bitexact", str(tmp)]
+    subprocess.run(args, check=True)
+    os.replace(tmp, src)
+    return src
+
+# ==========================
+# RUN (1 cas = 1 sous-process → CPU/RSS des ffmpeg de ce cas uniquement)
+# ==========================
+
+def _rusage() -> Optional[Dict[str, float]]:
+    if resource is None:
+        return None
+    ch = resource.getrusage(resource.RUSAGE_CHILDREN)
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    scale = 1024 if sys.platform != "darwin" else 1  # ru_maxrss : Ko sous Linux, octets sous macOS
+    return {
+        "cpu": ch.ru_utime + ch.ru_stime,
+        "child_rss": ch.ru_maxrss * scale,
+        "self_rss": me.ru_maxrss * scale,
+    }
+
+def dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+def run_case(case: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    bench = Path(BENCH_DIR).resolve()
+    src = make_source(case, bench / "sources")
+    out_root = bench / "out" / mode
+    shutil.rmtree(out_root / src.stem, ignore_errors=True)  # pas de reprise via le journal : encodage complet
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    m.VIDEO_BACKEND = BENCH_BACKEND
+    m.PROBE_CACHE = False
+    m.VIDEO_PASSTHROUGH = m.AUDIO_PASSTHROUGH = False  # on mesure l'encodage, pas la copie
+    m.VERIFY_OUTPUT = False  # relecture des segments hors mesure (elle fausserait le temps d'encodage)
+    m.HEADLESS = True
+    progress = m.ProgressBus()  # suivi des tâches sans sink (aucune sortie)
+    file_states = [m.new_file_state(1, src)]
+
+    before = _rusage()
+    t0 = time.perf_counter()
+    with contextlib.redirect_stdout(sys.stderr):  # logs JSON hors de stdout (réservé au résultat)
+        probe = m.probe_source(src)
+        m.convert_one_file(src, out_root, progress, file_states, 0, mode, probe)
+    wall = time.perf_counter() - t0
+    after = _rusage()
+
+    # Temps par résolution : du lancement du fichier à la résolution terminée (tâches Progress de convert_one_file)
+    rungs = {}
+    for task in progress.tasks:
+        name = task.fields.get("rung")
+        if name and task.stop_time is not None:
+            rungs[name] = {
+                "wall": round(task.stop_time - task.start_time, 3),
+                "bytes": dir_bytes(out_root / src.stem / name) if (out_root / src.stem / name).is_dir() else None,
+            }
+
+    frames = probe["duration"] * probe["fps"]
+    result = {
+        "case": case["name"],
+        "mode": mode,
+        "status": file_states[0]["status"],
+        "duration": probe["duration"],
+        "wall": round(wall, 3),
+        "speed": round(probe["duration"] / wall, 3) if wall else None,  # × temps réel
+        "fps": round(frames / wall, 2) if wall else None,                # images source traitées / s
+        "rungs": rungs,
+        "output_bytes": dir_bytes(out_root / src.stem),
+    }
+    if before and after:
+        result["cpu_seconds"] = round(after["cpu"] - before["cpu"], 3)
+        result["peak_rss_ffmpeg_mb"] = round(after["child_rss"] / 2**20, 1)
+        result["peak_rss_python_mb"] = round(after["self_rss"] / 2**20, 1)
+    return result
+
+def run_case_subprocess(case: Dict[str, Any], mode: str) -> Dict[str, Any]:
+    out = subprocess.run([sys.executable, __file__, "--case-json", json.dumps(case), "--mode", mode],
+                         check=True, capture_output=True, text=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+# ==========================
+# RAPPORT & RÉFÉRENCE
+# ==========================
+
+def environment() -> Dict[str, Any]:
+    try:
+        ffmpeg = subprocess.check_output(["ffmpeg", "-hide_banner", "-version"], text=True).splitlines()[0]
+    except Exception:
+        ffmpeg = None
+    return {
+        "ffmpeg": ffmpeg,
+        "backend": BENCH_BACKEND,
+        "preset": m.ENCODER_PRESET,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    # Régression = métrique moins bonne que la référence au-delà de la tolérance (même cas, même mode)
+    ref = {(r["case"], r["mode"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for r in results:
+        b = ref.get((r["case"], r["mode"]))
+        if not b:
+            continue
+        for metric, sign in COMPARED.items():
+            cur, old = r.get(metric), b.get(metric)
+            if not cur or not old:
+                continue
+            change = (cur - old) / old
+            r.setdefault("vs_baseline", {})[metric] = round(change, 4)
+            if change * sign < -tolerance:
+                regressions.append(f"{r['case']} [{r['mode']}] {metric}: {old} → {cur} ({change:+.1%})")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="MKV → HLS benchmark")
+    parser.add_argument("--quick", action="store_true", help="short sources (CI smoke run)")
+    parser.add_argument("--mode", choices=m.HLS_MODES, default="ts")
+    parser.add_argument("--out", type=Path, help="write results JSON here (default: stdout)")
+    parser.add_argument("--baseline", type=Path, default=Path(BASELINE_FILE))
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE)
+    parser.add_argument("--case-json", help=argparse.SUPPRESS)  # sous-process : 1 cas, résultat JSON sur stdout
+    args = parser.parse_args(argv)
+
+    if args.case_json:
+        print(json.dumps(run_case(json.loads(args.case_json), args.mode)))
+        return 0
+
+    results = []
+    for case in (QUICK_CASES if args.quick else CASES):
+        print(f"[bench] {case['name']} ({args.mode}) …", file=sys.stderr)
+        results.append(run_case_subprocess(case, args.mode))
+        r = results[-1]
+        print(f"[bench]   {r['wall']}s  {r['speed']}x  {r['fps']} fps  {r['output_bytes'] / 2**20:.1f} MiB  {r['status']}", file=sys.stderr)
+
+    report: Dict[str, Any] = {"env": environment(), "results": results}
+    regressions: List[str] = []
+    if args.baseline.exists() and not args.save_baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.tolerance)
+        report["regressions"] = regressions
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+    if args.save_baseline:
+        args.baseline.write_text(text + "\n", encoding="utf-8")
+        print(f"[bench] baseline → {args.baseline}", file=sys.stderr)
+    for line in regressions:
+        print(f"[bench] REGRESSION {line}", file=sys.stderr)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
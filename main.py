@@ -1,30 +1,64 @@
 # main.py — MKV → HLS (1080p/720p/480p) NVENC + UI Rich + I18N + choix TS/M4S (invite)
 # Windows/macOS/Linux — nécessite FFmpeg avec h264_nvenc. GPU scale via scale_cuda si dispo (+ hwupload_cuda).
+# Sans GPU NVIDIA : VIDEO_BACKEND = "x264" / "x265" (CPU), "vaapi" ou "qsv".
 # Audio : priorité VFF > VFI > VF générique > VFA > VFQ > autres. 1ʳᵉ piste audio = default.
 
+from __future__ import annotations
+
+import argparse
+import asyncio
+import atexit
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import heapq
 import json
+import math
 import os
 import re
+import select
+import shutil
+import socket
+import sqlite3
+import struct
 import subprocess
+import sys
+import threading
+import time
+import uuid
 import locale
+import mmap
+import multiprocessing
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack, contextmanager
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional, Any
+from typing import List, Tuple, Dict, Optional, Any, Callable, Iterator, TextIO, TYPE_CHECKING
+
+try:
+    import fcntl  # POSIX : verrou du staging ; Linux : reflink (FICLONE) quand le lien dur est impossible
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt  # Windows : verrou du staging
+except ImportError:
+    msvcrt = None
 
-from rich import box
-from rich.console import Console, Group
-from rich.live import Live
-from rich.panel import Panel
-from rich.progress import (
-    Progress, BarColumn, TimeRemainingColumn, TimeElapsedColumn,
-    TaskProgressColumn, SpinnerColumn, TextColumn
-)
-from rich.table import Table
-from rich.theme import Theme
+# Rich importé à la demande (TUI seulement) : --headless démarre sans
+if TYPE_CHECKING:
+    from rich.console import Group
+    from rich.progress import Progress
+    from rich.table import Table
 
 # ==========================
 # CONFIG
 # ==========================
-RESOLUTIONS: List[Tuple[str, str, str, int]] = [
+# (nom, scale, résolution master, kbps[, codec]) — codec "h264" | "hevc" | "av1" ; absent → codec de VIDEO_BACKEND
+# ex. ("1080p_hevc", "1920:1080", "1920x1080", 4500, "hevc") : même décodage que les variantes H.264 (nom = dossier, unique)
+RESOLUTIONS: List[Tuple] = [
     ("1080p", "1920:1080", "1920x1080", 7000),
     ("720p",  "1280:720",  "1280x720",  4000),
     ("480p",  "854:480",   "854x480",   2000),
@@ -37,6 +71,69 @@ AUDIO_BITRATE_K = 128        # kbps par piste audio
 SEG_DUR = 10                 # durée segment HLS (s) — VOD recommandé
 GOP_SECONDS = 10.0           # GOP aligné aux segments (keyframe toutes les 10 s)
 SOFT_SCALE_IF_NEEDED = True  # Si scale CUDA indispo/échoue → scale CPU, encodage NVENC conservé
+SINGLE_DECODE = True         # 1 seul décodage → split vers toutes les résolutions (1 ffmpeg, -var_stream_map)
+SHARED_AUDIO = True          # Audio encodé 1 fois par piste → playlists audio (EXT-X-MEDIA), variantes vidéo sans audio
+VIDEO_BACKEND = "auto"       # "auto" | "nvenc" | "x264" | "x265" | "vaapi" | "qsv" (voir ENCODER_BACKENDS)
+BACKEND_AUTO_ORDER = ["nvenc", "qsv", "vaapi", "x264"]  # "auto" : 1ᵉʳ backend présent ET fonctionnel
+ENCODER_PRESET = "balanced"  # "fast" | "balanced" | "quality" → traduit par backend
+VAAPI_DEVICE = "/dev/dri/renderD128"
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mkv-to-hls")  # capacités ffmpeg (clé : chemin + mtime)
+ENCODER_SLOTS: Dict[str, int] = {"nvenc": 3, "qsv": 2, "vaapi": 2, "x264": 2, "x265": 1, "svtav1": 1, "audio": 2, "side": 1}  # ffmpeg simultanés par backend (fichiers + résolutions ; nvenc_hevc… comptent dans nvenc) ; "audio" : audio partagé, "side" : planches/sous-titres lus à part
+CPU_SCALE_SLOTS = 2          # dont au plus N avec scale CPU (fallback ou filtres CUDA absents)
+PROBE_WORKERS = 8            # ffprobe simultanés au scan de la file
+CHUNKED_ENCODE = False       # Longues sources : morceaux alignés GOP encodés en parallèle puis recousus (1 playlist/résolution)
+CHUNK_MIN_DURATION = 1800.0  # (s) en dessous, encodage d'un seul tenant
+CHUNK_SECONDS = 300.0        # durée visée d'un morceau (multiple de GOP_SECONDS)
+CHUNK_WORKERS = 4            # morceaux en cours simultanément (toujours bornés par ENCODER_SLOTS)
+PROBE_CACHE = True           # Cache disque (SQLite, CACHE_DIR/probe.sqlite) des ffprobe : clé chemin + taille + mtime
+PROBE_CACHE_HASH = False     # + empreinte du 1ᵉʳ/dernier Mo (détecte un fichier remplacé à taille/mtime identiques)
+LADDER_PRUNE = True          # Résolutions au-dessus de la source ignorées (pas d'upscale ; au moins 1 résolution gardée)
+LADDER_CLAMP_BITRATE = True  # Débit vidéo de chaque résolution plafonné au débit vidéo de la source
+COMPLEXITY_ANALYSIS = False  # Avant l'encodage : quelques fenêtres de la source encodées en CRF basse résolution → score de complexité → débits de l'échelle ajustés (mesure gardée avec le probe)
+COMPLEXITY_SAMPLES = 8       # fenêtres réparties sur la durée
+COMPLEXITY_WINDOW = 2.0      # (s) par fenêtre
+COMPLEXITY_SIZE = "640x360"  # taille d'analyse (nombre de pixels fixe : score comparable d'une source à l'autre)
+COMPLEXITY_CRF = 23          # qualité constante de l'analyse (libx264 veryfast)
+COMPLEXITY_REFERENCE_KBPS = 800  # débit d'analyse d'un titre « moyen », pour lequel RESOLUTIONS est juste → score 1.0
+COMPLEXITY_FACTOR_RANGE = (0.4, 1.5)  # facteur appliqué aux débits de RESOLUTIONS = score borné
+COMPLEXITY_MIN_STEP_K = 250  # après ajustement, résolution ignorée si < N kbps au-dessus de la précédente (même codec) ; 0 → aucune
+VIDEO_PASSTHROUGH = True     # Résolution la plus haute copiée si source H.264 yuv420p à la même taille, keyframes sur la grille GOP, débit ≤ cible
+AUDIO_PASSTHROUGH = True     # Pistes déjà en AAC stéréo copiées telles quelles
+TRICKPLAY = False            # Vignettes de navigation (planches + index WebVTT) tirées du décodage de l'encodage + playlists I-frame par résolution
+TRICKPLAY_INTERVAL = 10.0    # (s) une vignette toutes les N s
+TRICKPLAY_WIDTH = 320        # largeur d'une vignette (hauteur : ratio de la source)
+TRICKPLAY_GRID = (10, 10)    # colonnes × lignes par planche
+TRICKPLAY_FORMAT = "jpg"     # "jpg" | "webp"
+PROGRESSIVE = False          # Master publié avant l'encodage, playlists EVENT qui grandissent segment par segment → lecture en quelques secondes (ignore SCRATCH_DIR et CHUNKED_ENCODE)
+HLS_MODE: Optional[str] = None  # "ts" | "fmp4" | "cmaf" (1 fichier fMP4 par variante, #EXT-X-BYTERANGE) ; None → question au lancement (obligatoire en mode --watch)
+WATCH_SETTLE_SECONDS = 10.0  # --watch : fichier mis en file après N s sans changement de taille/mtime (copie terminée)
+WATCH_POLL_INTERVAL = 5.0    # --watch sans inotify (Windows/macOS, partages réseau) : rescan toutes les N s
+HEADLESS = False             # --headless : sans Rich ni question, progression en JSON lines sur stdout, code de sortie
+FFMPEG_STALL_TIMEOUT = 300.0  # (s) ffmpeg sans avancer (temps, frames et taille figés) → tué puis relancé ; 0 → jamais
+FFMPEG_STALL_RETRIES = 1      # relances après blocage avant d'abandonner (→ repli habituel : CPU, par résolution…)
+PROGRESS_TICK_HZ = 4.0        # barres, journal et métriques mis à jour N fois/s par ffmpeg (lignes -progress regroupées)
+JSON_PROGRESS_INTERVAL = 1.0  # (s) --headless : avancement d'une tâche écrit au plus toutes les N s
+UI_QUEUE_ROWS = 20            # TUI : lignes du tableau de la file (en cours, derniers terminés, suivants) ; le reste résumé en compteurs
+UI_DONE_BARS = 6              # TUI : barres de tâches terminées gardées à l'écran (les plus récentes)
+STAGING_DIR: Optional[str] = None  # Disque local rapide : sources copiées (NAS → local) pendant l'encodage précédent ; None → lecture directe
+STAGING_MAX_BYTES = 200 * 2**30     # place max des copies locales (LRU : copies d'avance non commencées évincées en premier)
+STAGING_AHEAD = 2                   # sources copiées d'avance au-delà de celles en cours
+SCRATCH_DIR: Optional[str] = None  # Encodage dans SCRATCH_DIR/<fichier> (tmpfs, SSD) puis publication par renommage atomique ; None → écriture directe dans la sortie
+PUBLISH_COPY_WORKERS = 4           # scratch et sortie sur des FS différents : variante copiée par lot (N fichiers en parallèle) puis renommée
+DEDUP_CACHE = False          # Même contenu déjà converti (autre nom/chemin) avec les mêmes réglages → sortie reprise par lien dur/reflink, sans ffmpeg
+DEDUP_DIR: Optional[str] = None  # magasin des sorties (None → CACHE_DIR/dedup) ; sur le FS de OUTPUT_DIR pour des liens durs
+DEDUP_MAX_BYTES = 500 * 2**30    # taille max du magasin (LRU : sorties les moins récemment reprises évincées ; fichiers comptés entiers)
+DEDUP_SAMPLES = 64               # blocs de 64 Kio lus (mmap) répartis sur la source : empreinte en quelques Mo quelle que soit la taille
+DEDUP_VERIFY = "stat"            # avant reprise : "stat" (taille + mtime de chaque fichier) | "hash" (contenu rehaché, plus lent)
+VERIFY_OUTPUT = True         # Après le master : segments relus (en-têtes seulement), keyframe en tête, durées, playlists complètes ; BANDWIDTH/AVERAGE-BANDWIDTH/FRAME-RATE/CODECS mesurés
+VERIFY_WORKERS: Optional[int] = None  # processus de vérification (aussi --verify sur tout le catalogue) ; None → nombre de CPU, 0 → dans le processus
+COORD_LEASE_TTL = 30.0       # (s) --coordinator : bail d'un job sans heartbeat → remis en file (worker mort)
+COORD_MAX_ATTEMPTS = 3       # essais d'un job (échecs + baux expirés) avant de l'abandonner
+COORD_SPLIT_RUNGS = False    # jobs (fichier, résolution) + audio répartis entre workers, puis job fichier (master)
+COORD_POLL_INTERVAL = 2.0    # (s) --worker : attente entre deux demandes quand la file est vide
+METRICS_EVENTS: Optional[str] = None  # Fichier JSON lines (1 événement/ligne : étapes, stats ffmpeg, replis) ; None → désactivé
+METRICS_PROM: Optional[str] = None    # Textfile Prometheus (node_exporter --collector.textfile.directory) ; None → désactivé
+METRICS_PROGRESS_INTERVAL = 10.0      # (s) stats -progress d'un ffmpeg en cours écrites au plus toutes les N s
 
 # ==========================
 # I18N
@@ -52,21 +149,69 @@ TRANSLATIONS = {
         "col_status": "Status",
         "no_mkv": "No .mkv files found.",
         "nvenc_missing": "NVENC (h264_nvenc) is not available in your FFmpeg build. Install a build with NVENC (e.g., Gyan, BtbN).",
+        "encoder_missing": "Encoder {encoder} is not available (or not usable) in your FFmpeg build.",
+        "encoder_backend": "Video encoder: {backend} ({encoder}).",
         "cuda_filters_on": "CUDA filters detected → scale_cuda enabled.",
         "cuda_filters_off": "CUDA filters not found → using CPU scale; NVENC (GPU) encoder is preserved.",
         "cuda_filters_required": "CUDA filters missing and SOFT_SCALE_IF_NEEDED=False.",
         "file_task": "File",
         "fallback_cpu": "{name} → {res} : falling back to CPU scale.",
+        "fallback_per_rung": "{name} : single-decode ladder failed, encoding each resolution separately.",
+        "fallback_unchunked": "{name} : chunked encode failed, encoding the file in one piece.",
+        "reused_variant": "{name} → {res} : already complete (same settings and source), skipped.",
+        "resume_variant": "{name} → {res} : resuming at {at}s.",
+        "ladder_plan": "{name} : ladder {plan}",
+        "rungs_skipped": "{name} → {res} : no working encoder for this codec (HEVC/AV1 also need fMP4/CMAF), skipped.",
         "ok_variant": "{name} → {res} OK",
+        "audio_failed": "{name} → audio : encoding failed, master not written.",
+        "publish_failed": "{name} → {res} : publishing failed ({err}).",
+        "iframes_failed": "{name} → {res} : I-frame playlist not written ({err}).",
+        "side_outputs_failed": "{name} → thumbnails / subtitles : extraction failed ({err}).",
+        "subtitles_failed": "{name} → subtitles : not written ({err}).",
+        "dedup_hit": "{name} → same content already converted with these settings: output linked from the dedup cache.",
+        "dedup_corrupt": "Dedup cache: entry for {name} failed verification ({file}), dropped.",
+        "dedup_restore_failed": "{name} → dedup cache: output not restored ({err}), encoding instead.",
+        "dedup_check": "Dedup cache {path}: {ok} OK, {bad} damaged (dropped), {evicted} evicted.",
+        "complexity_failed": "{name} → complexity analysis failed ({err}), default ladder kept.",
+        "verify_problem": "{title} → {playlist} : {what}",
+        "verify_unreadable": "{seg} unreadable ({err})",
+        "verify_incomplete": "no #EXT-X-ENDLIST (unfinished playlist)",
+        "verify_empty": "no segments",
+        "verify_missing": "{seg} missing, empty or truncated",
+        "verify_corrupt": "{seg} unreadable headers ({err})",
+        "verify_too_long": "{count} segment(s) longer than SEG_DUR={max}s (first: {seg}, {dur}s)",
+        "verify_no_keyframe": "{count} segment(s) not starting on a keyframe (first: {seg})",
+        "verify_target": "#EXT-X-TARGETDURATION:{target} below the longest segment ({dur}s)",
+        "verify_done": "Verified {titles} title(s), {playlists} playlist(s) in {secs}s: {problems} problem(s).",
         "master_done": "Master → {path}",
         "done": "Done. Check 1080p/720p/480p folders and master.m3u8.",
         "error": "ERROR",
         "pending": "pending",
         "scanning": "scanning",
-        "ask_mode": "HLS mode?\n  1 = TS (.ts segments)\n  2 = fMP4 (.m4s segments)\nChoice: ",
-        "ask_mode_invalid": "Please type 1 (TS) or 2 (fMP4).",
+        "source_deleted": "Source deleted: {path}",
+        "source_delete_failed": "Could not delete source {path}: {err}",
+        "queue_summary": "{total} files · {running} running · {queued} queued · {done} done · {errors} failed · {hidden} not shown",
+        "sink_failed": "Progress sink {sink} disabled: {error}",
+        "ask_mode": "HLS mode?\n  1 = TS (.ts segments)\n  2 = fMP4 (.m4s segments)\n  3 = CMAF (one .mp4 per rendition, byte ranges)\nChoice: ",
+        "ask_mode_invalid": "Please type 1 (TS), 2 (fMP4) or 3 (CMAF).",
         "mode_name_ts": "TS",
         "mode_name_fmp4": "fMP4",
+        "mode_name_cmaf": "CMAF",
+        "config_unknown_key": "{path}: unknown setting {name}.",
+        "mode_required": "--watch, --headless and --coordinator need a mode: --mode ts|fmp4|cmaf or HLS_MODE in the config.",
+        "file_not_found": "File not found: {path}",
+        "ffmpeg_stalled": "{name} [{res}]: ffmpeg made no progress for {seconds} s → killed ({attempt}/{attempts}).",
+        "coord_or_worker": "--coordinator and --worker are mutually exclusive.",
+        "coord_listen": "Coordinator listening on {addr} (mode {mode}).",
+        "coord_job_done": "{name} [{part}] ← {worker}: exit {exit} → {state}",
+        "lease_expired": "{name}: lease of {worker} expired → job requeued.",
+        "lease_lost": "{name}: lease lost (expired on the coordinator) → job aborted.",
+        "worker_start": "Worker {worker} → {url}",
+        "coord_unreachable": "Coordinator {url} unreachable: {error}",
+        "staging_failed": "{name}: local staging copy failed ({error}) → reading the source directly.",
+        "watch_start": "Watching {path} (files queued after {settle}s without changes). Ctrl+C to stop.",
+        "watch_polling": "inotify unavailable → rescanning every {interval}s.",
+        "watch_stop": "Stopped. Interrupted conversions resume on the next start.",
     },
     "fr": {
         "app_title": "MKV → HLS NVENC",
@@ -78,21 +223,69 @@ TRANSLATIONS = {
         "col_status": "Statut",
         "no_mkv": "Aucun fichier .mkv trouvé.",
         "nvenc_missing": "NVENC (h264_nvenc) indisponible dans ta build FFmpeg. Installe une build avec NVENC (Gyan, BtbN, etc.).",
+        "encoder_missing": "Encodeur {encoder} indisponible (ou inutilisable) dans ta build FFmpeg.",
+        "encoder_backend": "Encodeur vidéo : {backend} ({encoder}).",
         "cuda_filters_on": "Filtres CUDA détectés → scale_cuda actif.",
         "cuda_filters_off": "Filtres CUDA absents → scale CPU, encodage NVENC (GPU) conservé.",
         "cuda_filters_required": "Filtres CUDA absents et SOFT_SCALE_IF_NEEDED=False.",
         "file_task": "Fichier",
         "fallback_cpu": "{name} → {res} : fallback en scale CPU.",
+        "fallback_per_rung": "{name} : échec du décodage unique, encodage résolution par résolution.",
+        "fallback_unchunked": "{name} : échec de l'encodage par morceaux, encodage d'un seul tenant.",
+        "reused_variant": "{name} → {res} : déjà terminé (mêmes réglages, même source), ignoré.",
+        "resume_variant": "{name} → {res} : reprise à {at} s.",
+        "ladder_plan": "{name} : échelle {plan}",
+        "rungs_skipped": "{name} → {res} : aucun encodeur utilisable pour ce codec (HEVC/AV1 exigent aussi fMP4/CMAF), ignorée(s).",
         "ok_variant": "{name} → {res} OK",
+        "audio_failed": "{name} → audio : échec de l'encodage, master non écrit.",
+        "publish_failed": "{name} → {res} : échec de la publication ({err}).",
+        "iframes_failed": "{name} → {res} : playlist I-frame non écrite ({err}).",
+        "side_outputs_failed": "{name} → vignettes / sous-titres : échec de l'extraction ({err}).",
+        "subtitles_failed": "{name} → sous-titres : non écrits ({err}).",
+        "dedup_hit": "{name} → contenu identique déjà converti avec ces réglages : sortie liée depuis le cache de déduplication.",
+        "dedup_corrupt": "Cache de déduplication : entrée de {name} non conforme ({file}), supprimée.",
+        "dedup_restore_failed": "{name} → cache de déduplication : sortie non restaurée ({err}), encodage.",
+        "dedup_check": "Cache de déduplication {path} : {ok} OK, {bad} abîmée(s) (supprimée(s)), {evicted} évincée(s).",
+        "complexity_failed": "{name} → analyse de complexité en échec ({err}), échelle par défaut conservée.",
+        "verify_problem": "{title} → {playlist} : {what}",
+        "verify_unreadable": "{seg} illisible ({err})",
+        "verify_incomplete": "pas de #EXT-X-ENDLIST (playlist inachevée)",
+        "verify_empty": "aucun segment",
+        "verify_missing": "{seg} absent, vide ou tronqué",
+        "verify_corrupt": "{seg} : en-têtes illisibles ({err})",
+        "verify_too_long": "{count} segment(s) plus long(s) que SEG_DUR={max} s (1ᵉʳ : {seg}, {dur} s)",
+        "verify_no_keyframe": "{count} segment(s) ne commençant pas par une keyframe (1ᵉʳ : {seg})",
+        "verify_target": "#EXT-X-TARGETDURATION:{target} inférieur au plus long segment ({dur} s)",
+        "verify_done": "{titles} titre(s), {playlists} playlist(s) vérifiés en {secs} s : {problems} problème(s).",
         "master_done": "Master → {path}",
         "done": "Terminé. Vérifie les dossiers 1080p/720p/480p et master.m3u8.",
         "error": "ERREUR",
         "pending": "en attente",
         "scanning": "scan",
-        "ask_mode": "Mode HLS ?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\nChoix : ",
-        "ask_mode_invalid": "Tape 1 (TS) ou 2 (fMP4).",
+        "source_deleted": "Source supprimée : {path}",
+        "source_delete_failed": "Impossible de supprimer la source {path} : {err}",
+        "queue_summary": "{total} fichiers · {running} en cours · {queued} en attente · {done} terminés · {errors} en erreur · {hidden} masqués",
+        "sink_failed": "Sortie de progression {sink} désactivée : {error}",
+        "ask_mode": "Mode HLS ?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\n  3 = CMAF (un .mp4 par résolution, plages d'octets)\nChoix : ",
+        "ask_mode_invalid": "Tape 1 (TS), 2 (fMP4) ou 3 (CMAF).",
         "mode_name_ts": "TS",
         "mode_name_fmp4": "fMP4",
+        "mode_name_cmaf": "CMAF",
+        "config_unknown_key": "{path} : réglage inconnu {name}.",
+        "mode_required": "--watch, --headless et --coordinator exigent un mode : --mode ts|fmp4|cmaf ou HLS_MODE dans la config.",
+        "file_not_found": "Fichier introuvable : {path}",
+        "ffmpeg_stalled": "{name} [{res}] : ffmpeg bloqué depuis {seconds} s → tué ({attempt}/{attempts}).",
+        "coord_or_worker": "--coordinator et --worker sont incompatibles.",
+        "coord_listen": "Coordinateur à l'écoute sur {addr} (mode {mode}).",
+        "coord_job_done": "{name} [{part}] ← {worker} : code {exit} → {state}",
+        "lease_expired": "{name} : bail de {worker} expiré → job remis en file.",
+        "lease_lost": "{name} : bail perdu (expiré côté coordinateur) → job abandonné.",
+        "worker_start": "Worker {worker} → {url}",
+        "coord_unreachable": "Coordinateur {url} injoignable : {error}",
+        "staging_failed": "{name} : copie locale impossible ({error}) → lecture directe de la source.",
+        "watch_start": "Surveillance de {path} (fichiers mis en file après {settle} s sans changement). Ctrl+C pour arrêter.",
+        "watch_polling": "inotify indisponible → rescan toutes les {interval} s.",
+        "watch_stop": "Arrêt. Les conversions interrompues reprendront au prochain lancement.",
     },
     "es": {
         "app_title": "MKV → HLS NVENC",
@@ -104,21 +297,69 @@ TRANSLATIONS = {
         "col_status": "Estado",
         "no_mkv": "No se encontraron archivos .mkv.",
         "nvenc_missing": "NVENC (h264_nvenc) no está disponible en tu FFmpeg. Instala una build con NVENC (Gyan, BtbN).",
+        "encoder_missing": "El codificador {encoder} no está disponible (o no es utilizable) en tu FFmpeg.",
+        "encoder_backend": "Codificador de vídeo: {backend} ({encoder}).",
         "cuda_filters_on": "Filtros CUDA detectados → scale_cuda activado.",
         "cuda_filters_off": "Sin filtros CUDA → escala CPU; el codificador NVENC (GPU) se mantiene.",
         "cuda_filters_required": "Faltan filtros CUDA y SOFT_SCALE_IF_NEEDED=False.",
         "file_task": "Archivo",
         "fallback_cpu": "{name} → {res} : cambio a escalado por CPU.",
+        "fallback_per_rung": "{name} : falló la decodificación única, codificando cada resolución por separado.",
+        "fallback_unchunked": "{name} : falló la codificación por fragmentos, codificando el archivo entero.",
+        "reused_variant": "{name} → {res} : ya completado (mismos ajustes y fuente), omitido.",
+        "resume_variant": "{name} → {res} : reanudando en {at} s.",
+        "ladder_plan": "{name} : escalera {plan}",
+        "rungs_skipped": "{name} → {res} : ningún codificador utilizable para este códec (HEVC/AV1 requieren además fMP4/CMAF), omitida(s).",
         "ok_variant": "{name} → {res} OK",
+        "audio_failed": "{name} → audio : falló la codificación, master no escrito.",
+        "publish_failed": "{name} → {res} : falló la publicación ({err}).",
+        "iframes_failed": "{name} → {res} : lista I-frame no escrita ({err}).",
+        "side_outputs_failed": "{name} → miniaturas / subtítulos : falló la extracción ({err}).",
+        "subtitles_failed": "{name} → subtítulos : no escritos ({err}).",
+        "dedup_hit": "{name} → mismo contenido ya convertido con estos ajustes: salida enlazada desde la caché de deduplicación.",
+        "dedup_corrupt": "Caché de deduplicación: la entrada de {name} no pasó la verificación ({file}), eliminada.",
+        "dedup_restore_failed": "{name} → caché de deduplicación: salida no restaurada ({err}), se codifica.",
+        "dedup_check": "Caché de deduplicación {path}: {ok} OK, {bad} dañada(s) (eliminada(s)), {evicted} desalojada(s).",
+        "complexity_failed": "{name} → análisis de complejidad fallido ({err}), se mantiene la escalera por defecto.",
+        "verify_problem": "{title} → {playlist} : {what}",
+        "verify_unreadable": "{seg} ilegible ({err})",
+        "verify_incomplete": "sin #EXT-X-ENDLIST (playlist sin terminar)",
+        "verify_empty": "ningún segmento",
+        "verify_missing": "{seg} ausente, vacío o truncado",
+        "verify_corrupt": "{seg}: cabeceras ilegibles ({err})",
+        "verify_too_long": "{count} segmento(s) más largo(s) que SEG_DUR={max} s (primero: {seg}, {dur} s)",
+        "verify_no_keyframe": "{count} segmento(s) que no empiezan con un keyframe (primero: {seg})",
+        "verify_target": "#EXT-X-TARGETDURATION:{target} menor que el segmento más largo ({dur} s)",
+        "verify_done": "{titles} título(s), {playlists} playlist(s) verificados en {secs} s: {problems} problema(s).",
         "master_done": "Master → {path}",
         "done": "Listo. Revisa las carpetas 1080p/720p/480p y master.m3u8.",
         "error": "ERROR",
         "pending": "pendiente",
         "scanning": "escaneando",
-        "ask_mode": "¿Modo HLS?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\nOpción: ",
-        "ask_mode_invalid": "Escribe 1 (TS) o 2 (fMP4).",
+        "source_deleted": "Fuente eliminada: {path}",
+        "source_delete_failed": "No se pudo eliminar la fuente {path}: {err}",
+        "queue_summary": "{total} archivos · {running} en curso · {queued} en cola · {done} terminados · {errors} con error · {hidden} ocultos",
+        "sink_failed": "Salida de progreso {sink} desactivada: {error}",
+        "ask_mode": "¿Modo HLS?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\n  3 = CMAF (un .mp4 por resolución, rangos de bytes)\nOpción: ",
+        "ask_mode_invalid": "Escribe 1 (TS), 2 (fMP4) o 3 (CMAF).",
         "mode_name_ts": "TS",
         "mode_name_fmp4": "fMP4",
+        "mode_name_cmaf": "CMAF",
+        "config_unknown_key": "{path}: ajuste desconocido {name}.",
+        "mode_required": "--watch, --headless y --coordinator necesitan un modo: --mode ts|fmp4|cmaf o HLS_MODE en la configuración.",
+        "file_not_found": "Archivo no encontrado: {path}",
+        "ffmpeg_stalled": "{name} [{res}]: ffmpeg sin avanzar durante {seconds} s → terminado ({attempt}/{attempts}).",
+        "coord_or_worker": "--coordinator y --worker son incompatibles.",
+        "coord_listen": "Coordinador escuchando en {addr} (modo {mode}).",
+        "coord_job_done": "{name} [{part}] ← {worker}: código {exit} → {state}",
+        "lease_expired": "{name}: concesión de {worker} caducada → trabajo reencolado.",
+        "lease_lost": "{name}: concesión perdida (caducada en el coordinador) → trabajo abortado.",
+        "worker_start": "Worker {worker} → {url}",
+        "coord_unreachable": "Coordinador {url} inaccesible: {error}",
+        "staging_failed": "{name}: copia local fallida ({error}) → lectura directa de la fuente.",
+        "watch_start": "Vigilando {path} (archivos en cola tras {settle} s sin cambios). Ctrl+C para detener.",
+        "watch_polling": "inotify no disponible → reescaneo cada {interval} s.",
+        "watch_stop": "Detenido. Las conversiones interrumpidas se reanudarán en el próximo inicio.",
     },
     "de": {
         "app_title": "MKV → HLS NVENC",
@@ -130,21 +371,69 @@ TRANSLATIONS = {
         "col_status": "Status",
         "no_mkv": "Keine .mkv-Dateien gefunden.",
         "nvenc_missing": "NVENC (h264_nvenc) ist in deiner FFmpeg-Build nicht verfügbar. Installiere eine Build mit NVENC (Gyan, BtbN).",
+        "encoder_missing": "Encoder {encoder} ist in deiner FFmpeg-Build nicht verfügbar (oder nicht nutzbar).",
+        "encoder_backend": "Video-Encoder: {backend} ({encoder}).",
         "cuda_filters_on": "CUDA-Filter erkannt → scale_cuda aktiv.",
         "cuda_filters_off": "CUDA-Filter fehlen → CPU-Scaling; NVENC (GPU) bleibt erhalten.",
         "cuda_filters_required": "CUDA-Filter fehlen und SOFT_SCALE_IF_NEEDED=False.",
         "file_task": "Datei",
         "fallback_cpu": "{name} → {res} : Fallback auf CPU-Skalierung.",
+        "fallback_per_rung": "{name} : Einmal-Dekodierung fehlgeschlagen, jede Auflösung wird einzeln kodiert.",
+        "fallback_unchunked": "{name} : Stückweise Kodierung fehlgeschlagen, Datei wird am Stück kodiert.",
+        "reused_variant": "{name} → {res} : bereits fertig (gleiche Einstellungen und Quelle), übersprungen.",
+        "resume_variant": "{name} → {res} : Fortsetzung bei {at} s.",
+        "ladder_plan": "{name} : Leiter {plan}",
+        "rungs_skipped": "{name} → {res} : kein nutzbarer Encoder für diesen Codec (HEVC/AV1 brauchen außerdem fMP4/CMAF), übersprungen.",
         "ok_variant": "{name} → {res} OK",
+        "audio_failed": "{name} → Audio : Kodierung fehlgeschlagen, Master nicht geschrieben.",
+        "publish_failed": "{name} → {res} : Veröffentlichung fehlgeschlagen ({err}).",
+        "iframes_failed": "{name} → {res} : I-Frame-Playlist nicht geschrieben ({err}).",
+        "side_outputs_failed": "{name} → Vorschaubilder / Untertitel : Extraktion fehlgeschlagen ({err}).",
+        "subtitles_failed": "{name} → Untertitel : nicht geschrieben ({err}).",
+        "dedup_hit": "{name} → gleicher Inhalt bereits mit diesen Einstellungen konvertiert: Ausgabe aus dem Dedup-Cache verlinkt.",
+        "dedup_corrupt": "Dedup-Cache: Eintrag für {name} fehlerhaft ({file}), entfernt.",
+        "dedup_restore_failed": "{name} → Dedup-Cache: Ausgabe nicht wiederhergestellt ({err}), wird kodiert.",
+        "dedup_check": "Dedup-Cache {path}: {ok} OK, {bad} beschädigt (entfernt), {evicted} verdrängt.",
+        "complexity_failed": "{name} → Komplexitätsanalyse fehlgeschlagen ({err}), Standard-Leiter beibehalten.",
+        "verify_problem": "{title} → {playlist} : {what}",
+        "verify_unreadable": "{seg} nicht lesbar ({err})",
+        "verify_incomplete": "kein #EXT-X-ENDLIST (unfertige Playlist)",
+        "verify_empty": "keine Segmente",
+        "verify_missing": "{seg} fehlt, ist leer oder abgeschnitten",
+        "verify_corrupt": "{seg}: Header nicht lesbar ({err})",
+        "verify_too_long": "{count} Segment(e) länger als SEG_DUR={max} s (erstes: {seg}, {dur} s)",
+        "verify_no_keyframe": "{count} Segment(e) beginnen nicht mit einem Keyframe (erstes: {seg})",
+        "verify_target": "#EXT-X-TARGETDURATION:{target} kleiner als das längste Segment ({dur} s)",
+        "verify_done": "{titles} Titel, {playlists} Playlist(s) in {secs} s geprüft: {problems} Problem(e).",
         "master_done": "Master → {path}",
         "done": "Fertig. Prüfe 1080p/720p/480p Ordner und master.m3u8.",
         "error": "FEHLER",
         "pending": "wartend",
         "scanning": "scan",
-        "ask_mode": "HLS-Modus?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\nAuswahl: ",
-        "ask_mode_invalid": "Bitte 1 (TS) oder 2 (fMP4) eingeben.",
+        "source_deleted": "Quelle gelöscht: {path}",
+        "source_delete_failed": "Quelle {path} konnte nicht gelöscht werden: {err}",
+        "queue_summary": "{total} Dateien · {running} laufend · {queued} wartend · {done} fertig · {errors} fehlgeschlagen · {hidden} ausgeblendet",
+        "sink_failed": "Fortschrittsausgabe {sink} deaktiviert: {error}",
+        "ask_mode": "HLS-Modus?\n  1 = TS (.ts)\n  2 = fMP4 (.m4s)\n  3 = CMAF (eine .mp4 pro Auflösung, Byte-Bereiche)\nAuswahl: ",
+        "ask_mode_invalid": "Bitte 1 (TS), 2 (fMP4) oder 3 (CMAF) eingeben.",
         "mode_name_ts": "TS",
         "mode_name_fmp4": "fMP4",
+        "mode_name_cmaf": "CMAF",
+        "config_unknown_key": "{path}: unbekannte Einstellung {name}.",
+        "mode_required": "--watch, --headless und --coordinator brauchen einen Modus: --mode ts|fmp4|cmaf oder HLS_MODE in der Konfiguration.",
+        "file_not_found": "Datei nicht gefunden: {path}",
+        "ffmpeg_stalled": "{name} [{res}]: ffmpeg seit {seconds} s ohne Fortschritt → beendet ({attempt}/{attempts}).",
+        "coord_or_worker": "--coordinator und --worker schließen sich aus.",
+        "coord_listen": "Koordinator lauscht auf {addr} (Modus {mode}).",
+        "coord_job_done": "{name} [{part}] ← {worker}: Code {exit} → {state}",
+        "lease_expired": "{name}: Lease von {worker} abgelaufen → Job neu eingereiht.",
+        "lease_lost": "{name}: Lease verloren (beim Koordinator abgelaufen) → Job abgebrochen.",
+        "worker_start": "Worker {worker} → {url}",
+        "coord_unreachable": "Koordinator {url} nicht erreichbar: {error}",
+        "staging_failed": "{name}: lokale Kopie fehlgeschlagen ({error}) → Quelle wird direkt gelesen.",
+        "watch_start": "Überwache {path} (Dateien nach {settle} s ohne Änderung eingereiht). Strg+C zum Beenden.",
+        "watch_polling": "inotify nicht verfügbar → erneuter Scan alle {interval} s.",
+        "watch_stop": "Beendet. Unterbrochene Konvertierungen werden beim nächsten Start fortgesetzt.",
     },
 }
 
@@ -183,18 +472,163 @@ def t(key: str, **kwargs) -> str:
 # ==========================
 # UI
 # ==========================
-console = Console(theme=Theme({
-    "ok": "bold green",
-    "warn": "yellow",
-    "err": "bold red",
-    "info": "cyan",
-    "title": "bold white",
-}))
+EXIT_OK = 0        # tous les fichiers / toutes les variantes OK
+EXIT_FAILED = 1    # au moins un fichier sans master (ou variante en échec, dans le détail par variante)
+EXIT_USAGE = 2     # arguments / config invalides (argparse)
+EXIT_PARTIAL = 3   # master écrit mais au moins une variante en échec
+EXIT_NO_INPUT = 4  # aucun .mkv trouvé
+EXIT_INTERRUPTED = 130
+
+@lru_cache(maxsize=1)
+def get_console():
+    from rich.console import Console
+    from rich.theme import Theme
+    return Console(theme=Theme({
+        "ok": "bold green",
+        "warn": "yellow",
+        "err": "bold red",
+        "info": "cyan",
+        "title": "bold white",
+    }))
+
+_json_lock = threading.Lock()
+
+def json_line(event: str, **fields):
+    # --headless : 1 objet JSON compact par ligne sur stdout (flush immédiat, lu par l'ordonnanceur)
+    line = json.dumps({"event": event, **fields}, ensure_ascii=False, separators=(",", ":"), default=str)
+    with _json_lock:
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+def _log(level: str, msg: str):
+    if HEADLESS:
+        json_line("log", level=level, msg=str(msg))
+    else:
+        get_console().print(f"[{level}] {msg}")
+
+def log_ok(msg): _log("ok", msg)
+def log_warn(msg): _log("warn", msg)
+def log_err(msg): _log("err", msg)
+def log_info(msg): _log("info", msg)
+
+# ==========================
+# MÉTRIQUES (JSON lines + textfile Prometheus)
+# ==========================
+PROM_PREFIX = "mkv_to_hls_"
+PROM_METRICS: Dict[str, Tuple[str, str]] = {
+    "stage_seconds_total": ("counter", "Wall-clock seconds spent per pipeline stage."),
+    "stage_runs_total": ("counter", "Pipeline stage runs by result."),
+    "fallbacks_total": ("counter", "Fallbacks (CPU scaling, per-rendition, unchunked)."),
+    "ffmpeg_runs_total": ("counter", "ffmpeg processes by stage and result."),
+    "media_seconds_total": ("counter", "Source seconds processed by ffmpeg."),
+    "frames_total": ("counter", "Frames output by ffmpeg."),
+    "dup_frames_total": ("counter", "Frames duplicated by ffmpeg."),
+    "drop_frames_total": ("counter", "Frames dropped by ffmpeg."),
+    "output_bytes_total": ("counter", "Bytes muxed by ffmpeg."),
+    "ffmpeg_speed": ("gauge", "Encoding speed (x real time) of the last finished ffmpeg per stage."),
+    "files_total": ("counter", "Files converted by result."),
+    "start_time_seconds": ("gauge", "Unix time the process started."),
+}
+
+_metrics_lock = threading.Lock()
+_metrics_ctx = threading.local()  # étiquettes de l'étape en cours (héritées par les stats ffmpeg du même thread)
+_prom_values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = {("start_time_seconds", ()): time.time()}
+
+def metrics_enabled() -> bool:
+    return bool(METRICS_EVENTS or METRICS_PROM)
+
+def emit(event: str, **fields):
+    if not METRICS_EVENTS:
+        return
+    record = {"ts": round(time.time(), 3), "event": event, **getattr(_metrics_ctx, "labels", {}), **fields}
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _metrics_lock, open(METRICS_EVENTS, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
 
-def log_ok(msg): console.print(f"[ok] {msg}")
-def log_warn(msg): console.print(f"[warn] {msg}")
-def log_err(msg): console.print(f"[err] {msg}")
-def log_info(msg): console.print(f"[info] {msg}")
+def prom_add(name: str, value: float, **labels):
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _metrics_lock:
+        _prom_values[key] = _prom_values.get(key, 0.0) + value
+
+def prom_set(name: str, value: float, **labels):
+    with _metrics_lock:
+        _prom_values[(name, tuple(sorted((k, str(v)) for k, v in labels.items())))] = value
+
+def write_prom():
+    # Réécrit en entier puis renommé : le collecteur ne lit jamais un fichier à moitié écrit
+    if not METRICS_PROM:
+        return
+    with _metrics_lock:
+        lines = []
+        for name, (kind, help_text) in PROM_METRICS.items():
+            samples = sorted((labels, v) for (n, labels), v in _prom_values.items() if n == name)
+            if not samples:
+                continue
+            lines += [f"# HELP {PROM_PREFIX}{name} {help_text}", f"# TYPE {PROM_PREFIX}{name} {kind}"]
+            for labels, value in samples:
+                label_str = ",".join(f'{k}="{v}"' for k, v in labels)
+                lines.append(f"{PROM_PREFIX}{name}{{{label_str}}} {value:g}" if labels else f"{PROM_PREFIX}{name} {value:g}")
+        tmp = Path(METRICS_PROM).with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, METRICS_PROM)
+
+@contextmanager
+def stage(name: str, **labels):
+    # Étape chronométrée : événement "stage" (durée, ok/error) + compteurs Prometheus par nom d'étape
+    # (le dict produit permet d'imposer le résultat quand l'échec ne passe pas par une exception)
+    outer = getattr(_metrics_ctx, "labels", {})
+    _metrics_ctx.labels = {**outer, **labels, "stage": name}
+    t0 = time.perf_counter()
+    outcome: Dict[str, str] = {}
+    result = "ok"
+    try:
+        yield outcome
+        result = outcome.get("result", "ok")
+    except BaseException:
+        result = "error"
+        raise
+    finally:
+        seconds = time.perf_counter() - t0
+        _metrics_ctx.labels = outer
+        if metrics_enabled():
+            emit("stage", **labels, stage=name, seconds=round(seconds, 3), result=result)
+            prom_add("stage_seconds_total", seconds, stage=name)
+            prom_add("stage_runs_total", 1, stage=name, result=result)
+            write_prom()
+
+def note_fallback(kind: str, **labels):
+    if metrics_enabled():
+        emit("fallback", kind=kind, **labels)
+        prom_add("fallbacks_total", 1, kind=kind)
+
+def ffmpeg_stats(raw: Dict[str, str]) -> Dict[str, Any]:
+    # Champs -progress → nombres (bitrate en kbit/s, speed en ×, out_time_ms qui est en µs → secondes)
+    stats: Dict[str, Any] = {}
+    for key, value in raw.items():
+        if key in ("progress", "out_time", "out_time_us"):
+            continue
+        value = value.strip().removesuffix("kbits/s").removesuffix("x")
+        if key == "out_time_ms":
+            key, value = "out_time", value if value == "N/A" else str(int(value) / 1_000_000)
+        try:
+            stats[key] = int(value)
+        except ValueError:
+            try:
+                stats[key] = float(value)
+            except ValueError:
+                stats[key] = None if value == "N/A" else value
+    return stats
+
+def record_ffmpeg(stats: Dict[str, Any], seconds: float, returncode: int):
+    stage_name = getattr(_metrics_ctx, "labels", {}).get("stage", "ffmpeg")
+    emit("ffmpeg", seconds=round(seconds, 3), returncode=returncode, **stats)
+    prom_add("ffmpeg_runs_total", 1, stage=stage_name, result="ok" if returncode == 0 else "error")
+    for field, metric in (("out_time", "media_seconds_total"), ("frame", "frames_total"), ("dup_frames", "dup_frames_total"),
+                          ("drop_frames", "drop_frames_total"), ("total_size", "output_bytes_total")):
+        if isinstance(stats.get(field), (int, float)):
+            prom_add(metric, stats[field], stage=stage_name)
+    if isinstance(stats.get("speed"), (int, float)):
+        prom_set("ffmpeg_speed", stats["speed"], stage=stage_name)
 
 # ==========================
 # FFPROBE & CHECKS
@@ -208,19 +642,67 @@ def ffprobe_json(path: Path) -> dict:
     out = run_check_output(args)
     return json.loads(out)
 
-def detect_nvenc_available() -> bool:
+def probe_keyframes(path: Path) -> List[float]:
+    # Index des keyframes de la 1ʳᵉ piste vidéo (lecture des paquets seulement, sans décodage)
+    args = ["ffprobe", "-v", "error", "-select_streams", "v:0", "-show_entries", "packet=pts_time,flags", "-of", "csv=p=0", str(input_path(path))]
+    keyframes: List[float] = []
+    for line in run_check_output(args).splitlines():
+        pts, _, flags = line.strip().partition(",")
+        if "K" in flags:
+            try:
+                keyframes.append(float(pts))
+            except ValueError:
+                pass
+    return sorted(keyframes)
+
+def _parse_ffmpeg_list(out: str) -> List[str]:
+    # "-encoders" / "-filters" : " V....D libx264   description" → "libx264"
+    names = []
+    for line in out.splitlines():
+        parts = line.split()
+        if len(parts) >= 2 and re.fullmatch(r"[A-Z.|]{3,6}", parts[0]) and parts[1] != "=":
+            names.append(parts[1])
+    return names
+
+@lru_cache(maxsize=1)
+def ffmpeg_capabilities() -> Dict[str, List[str]]:
+    # Une seule détection par process ; cache disque invalidé si le binaire ffmpeg change (chemin + mtime)
+    exe = shutil.which("ffmpeg") or "ffmpeg"
     try:
-        out = run_check_output(["ffmpeg", "-hide_banner", "-encoders"])
-        return "h264_nvenc" in out
-    except Exception:
-        return False
+        st = os.stat(exe)
+        key = f"{exe}|{st.st_mtime_ns}|{st.st_size}"
+    except OSError:
+        key = None
+    cache_file = Path(CACHE_DIR) / "ffmpeg_caps.json"
+    if key:
+        try:
+            cached = json.loads(cache_file.read_text(encoding="utf-8"))
+            if cached.get("key") == key:
+                return cached["caps"]
+        except Exception:
+            pass
+    caps: Dict[str, List[str]] = {}
+    for what in ("encoders", "filters"):
+        try:
+            caps[what] = _parse_ffmpeg_list(run_check_output(["ffmpeg", "-hide_banner", f"-{what}"]))
+        except Exception:
+            caps[what] = []
+    if key and (caps["encoders"] or caps["filters"]):
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = cache_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps({"key": key, "caps": caps}), encoding="utf-8")
+            os.replace(tmp, cache_file)
+        except OSError:
+            pass
+    return caps
+
+def detect_nvenc_available() -> bool:
+    return "h264_nvenc" in ffmpeg_capabilities()["encoders"]
 
 def detect_scale_cuda_available() -> bool:
-    try:
-        out = run_check_output(["ffmpeg", "-hide_banner", "-filters"])
-        return ("scale_cuda" in out) or ("scale_npp" in out)
-    except Exception:
-        return False
+    filters = ffmpeg_capabilities()["filters"]
+    return ("scale_cuda" in filters) or ("scale_npp" in filters)
 
 def get_video_fps_and_duration(info: dict) -> tuple[float, float]:
     streams = info.get("streams", [])
@@ -294,10 +776,28 @@ def _classify_fr_variant(lang_norm: str, title: str, handler: str) -> tuple[bool
     return True, 2  # VF générique
 
 def get_ordered_audio_map(info: dict) -> List[Tuple[int, str]]:
+    return _ordered_track_map(info, "audio")
+
+TEXT_SUBTITLE_CODECS = {"subrip", "srt", "ass", "ssa", "webvtt", "mov_text", "text"}  # convertibles en WebVTT (PGS/VobSub : images, ignorés)
+
+def get_ordered_subtitle_map(info: dict) -> List[Tuple[int, str]]:
+    # Même ordre que l'audio (FR prioritaire) ; pos = index parmi TOUS les sous-titres (0:s:pos), images comprises
+    return _ordered_track_map(info, "subtitle", keep=lambda s: s.get("codec_name") in TEXT_SUBTITLE_CODECS)
+
+def forced_subtitles(info: dict) -> set:
+    # pos des pistes forcées (disposition ou titre "forced") → FORCED=YES dans le master
+    subs = [s for s in info.get("streams", []) if s.get("codec_type") == "subtitle"]
+    return {pos for pos, s in enumerate(subs)
+            if (s.get("disposition") or {}).get("forced") or "forc" in _norm((s.get("tags") or {}).get("title") or "")}
+
+def _ordered_track_map(info: dict, codec_type: str, keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Tuple[int, str]]:
     audio_list: List[Dict[str, Any]] = []
     audio_pos = 0
     for s in info.get("streams", []):
-        if s.get("codec_type") != "audio":
+        if s.get("codec_type") != codec_type:
+            continue
+        if keep and not keep(s):
+            audio_pos += 1
             continue
         tags = s.get("tags", {}) or {}
         lang_raw = _norm(tags.get("language") or tags.get("LANGUAGE"))
@@ -324,10 +824,626 @@ def get_ordered_audio_map(info: dict) -> List[Tuple[int, str]]:
     audio_list.sort(key=lambda x: (0 if x["is_fr"] else 1, x["score"], x["orig"]))
     return [(a["pos"], a["lang"]) for a in audio_list]
 
+# ==========================
+# PROBE CACHE
+# ==========================
+_PROBE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path      TEXT PRIMARY KEY,
+    size      INTEGER NOT NULL,
+    mtime_ns  INTEGER NOT NULL,
+    head_hash TEXT,
+    info      TEXT NOT NULL,
+    fps       REAL,
+    duration  REAL,
+    audio_map TEXT,
+    keyframes TEXT,
+    complexity TEXT,
+    updated   REAL
+)"""
+_probe_db_lock = threading.Lock()
+
+@contextmanager
+def _probe_db():
+    # 1 connexion par appel (threads du scan) ; sérialisé côté process, WAL pour plusieurs process
+    with _probe_db_lock:
+        db_path = Path(CACHE_DIR) / "probe.sqlite"
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db_path), timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_PROBE_SCHEMA)
+            if "complexity" not in {col[1] for col in conn.execute("PRAGMA table_info(probes)")}:
+                conn.execute("ALTER TABLE probes ADD COLUMN complexity TEXT")  # base créée avant l'analyse de complexité
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+def _partial_hash(path: Path, size: int, block: int = 1 << 20) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(block))
+        if size > block:
+            f.seek(max(block, size - block))
+            h.update(f.read(block))
+    return h.hexdigest()
+
+def _source_key(path: Path) -> Tuple[str, int, int, Optional[str]]:
+    st = path.stat()
+    head = _partial_hash(path, st.st_size) if PROBE_CACHE_HASH else None
+    return str(path.resolve()), st.st_size, st.st_mtime_ns, head
+
+def _cached_row(conn, key: Tuple[str, int, int, Optional[str]]):
+    path, size, mtime_ns, head = key
+    row = conn.execute(
+        "SELECT info, fps, duration, audio_map, keyframes, head_hash FROM probes WHERE path=? AND size=? AND mtime_ns=?",
+        (path, size, mtime_ns),
+    ).fetchone()
+    if row is None or (head is not None and row[5] != head):
+        return None
+    return row
+
+def probe_source(path: Path) -> Dict[str, Any]:
+    # ffprobe + fps/durée + ordre audio, depuis le cache si le fichier n'a pas bougé
+    key = _source_key(path) if PROBE_CACHE else None
+    if key:
+        try:
+            with _probe_db() as conn:
+                row = _cached_row(conn, key)
+            if row:
+                info = json.loads(row[0])
+                return {
+                    "info": info,
+                    "fps": row[1],
+                    "duration": row[2],
+                    "audio_map": [tuple(a) for a in json.loads(row[3])],
+                    "subtitle_map": get_ordered_subtitle_map(info),
+                }
+        except sqlite3.Error:
+            pass
+    info = ffprobe_json(path)
+    fps, duration = get_video_fps_and_duration(info)
+    audio_map = get_ordered_audio_map(info)
+    if key:
+        try:
+            with _probe_db() as conn:
+                # Nouvelle entrée : index keyframes et complexité éventuels de l'ancienne version jetés
+                conn.execute(
+                    "INSERT OR REPLACE INTO probes (path, size, mtime_ns, head_hash, info, fps, duration, audio_map, keyframes, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                    (*key, json.dumps(info), fps, duration, json.dumps(audio_map), time.time()),
+                )
+        except sqlite3.Error:
+            pass
+    return {"info": info, "fps": fps, "duration": duration, "audio_map": audio_map, "subtitle_map": get_ordered_subtitle_map(info)}
+
+def get_keyframe_index(path: Path) -> List[float]:
+    # Index keyframes calculé à la 1ʳᵉ demande puis conservé avec le probe
+    key = _source_key(path) if PROBE_CACHE else None
+    row = None
+    if key:
+        try:
+            with _probe_db() as conn:
+                row = _cached_row(conn, key)
+            if row and row[4]:
+                return json.loads(row[4])
+        except sqlite3.Error:
+            pass
+    keyframes = probe_keyframes(path)
+    if key:
+        try:
+            if row is None:
+                probe_source(path)
+            with _probe_db() as conn:
+                conn.execute(
+                    "UPDATE probes SET keyframes=?, updated=? WHERE path=? AND size=? AND mtime_ns=?",
+                    (json.dumps(keyframes), time.time(), key[0], key[1], key[2]),
+                )
+        except sqlite3.Error:
+            pass
+    return keyframes
+
+def complexity_windows(duration: float) -> List[float]:
+    # Débuts des fenêtres d'analyse : milieux de COMPLEXITY_SAMPLES tranches égales (ni générique seul, ni noir final seul)
+    span = duration - COMPLEXITY_WINDOW
+    if span <= 0:
+        return [0.0]
+    return [span * (k + 0.5) / COMPLEXITY_SAMPLES for k in range(COMPLEXITY_SAMPLES)]
+
+def measure_complexity(src: Path, probe: Dict[str, Any]) -> Dict[str, Any]:
+    # Fenêtres décodées par seek d'entrée (à la keyframe qui précède : rien de décodé pour rien), ramenées à COMPLEXITY_SIZE,
+    # mises bout à bout et encodées en CRF sur un pipe
+    # → débit à qualité constante : peu pour un dessin animé, beaucoup pour du grain ou de l'action
+    starts = complexity_windows(probe["duration"])
+    w, h = COMPLEXITY_SIZE.split("x")
+    args = ["ffmpeg", "-hide_banner", "-nostdin", "-loglevel", "error"]
+    for start in starts:
+        args += ["-noaccurate_seek", "-ss", f"{start:.3f}", "-t", f"{COMPLEXITY_WINDOW:.3f}", "-i", str(input_path(src))]
+    graph = "".join(f"[{k}:v:0]setpts=PTS-STARTPTS,scale={w}:{h},setsar=1,format=yuv420p[c{k}];" for k in range(len(starts)))
+    graph += "".join(f"[c{k}]" for k in range(len(starts))) + f"concat=n={len(starts)}:v=1:a=0[cx]"
+    args += ["-filter_complex", graph, "-map", "[cx]", "-c:v", "libx264", "-preset", "veryfast",
+             "-crf", str(COMPLEXITY_CRF), "-f", "h264", "pipe:1"]
+    out = subprocess.run(args, check=True, capture_output=True).stdout
+    seconds = sum(min(COMPLEXITY_WINDOW, probe["duration"] - start) for start in starts)
+    if not out or seconds <= 0:
+        raise ValueError("empty analysis encode")
+    return {"kbps": round(len(out) * 8 / 1000 / seconds, 1), "seconds": round(seconds, 3)}
+
+def title_complexity(src: Path, probe: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    # Mesure faite à la 1ʳᵉ demande puis conservée avec le probe ; réglages d'analyse changés → remesurée
+    settings = settings_hash("complexity", COMPLEXITY_SAMPLES, COMPLEXITY_WINDOW, COMPLEXITY_SIZE, COMPLEXITY_CRF)
+    key = _source_key(src) if PROBE_CACHE else None
+    row = None
+    if key:
+        try:
+            with _probe_db() as conn:
+                row = _cached_row(conn, key)
+                cached = conn.execute("SELECT complexity FROM probes WHERE path=?", (key[0],)).fetchone() if row else None
+            entry = json.loads(cached[0]) if cached and cached[0] else None
+            if entry and entry.get("settings") == settings:
+                return entry
+        except (sqlite3.Error, ValueError):
+            pass
+    try:
+        with stage("complexity", job=src.stem):
+            entry = {"settings": settings, **measure_complexity(src, probe)}
+    except subprocess.CalledProcessError as e:
+        lines = (e.stderr or b"").decode(errors="replace").strip().splitlines()
+        log_warn(t("complexity_failed", name=src.stem, err=lines[-1] if lines else f"exit {e.returncode}"))
+        return None
+    except (OSError, ValueError) as e:
+        log_warn(t("complexity_failed", name=src.stem, err=e))
+        return None
+    if key:
+        try:
+            if row is None:
+                probe_source(src)
+            with _probe_db() as conn:
+                conn.execute(
+                    "UPDATE probes SET complexity=?, updated=? WHERE path=? AND size=? AND mtime_ns=?",
+                    (json.dumps(entry), time.time(), key[0], key[1], key[2]),
+                )
+        except sqlite3.Error:
+            pass
+    return entry
+
+# ==========================
+# STAGING (copie locale des sources)
+# ==========================
+# ffmpeg lit la copie locale si elle est prête (input_path) ; tout le reste (journal, cache, noms) garde le chemin d'origine.
+
+def try_lock(f) -> bool:
+    # Verrou exclusif non bloquant, rendu par l'OS à la mort du process (pas de sonde par PID : os.kill tue sous Windows)
+    try:
+        f.seek(0)
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        elif msvcrt is not None:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            return False
+        return True
+    except OSError:
+        return False
+
+class SourceStager:
+    def __init__(self, root: Path, max_bytes: int, ahead: int):
+        host = socket.gethostname()
+        root.mkdir(parents=True, exist_ok=True)
+        for lock in root.glob(f"{host}-*.lock"):  # restes d'un process mort (même machine) : verrou libre
+            try:
+                with open(lock, "r+b") as f:
+                    stale = try_lock(f)
+            except OSError:
+                continue
+            if stale:
+                shutil.rmtree(lock.with_suffix(""), ignore_errors=True)
+                lock.unlink(missing_ok=True)
+        self.root = root / f"{host}-{os.getpid()}"
+        # Verrou posé avant le répertoire : un autre process ne voit jamais ce répertoire sans verrou tenu
+        self.lock_file = open(root / f"{self.root.name}.lock", "a+b")
+        try_lock(self.lock_file)
+        self.root.mkdir(parents=True, exist_ok=True)
+        atexit.register(self._cleanup)
+        self.max_bytes = max_bytes
+        self.ahead = ahead
+        self.cond = threading.Condition()
+        self.entries: "OrderedDict[Path, Dict[str, Any]]" = OrderedDict()  # src → {"path", "size", "state", "pins"} (ordre LRU)
+        self.queue: List[Path] = []    # ordre d'encodage prévu
+        self.started: set = set()      # sources dont l'encodage a commencé
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="staging")  # 1 copie à la fois : NAS lu en séquentiel
+
+    def _cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        self.lock_file.close()
+        Path(self.lock_file.name).unlink(missing_ok=True)
+
+    def _used(self) -> int:
+        return sum(e["size"] for e in self.entries.values() if e["state"] in ("copying", "ready"))
+
+    def enqueue(self, paths: List[Path]):
+        with self.cond:
+            self.queue.extend(p for p in paths if p not in self.queue)
+        self._schedule()
+
+    def _schedule(self):
+        with self.cond:
+            upcoming = [p for p in self.queue if p not in self.started][:self.ahead]
+            for src in upcoming:
+                if src not in self.entries:
+                    self.entries[src] = {"path": None, "size": 0, "state": "queued", "pins": 0}
+                    self.pool.submit(self._copy, src)
+
+    def _evict_for(self, size: int) -> bool:
+        # LRU : copies non utilisées (restes d'échec, puis copies d'avance lointaines) jusqu'à faire de la place
+        upcoming = [p for p in self.queue if p not in self.started][:self.ahead]
+        for src, e in list(self.entries.items()):
+            if self._used() + size <= self.max_bytes:
+                break
+            if e["state"] == "ready" and e["pins"] == 0 and src not in upcoming:
+                self._drop(src)
+        return self._used() + size <= self.max_bytes
+
+    def _drop(self, src: Path):
+        e = self.entries.pop(src, None)
+        if e and e["path"] is not None:
+            Path(e["path"]).unlink(missing_ok=True)
+
+    def _copy(self, src: Path):
+        try:
+            size = src.stat().st_size
+        except OSError:
+            size = None
+        with self.cond:
+            e = self.entries.get(src)
+            if e is None or src in self.started or size is None or size > self.max_bytes:
+                self.entries.pop(src, None)  # déjà en cours d'encodage (lu directement) ou trop gros
+                return
+            while not self._evict_for(size):
+                self.cond.wait(5.0)  # place libérée quand un encodage se termine
+                if src in self.started:
+                    self.entries.pop(src, None)
+                    return
+            e.update(state="copying", size=size)
+        dst = self.root / f"{hashlib.sha1(str(src).encode()).hexdigest()[:16]}{src.suffix}"
+        tmp = dst.with_suffix(".part")
+        try:
+            with stage("stage_in", job=src.stem):
+                shutil.copyfile(src, tmp)
+                shutil.copystat(src, tmp)
+                os.replace(tmp, dst)
+            state = "ready"
+        except OSError as e_copy:
+            log_warn(t("staging_failed", name=src.name, error=e_copy))
+            tmp.unlink(missing_ok=True)
+            state = "failed"
+        with self.cond:
+            if state == "ready":
+                e.update(state=state, path=str(dst))
+            else:
+                self.entries.pop(src, None)
+            self.cond.notify_all()
+
+    def acquire(self, src: Path) -> Path:
+        # Début d'encodage : copie prête (ou en train de se faire) → utilisée ; sinon lecture directe, sans attendre
+        with self.cond:
+            self.started.add(src)
+            e = self.entries.get(src)
+            while e is not None and e["state"] == "copying":
+                self.cond.wait()
+                e = self.entries.get(src)
+            staged = src
+            if e is not None and e["state"] == "ready":
+                e["pins"] += 1
+                self.entries.move_to_end(src)
+                staged = Path(e["path"])
+        self._schedule()  # la suivante de la file part en copie
+        return staged
+
+    def release(self, src: Path, success: bool):
+        # Succès → copie supprimée ; échec → gardée (reprise) jusqu'à éviction LRU
+        with self.cond:
+            if src in self.queue:
+                self.queue.remove(src)
+            e = self.entries.get(src)
+            if e is not None and e["pins"] > 0:
+                e["pins"] -= 1
+                if success and e["pins"] == 0:
+                    self._drop(src)
+            self.started.discard(src)
+            self.cond.notify_all()
+
+    def staged(self, src: Path) -> Path:
+        with self.cond:
+            e = self.entries.get(src)
+            return Path(e["path"]) if e is not None and e["state"] == "ready" and e["pins"] > 0 else src
+
+@lru_cache(maxsize=1)
+def source_stager() -> Optional[SourceStager]:
+    return SourceStager(Path(STAGING_DIR), STAGING_MAX_BYTES, STAGING_AHEAD) if STAGING_DIR else None
+
+def input_path(src: Path) -> Path:
+    # Chemin lu par ffmpeg/ffprobe : copie locale si la source est en cours d'encodage depuis le staging
+    stager = source_stager()
+    return stager.staged(src) if stager else src
+
+# ==========================
+# LADDER (adapté à la source)
+# ==========================
+
+def _stream_kbps(stream: dict) -> Optional[int]:
+    # bit_rate du flux, sinon tag Matroska BPS (mkvmerge)
+    tags = stream.get("tags") or {}
+    for value in (stream.get("bit_rate"), tags.get("BPS"), tags.get("BPS-eng")):
+        try:
+            if value:
+                return int(value) // 1000
+        except ValueError:
+            pass
+    return None
+
+def audio_peak_kbps(info: dict, audio_map: List[Tuple[int, str]], audio_copy=frozenset()) -> int:
+    # Débit de la rendition audio la plus lourde (compté dans BANDWIDTH) : AAC encodé ici → AUDIO_BITRATE_K, piste copiée → débit sondé
+    audios = [st for st in info.get("streams", []) if st.get("codec_type") == "audio"]
+    return max([(_stream_kbps(audios[pos]) if pos in audio_copy else None) or AUDIO_BITRATE_K for pos, _lang in audio_map],
+               default=AUDIO_BITRATE_K)
+
+def _rung_size(rung: Tuple[str, str, str, int]) -> Tuple[int, int]:
+    w, h = rung[1].split(":")
+    return int(w), int(h)
+
+def keyframes_on_grid(keyframes: List[float], duration: float, fps: float) -> bool:
+    # Une keyframe source à chaque multiple de GOP_SECONDS → coupes identiques aux résolutions encodées
+    tol = 0.5 / max(fps, 1.0)
+    kfs = sorted(keyframes)
+    j = 0
+    t_grid = 0.0
+    while t_grid < duration - GOP_SECONDS / 2:
+        while j < len(kfs) and kfs[j] < t_grid - tol:
+            j += 1
+        if j == len(kfs) or kfs[j] > t_grid + tol:
+            return False
+        t_grid += GOP_SECONDS
+    return True
+
+def plan_ladder(src: Path, probe: Dict[str, Any], mode: Optional[str] = None) -> Dict[str, Any]:
+    # rungs : résolutions retenues (débits plafonnés) ; video_copy : résolution copiée ; audio_copy : pistes copiées (pos)
+    # backends : encodeur de chaque résolution (selon son codec) ; skipped : résolutions sans encodeur (ou HEVC/AV1 en TS)
+    # complexity : score de l'analyse (COMPLEXITY_ANALYSIS), None si non faite
+    info = probe["info"]
+    streams = info.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audios = [s for s in streams if s.get("codec_type") == "audio"]
+    src_w, src_h = int(video.get("width") or 0), int(video.get("height") or 0)
+    src_kbps = _stream_kbps(video)
+    if src_kbps is None:
+        try:
+            total = int(info.get("format", {}).get("bit_rate")) // 1000
+            src_kbps = total - sum(_stream_kbps(a) or AUDIO_BITRATE_K for a in audios) or None
+        except (TypeError, ValueError):
+            src_kbps = None
+    if src_kbps is not None and src_kbps <= 0:
+        src_kbps = None
+
+    codecs = {r[0]: rung_codec(r) for r in RESOLUTIONS}
+    backends = {name: codec_backend(codec) for name, codec in codecs.items()}
+    skipped = [name for name, codec in codecs.items() if backends[name] is None or (codec != "h264" and mode == "ts")]  # HEVC/AV1 : fMP4 seulement (pas de HEVC en MPEG-TS dans HLS)
+    rungs = [tuple(r[:4]) for r in RESOLUTIONS if r[0] not in skipped]
+    if LADDER_PRUNE and src_w and src_h:
+        # upscale = les 2 dimensions dépassent la source (5 % de marge : 1916×1076, 1920×800 gardent le 1080p)
+        fits = {r[0] for r in rungs if not (_rung_size(r)[0] > src_w * 1.05 and _rung_size(r)[1] > src_h * 1.05)}
+        for codec in {codecs[r[0]] for r in rungs}:
+            # au moins une résolution (la plus petite) par codec
+            group = [r for r in rungs if codecs[r[0]] == codec]
+            if not fits & {r[0] for r in group}:
+                fits.add(min(group, key=lambda r: _rung_size(r)[1])[0])
+        rungs = [r for r in rungs if r[0] in fits]
+
+    video_copy = None
+    h264 = [r for r in rungs if codecs[r[0]] == "h264"]
+    if VIDEO_PASSTHROUGH and src_kbps and h264:
+        top = max(h264, key=lambda r: _rung_size(r)[0] * _rung_size(r)[1])
+        if (video.get("codec_name") == "h264" and video.get("pix_fmt") == "yuv420p"
+                and _rung_size(top) == (src_w, src_h) and src_kbps <= top[3]
+                and keyframes_on_grid(get_keyframe_index(src), probe["duration"], probe["fps"])):
+            video_copy = top[0]
+
+    complexity = None
+    if COMPLEXITY_ANALYSIS and probe.get("duration"):
+        # Débits de RESOLUTIONS × score (borné) : contenu facile → moins de stockage et de sortie, contenu dur → plus de bits
+        measured = title_complexity(src, probe)
+        if measured:
+            complexity = measured["kbps"] / COMPLEXITY_REFERENCE_KBPS
+            factor = min(max(complexity, COMPLEXITY_FACTOR_RANGE[0]), COMPLEXITY_FACTOR_RANGE[1])
+            rungs = [r if r[0] == video_copy else (*r[:3], max(1, round(r[3] * factor))) for r in rungs]
+
+    if LADDER_CLAMP_BITRATE and src_kbps:
+        # pas plus de bits par pixel que la source : plafond = débit source × (surface résolution / surface source)
+        src_area = src_w * src_h or 1
+        rungs = [(n, sc, m, max(1, min(k, int(src_kbps * min(1.0, _rung_size((n, sc, m, k))[0] * _rung_size((n, sc, m, k))[1] / src_area)))))
+                 for n, sc, m, k in rungs]
+
+    if complexity is not None and COMPLEXITY_MIN_STEP_K:
+        # Palier trop proche du précédent (même codec, après ajustement et plafond) : un changement de résolution qui n'apporte rien
+        kept = set()
+        for codec in {codecs[r[0]] for r in rungs}:
+            last = None
+            for r in sorted((r for r in rungs if codecs[r[0]] == codec), key=lambda r: _rung_size(r)[0] * _rung_size(r)[1]):
+                if last is None or r[0] == video_copy or r[3] - last >= COMPLEXITY_MIN_STEP_K:
+                    kept.add(r[0])
+                    last = r[3]
+        rungs = [r for r in rungs if r[0] in kept]
+
+    audio_copy = {pos for pos, a in enumerate(audios)
+                  if AUDIO_PASSTHROUGH and a.get("codec_name") == "aac" and int(a.get("channels") or 0) == 2}
+    return {"rungs": rungs, "video_copy": video_copy, "audio_copy": audio_copy,
+            "backends": {r[0]: backends[r[0]] for r in rungs}, "codecs": {r[0]: codecs[r[0]] for r in rungs}, "skipped": skipped,
+            "complexity": complexity}
+
+def describe_plan(plan: Dict[str, Any]) -> Optional[str]:
+    # Résumé pour le log si le plan diffère de l'échelle par défaut (encodeur indiqué s'il n'est pas le backend principal)
+    main = resolve_backend()
+    if (plan["rungs"] == [tuple(r[:4]) for r in RESOLUTIONS] and not plan["video_copy"] and not plan["audio_copy"]
+            and all(b == main for b in plan["backends"].values())):
+        return None
+    parts = [" / ".join(f"{n} {k}k" + (" (copy)" if n == plan["video_copy"] else
+                                       f" ({ENCODER_BACKENDS[plan['backends'][n]]['encoder']})" if plan["backends"][n] != main else "")
+                        for n, _s, _m, k in plan["rungs"])]
+    if plan["audio_copy"]:
+        parts.append(f"audio copy: {len(plan['audio_copy'])}")
+    if plan.get("complexity") is not None:
+        parts.append(f"complexity {plan['complexity']:.2f}")
+    return ", ".join(parts)
+
 # ==========================
 # ENCODING
 # ==========================
 
+# Backends d'encodage vidéo : encodeur, presets, options fixes, upload/scale matériel, fin de chaîne après scale CPU
+ENCODER_BACKENDS: Dict[str, Dict[str, Any]] = {
+    "nvenc": {
+        "encoder": "h264_nvenc",
+        "codec": "h264",
+        "presets": {"fast": ["-preset", "p2"], "balanced": ["-preset", "p4", "-tune", "hq"], "quality": ["-preset", "p6", "-tune", "hq"]},
+        "args": ["-profile:v", "high", "-pix_fmt", "yuv420p"],
+        "hw_filters": ["scale_cuda", "scale_npp"],
+        "hw_upload": "hwupload_cuda",
+        "hw_scale": "scale_cuda={w}:{h}:interp_algo=lanczos",
+        "cpu_tail": "",
+    },
+    "qsv": {
+        "encoder": "h264_qsv",
+        "codec": "h264",
+        "presets": {"fast": ["-preset", "veryfast"], "balanced": ["-preset", "medium"], "quality": ["-preset", "slower"]},
+        "args": ["-profile:v", "high"],
+        "cpu_tail": ",format=nv12",
+    },
+    "vaapi": {
+        "encoder": "h264_vaapi",
+        "codec": "h264",
+        "presets": {"fast": ["-compression_level", "7"], "balanced": ["-compression_level", "4"], "quality": ["-compression_level", "1"]},
+        "args": ["-profile:v", "high"],
+        "input_args": ["-vaapi_device", VAAPI_DEVICE],
+        "hw_filters": ["scale_vaapi"],
+        "hw_upload": "format=nv12,hwupload",
+        "hw_scale": "scale_vaapi=w={w}:h={h}",
+        "cpu_tail": ",format=nv12,hwupload",
+    },
+    "x264": {
+        "encoder": "libx264",
+        "codec": "h264",
+        "presets": {"fast": ["-preset", "veryfast"], "balanced": ["-preset", "medium"], "quality": ["-preset", "slow"]},
+        "args": ["-profile:v", "high", "-pix_fmt", "yuv420p"],
+        "cpu_tail": "",
+    },
+    "x265": {
+        "encoder": "libx265",
+        "codec": "hevc",
+        "presets": {"fast": ["-preset", "veryfast"], "balanced": ["-preset", "medium"], "quality": ["-preset", "slow"]},
+        "args": ["-profile:v", "main", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"],
+        "cpu_tail": "",
+    },
+    "svtav1": {
+        "encoder": "libsvtav1",
+        "codec": "av1",
+        "presets": {"fast": ["-preset", "10"], "balanced": ["-preset", "8"], "quality": ["-preset", "5"]},
+        "args": ["-pix_fmt", "yuv420p"],
+        "cpu_tail": "",
+    },
+}
+# HEVC / AV1 sur le matériel du backend H.264 : mêmes filtres et upload, seul l'encodeur change
+ENCODER_BACKENDS.update({f"{family}_{codec}": {**ENCODER_BACKENDS[family], "encoder": encoder, "codec": codec, "args": args}
+                         for family, codec, encoder, args in [
+    ("nvenc", "hevc", "hevc_nvenc", ["-profile:v", "main", "-pix_fmt", "yuv420p", "-tag:v", "hvc1"]),
+    ("nvenc", "av1", "av1_nvenc", ["-pix_fmt", "yuv420p"]),
+    ("qsv", "hevc", "hevc_qsv", ["-profile:v", "main", "-tag:v", "hvc1"]),
+    ("qsv", "av1", "av1_qsv", []),
+    ("vaapi", "hevc", "hevc_vaapi", ["-profile:v", "main", "-tag:v", "hvc1"]),
+    ("vaapi", "av1", "av1_vaapi", []),
+]})
+VIDEO_CODECS = ("h264", "hevc", "av1")
+CPU_BACKENDS = {"h264": "x264", "hevc": "x265", "av1": "svtav1"}  # codec sans encodeur matériel de la même famille
+
+@lru_cache(maxsize=None)
+def backend_works(backend: str) -> bool:
+    # Présent dans la build ET utilisable (GPU/driver) : 1 image encodée vers null, une fois par process
+    conf = ENCODER_BACKENDS[backend]
+    if conf["encoder"] not in ffmpeg_capabilities()["encoders"]:
+        return False
+    if backend in CPU_BACKENDS.values():
+        return True
+    vf = "format=nv12" + (",hwupload" if backend_family(backend) == "vaapi" else "")
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", *conf.get("input_args", []),
+            "-f", "lavfi", "-i", "color=black:s=256x144:d=0.1", "-frames:v", "1", "-vf", vf,
+            "-c:v", conf["encoder"], "-f", "null", "-"]
+    try:
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=30, check=True)
+        return True
+    except Exception:
+        return False
+
+@lru_cache(maxsize=1)
+def resolve_backend() -> Optional[str]:
+    if VIDEO_BACKEND != "auto":
+        return VIDEO_BACKEND if VIDEO_BACKEND in ENCODER_BACKENDS and backend_works(VIDEO_BACKEND) else None
+    return next((b for b in BACKEND_AUTO_ORDER if backend_works(b)), None)
+
+def backend_family(backend: str) -> str:
+    # "nvenc_hevc" → "nvenc" : filtres, upload, slots et sessions GPU partagés avec le backend H.264
+    return backend.split("_")[0]
+
+@lru_cache(maxsize=None)
+def codec_backend(codec: str) -> Optional[str]:
+    # Encodeur d'un codec de l'échelle : backend principal s'il le produit, sinon même matériel, sinon CPU (x265, SVT-AV1)
+    main = resolve_backend()
+    if main and ENCODER_BACKENDS[main]["codec"] == codec:
+        return main
+    for backend in ([f"{backend_family(main)}_{codec}"] if main else []) + [CPU_BACKENDS[codec]]:
+        if backend in ENCODER_BACKENDS and backend_works(backend):
+            return backend
+    return None
+
+def rung_codec(rung: Tuple) -> str:
+    return rung[4] if len(rung) > 4 else ENCODER_BACKENDS[resolve_backend() or "x264"]["codec"]
+
+def rung_backend(plan: Optional[Dict[str, Any]], res_name: str) -> str:
+    # Encodeur d'une résolution retenu par plan_ladder (codec de la résolution), sinon le backend principal
+    return ((plan or {}).get("backends") or {}).get(res_name) or resolve_backend() or "x264"
+
+def backend_hw_scale_available(backend: str) -> bool:
+    filters = ffmpeg_capabilities()["filters"]
+    return any(f in filters for f in ENCODER_BACKENDS[backend].get("hw_filters", []))
+
+def video_codec_args(backend: Optional[str] = None) -> List[str]:
+    conf = ENCODER_BACKENDS[backend or resolve_backend() or "x264"]
+    presets = conf["presets"]
+    return ["-c:v", conf["encoder"], *presets.get(ENCODER_PRESET, presets["balanced"]), *conf["args"]]
+
+def video_gop_args(gop: int, backend: Optional[str] = None) -> List[str]:
+    # GOP fixe, pas de keyframe sur changement de scène → segments alignés entre résolutions
+    backend = backend or resolve_backend() or "x264"
+    args = ["-g", str(gop), "-keyint_min", str(gop)]
+    if backend == "x265":
+        return args + ["-x265-params", f"keyint={gop}:min-keyint={gop}:scenecut=0:open-gop=0"]
+    if backend == "svtav1":
+        return args + ["-svtav1-params", f"keyint={gop}:scd=0"]
+    if backend_family(backend) in ("nvenc", "x264"):
+        args += ["-sc_threshold", "0"]
+    return args
+
+def stream_specific(args: List[str], index: int) -> List[str]:
+    # "-profile:v high" / "-preset medium" → "-profile:v:<index> high" / "-preset:v:<index> medium"
+    return [f"{a.split(':')[0]}:v:{index}" if a.startswith("-") else a for a in args]
+
+def video_filter_chain(backend: Optional[str], w: str, h: str, hw: bool) -> Tuple[str, str]:
+    # (upload avant split, scale d'une résolution) — scale CPU : rien à uploader, retour sur le GPU après scale si besoin
+    conf = ENCODER_BACKENDS[backend or resolve_backend() or "x264"]
+    if hw and conf.get("hw_scale"):
+        return conf["hw_upload"], conf["hw_scale"].format(w=w, h=h)
+    return "", f"scale={w}:{h}:flags=lanczos{conf['cpu_tail']}"
+
 def build_ffmpeg_cmd(
     src: Path,
     out_playlist: Path,
@@ -336,30 +1452,48 @@ def build_ffmpeg_cmd(
     v_bitrate_k: int,
     gop: int,
     audio_map: List[Tuple[int, str]],
-    use_cuda_scale: bool,
+    use_hw_scale: bool,
     mode: str,  # "ts" | "fmp4"
+    backend: Optional[str] = None,
+    copy_video: bool = False,
+    audio_copy=frozenset(),
+    trickplay: Optional[Tuple[Path, Tuple[int, int]]] = None,  # (dossier, taille) : planches en 2ᵉ sortie
+    subtitles: Optional[List[Tuple[int, Path]]] = None,  # (pos, .vtt) : sous-titres texte extraits au passage
 ) -> List[str]:
     w, h = scale_str.split(":")
+    backend = backend or resolve_backend() or "x264"
     args = [
         "ffmpeg", "-hide_banner", "-y",
         "-nostats",
         "-progress", "pipe:1",
         "-loglevel", "error",
-        "-i", str(src),
-        "-c:v", "h264_nvenc",
-        "-preset", "p4", "-tune", "hq", "-profile:v", "high",
-        "-pix_fmt", "yuv420p",
-        "-b:v", f"{v_bitrate_k}k", "-maxrate", f"{v_bitrate_k}k", "-bufsize", f"{v_bitrate_k*2}k",
-        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
-        "-c:a", "aac", "-b:a", f"{AUDIO_BITRATE_K}k", "-ac", "2",
+        *ENCODER_BACKENDS[backend].get("input_args", []),
+        "-i", str(input_path(src)),
+        *ts_offset_args(mode),
     ]
-    if use_cuda_scale:
-        args += ["-vf", f"hwupload_cuda,scale_cuda={w}:{h}:interp_algo=lanczos"]
+    video_out = "0:v:0"
+    if copy_video:
+        args += ["-c:v", "copy"]
     else:
-        args += ["-vf", f"scale={w}:{h}:flags=lanczos"]
+        args += [
+            *video_codec_args(backend),
+            "-b:v", f"{v_bitrate_k}k", "-maxrate", f"{v_bitrate_k}k", "-bufsize", f"{v_bitrate_k*2}k",
+            *video_gop_args(gop, backend),
+        ]
+        upload, scale = video_filter_chain(backend, w, h, use_hw_scale)
+        chain = f"{upload},{scale}" if upload else scale
+        if trickplay:
+            # images décodées partagées : split avant l'upload / le scale de la résolution
+            args += ["-filter_complex", f"[0:v:0]split=2[vsrc][vtp];[vsrc]{chain}[vout];[vtp]{trickplay_filter(trickplay[1])}[thumbs]"]
+            video_out = "[vout]"
+        else:
+            args += ["-vf", chain]
+    if trickplay and copy_video:
+        args += ["-filter_complex", f"[0:v:0]{trickplay_filter(trickplay[1])}[thumbs]"]
+    args += audio_codec_args(audio_map, audio_copy)
 
     # map video + audios
-    args += ["-map", "0:v:0"]
+    args += ["-map", video_out]
     for pos, _lang in audio_map:
         args += ["-map", f"0:a:{pos}"]
 
@@ -371,20 +1505,47 @@ def build_ffmpeg_cmd(
     if audio_map:
         args += ["-disposition:a:0", "default"]
 
-    # HLS muxer
-    args += [
+    args += hls_muxer_args(out_segments_pattern, mode, progressive=True)
+    args += [str(out_playlist)]
+    if trickplay:
+        args += trickplay_output_args(trickplay[0], "[thumbs]")
+    if subtitles:
+        args += subtitle_output_args(subtitles)
+    return args
+
+def audio_codec_args(audio_map: List[Tuple[int, str]], audio_copy=frozenset(), repeat: int = 1) -> List[str]:
+    # Par piste de sortie (audio_map répété <repeat> fois) : copie si AAC stéréo, sinon AAC stéréo AUDIO_BITRATE_K
+    args: List[str] = []
+    for i in range(repeat):
+        for j, (pos, _lang) in enumerate(audio_map):
+            k = i * len(audio_map) + j
+            if pos in audio_copy:
+                args += [f"-c:a:{k}", "copy"]
+            else:
+                args += [f"-c:a:{k}", "aac", f"-b:a:{k}", f"{AUDIO_BITRATE_K}k", f"-ac:a:{k}", "2"]
+    return args
+
+def hls_muxer_args(out_segments_pattern: Path, mode: str, init_name: str = "init.mp4", progressive: bool = False) -> List[str]:
+    # progressive : playlist EVENT réécrite (tmp + rename) après chaque segment → reprise possible ; passée en VOD à la fin
+    args = [
         "-f", "hls",
         "-hls_time", str(SEG_DUR),
-        "-hls_playlist_type", "vod",
+        "-hls_playlist_type", "event" if progressive else "vod",
         "-hls_list_size", "0",
     ]
-
-    if mode == "fmp4":
+    if mode == "cmaf":
+        # 1 fichier par variante : init + fragments dans media.mp4, adressés par #EXT-X-MAP/#EXT-X-BYTERANGE
+        args += [
+            "-hls_flags", "independent_segments+split_by_time+single_file",
+            "-hls_segment_type", "fmp4",
+            "-hls_segment_filename", str(out_segments_pattern.parent / SINGLE_FILE_NAME),
+        ]
+    elif mode == "fmp4":
         # init.mp4 + segments à côté de la playlist (via cwd)
         args += [
             "-hls_flags", "independent_segments+split_by_time",
             "-hls_segment_type", "fmp4",
-            "-hls_fmp4_init_filename", "init.mp4",
+            "-hls_fmp4_init_filename", init_name,
             "-hls_segment_filename", str(out_segments_pattern).replace("%03d.ts", "%03d.m4s"),
         ]
     else:
@@ -392,142 +1553,2586 @@ def build_ffmpeg_cmd(
             "-hls_flags", "independent_segments",
             "-hls_segment_filename", str(out_segments_pattern),
         ]
+    return args
 
-    args += [str(out_playlist)]
+HLS_MODES = ("ts", "fmp4", "cmaf")
+SINGLE_FILE_NAME = "media.mp4"  # mode cmaf : même nom dans chaque dossier de variante (%v interdit 2x dans le chemin)
+
+def single_file(mode: str) -> bool:
+    # Un seul fichier par variante : pas de segments séparés à conserver (reprise) ni à recoudre (morceaux)
+    return mode == "cmaf"
+
+TS_TIMESTAMP_OFFSET = 1.0  # (s) TS : aucun DTS négatif (B-frames, priming AAC) → le muxer ne recale pas le 1ᵉʳ run, raccords à la frame près
+
+def ts_offset_args(mode: str, start: float = 0.0) -> List[str]:
+    # Même timeline pour tous les encodages TS (entier, morceau, reprise, audio partagé) : t_source + offset
+    return [] if mode != "ts" else ["-output_ts_offset", f"{start + TS_TIMESTAMP_OFFSET:.3f}"]
+
+LADDER_PLAYLIST = "index.m3u8"  # nom imposé par ffmpeg (%v interdit 2x) → renommé en <res>.m3u8 après succès
+
+def build_ffmpeg_ladder_cmd(
+    src: Path,
+    work_dir: Path,
+    rungs: List[Tuple[str, str, str, int]],
+    gop: int,
+    audio_map: List[Tuple[int, str]],
+    use_hw_scale: bool,
+    mode: str,  # "ts" | "fmp4"
+    shared_audio: bool = False,
+    window: Optional[Tuple[float, float]] = None,  # (début, durée) : morceau de la source (CHUNKED_ENCODE)
+    backend: Optional[str] = None,
+    plan: Optional[Dict[str, Any]] = None,  # plan_ladder : résolution / pistes audio copiées
+    trickplay: Optional[Tuple[Path, Tuple[int, int]]] = None,  # (dossier, taille) : planches en 2ᵉ sortie
+    subtitles: Optional[List[Tuple[int, Path]]] = None,  # (pos, .vtt) : sous-titres texte extraits au passage
+) -> List[str]:
+    # Un seul décodage : split → un scaler + un encodeur par résolution, un seul muxer HLS (%v = nom de la résolution)
+    # (résolution copiée : flux source mappé directement, hors du graphe)
+    # Codecs mêlés (H.264 + HEVC/AV1) : encodeur propre à chaque résolution ; encodeur CPU à côté d'un backend GPU → branche CPU
+    backend = backend or resolve_backend() or "x264"
+    copy_rung = plan["video_copy"] if plan else None
+    audio_copy = plan["audio_copy"] if plan else frozenset()
+    encoded = [i for i, r in enumerate(rungs) if r[0] != copy_rung]
+    backends = [rung_backend(plan, r[0]) if plan else backend for r in rungs]
+    graph = []
+    branches: Dict[str, List[int]] = {}  # upload → résolutions servies (une branche du split par chemin : GPU, CPU)
+    for i in encoded:
+        w, h = rungs[i][1].split(":")
+        upload, scale = video_filter_chain(backends[i], w, h, use_hw_scale)
+        branches.setdefault(upload, []).append(i)
+        graph.append(f"[s{i}]{scale}[v{i}]")
+    inputs = [f"[b{k}]" for k in range(len(branches))] + (["[vtp]"] if trickplay else [])
+    if len(inputs) > 1:
+        graph.insert(0, f"[0:v:0]split={len(inputs)}{''.join(inputs)}")
+    else:
+        inputs = ["[0:v:0]"]
+    for k, (upload, idx) in enumerate(branches.items()):
+        graph.insert(k + (len(inputs) > 1), f"{inputs[k]}{upload + ',' if upload else ''}split={len(idx)}{''.join(f'[s{i}]' for i in idx)}")
+    if trickplay:
+        # vignettes sur les mêmes images décodées (branche CPU séparée avant l'upload)
+        graph.append(f"{inputs[-1]}{trickplay_filter(trickplay[1])}[thumbs]")
+
+    args = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-nostats",
+        "-progress", "pipe:1",
+        "-loglevel", "error",
+        *ENCODER_BACKENDS[backend].get("input_args", []),
+    ]
+    if window:
+        # seek en entrée (précis en transcodage) ; TS : timestamps décalés ici, fMP4 : tfdt recalé à la recouture
+        start, length = window
+        args += ["-ss", f"{start:.3f}", "-i", str(input_path(src)), "-t", f"{length:.3f}"]
+    else:
+        start = 0.0
+        args += ["-i", str(input_path(src))]
+    args += ts_offset_args(mode, start)
+    if graph:
+        args += ["-filter_complex", ";".join(graph)]
+
+    # map : chaque variante = sa vidéo + toutes les pistes audio (ordre FR prioritaire)
+    # SHARED_AUDIO : variantes vidéo seules + 1 variante audio par piste (encodée une seule fois)
+    var_streams = []
+    a_out = 0
+    for i, (res_name, _s, _m, _k) in enumerate(rungs):
+        args += ["-map", "0:v:0" if res_name == copy_rung else f"[v{i}]"]
+        entry = [f"v:{i}"]
+        if not shared_audio:
+            for pos, _lang in audio_map:
+                args += ["-map", f"0:a:{pos}"]
+                entry.append(f"a:{a_out}")
+                a_out += 1
+        entry.append(f"name:{res_name}")
+        var_streams.append(",".join(entry))
+    if shared_audio:
+        for a_name, (pos, _lang) in zip(audio_rendition_names(audio_map), audio_map):
+            args += ["-map", f"0:a:{pos}"]
+            var_streams.append(f"a:{a_out},name:{a_name}")
+            a_out += 1
+
+    if copy_rung or len(set(backends)) > 1:
+        # options d'encodeur par sortie : -profile, -pix_fmt… refusés sur un flux copié, propres à chaque encodeur sinon
+        for i in encoded:
+            args += stream_specific([*video_codec_args(backends[i]), *video_gop_args(gop, backends[i])], i)
+        if copy_rung:
+            args += [f"-c:v:{[r[0] for r in rungs].index(copy_rung)}", "copy"]
+    else:
+        args += [*video_codec_args(backend), *video_gop_args(gop, backend)]
+    args += audio_codec_args(audio_map, audio_copy, repeat=1 if shared_audio else len(rungs))
+    for i, (_r, _s, _m, v_bitrate_k) in enumerate(rungs):
+        args += [
+            f"-b:v:{i}", f"{v_bitrate_k}k", f"-maxrate:v:{i}", f"{v_bitrate_k}k", f"-bufsize:v:{i}", f"{v_bitrate_k*2}k",
+        ]
+
+    # langues + 1ʳᵉ piste audio de chaque variante en default
+    for i in range(1 if shared_audio else len(rungs)):
+        for j, (_pos, lang) in enumerate(audio_map):
+            out_idx = i * len(audio_map) + j
+            args += [f"-metadata:s:a:{out_idx}", f"language={lang}"]
+        if audio_map:
+            args += [f"-disposition:a:{i * len(audio_map)}", "default"]
+
+    # %v n'est substitué dans le nom de l'init que s'il y a plusieurs variantes
+    args += hls_muxer_args(work_dir / "%v" / "%03d.ts", mode, init_name="init_%v.mp4" if len(var_streams) > 1 else "init.mp4",
+                           progressive=window is None)
+    args += ["-var_stream_map", " ".join(var_streams), str(work_dir / "%v" / LADDER_PLAYLIST)]
+    if trickplay:
+        args += trickplay_output_args(trickplay[0], "[thumbs]")
+    if subtitles:
+        args += subtitle_output_args(subtitles)
     return args
 
-def run_ffmpeg_with_progress(args: List[str], total_seconds: float, task_id, progress: Progress, cwd: Optional[Path] = None):
-    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, cwd=str(cwd) if cwd else None)
-    try:
-        assert proc.stdout is not None
-        for line in proc.stdout:
-            line = line.strip()
-            if not line:
-                continue
-            if line.startswith("out_time_ms="):
-                ms = int(line.split("=", 1)[1])
-                seconds = ms / 1_000_000.0
-                if total_seconds > 0:
-                    progress.update(task_id, completed=min(seconds, total_seconds))
-            elif line.startswith("speed="):
-                sp = line.split("=", 1)[1]
-                progress.update(task_id, description=f"[white]Encodage[/] @ {sp}")
-            elif line.startswith("progress=") and line.endswith("end"):
-                break
-    finally:
-        proc.wait()
-        if proc.returncode != 0:
-            raise subprocess.CalledProcessError(proc.returncode, args)
+def audio_rendition_names(audio_map: List[Tuple[int, str]]) -> List[str]:
+    # audio_fre, audio_eng, audio_fre_2… (dossier + playlist de chaque rendition audio partagée)
+    return rendition_names(audio_map, "audio")
 
-# ==========================
-# MASTER
-# ==========================
+def subtitle_rendition_names(subtitle_map: List[Tuple[int, str]]) -> List[str]:
+    return rendition_names(subtitle_map, "sub")
 
-def write_master(base_dir: Path, rendus: List[Tuple[str, str, int]]):
-    master_path = base_dir / "master.m3u8"
-    with master_path.open("w", encoding="utf-8") as f:
-        f.write("#EXTM3U\n")
-        for res_name, res_str, bitrate in rendus:
-            f.write(f"#EXT-X-STREAM-INF:BANDWIDTH={bitrate*1000},RESOLUTION={res_str}\n")
-            f.write(f"{res_name}/{res_name}.m3u8\n")
-    log_ok(t("master_done", path=master_path))
+def rendition_names(track_map: List[Tuple[int, str]], prefix: str) -> List[str]:
+    names: List[str] = []
+    for _pos, lang in track_map:
+        base = f"{prefix}_{lang}"
+        name, k = base, 2
+        while name in names:
+            name, k = f"{base}_{k}", k + 1
+        names.append(name)
+    return names
 
-# ==========================
-# RENDER (UI)
-# ==========================
+def build_ffmpeg_audio_cmd(
+    src: Path,
+    work_dir: Path,
+    audio_map: List[Tuple[int, str]],
+    mode: str,  # "ts" | "fmp4"
+    audio_copy=frozenset(),
+) -> List[str]:
+    # Renditions audio partagées (encodage par résolution) : toutes les pistes en un seul ffmpeg
+    args = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-nostats",
+        "-progress", "pipe:1",
+        "-loglevel", "error",
+        "-i", str(input_path(src)),
+        *ts_offset_args(mode),
+    ]
+    var_streams = []
+    for out_idx, (a_name, (pos, lang)) in enumerate(zip(audio_rendition_names(audio_map), audio_map)):
+        args += ["-map", f"0:a:{pos}", f"-metadata:s:a:{out_idx}", f"language={lang}"]
+        var_streams.append(f"a:{out_idx},name:{a_name}")
+    args += [*audio_codec_args(audio_map, audio_copy), "-disposition:a:0", "default"]
+    # %v n'est substitué dans le nom de l'init que s'il y a plusieurs variantes
+    args += hls_muxer_args(work_dir / "%v" / "%03d.ts", mode, init_name="init_%v.mp4" if len(var_streams) > 1 else "init.mp4",
+                           progressive=True)
+    args += ["-var_stream_map", " ".join(var_streams), str(work_dir / "%v" / LADDER_PLAYLIST)]
+    return args
 
-def build_files_table(file_states: List[Dict]) -> Table:
-    table = Table(title=t("files_title"), box=box.SIMPLE_HEAVY)
-    table.add_column(t("col_num"), justify="right", style="bold")
-    table.add_column(t("col_file"), overflow="fold")
-    table.add_column(t("col_dur"))
-    table.add_column(t("col_langs"))
-    table.add_column(t("col_status"), justify="center")
-    for st in file_states:
-        dur = f"{st['duration']:.1f}s" if st["duration"] else "-"
-        langs = ", ".join(st["langs"]) if st["langs"] else "–"
-        table.add_row(
-            str(st["idx"]),
-            st["name"],
-            dur,
-            langs,
-            st["status"],
-        )
-    return table
+def finalize_playlist(src: Path, dst: Optional[Path] = None):
+    # EVENT terminée → VOD (atomique) ; dst : renommage index.m3u8 → <nom>.m3u8 au passage
+    dst = dst or src
+    text = src.read_text(encoding="utf-8").replace("#EXT-X-PLAYLIST-TYPE:EVENT", "#EXT-X-PLAYLIST-TYPE:VOD")
+    tmp = dst.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, dst)
+    if src != dst:
+        src.unlink()
 
-def build_layout(files_table: Table, progress: Progress) -> Group:
-    return Group(
-        Panel(files_table, title="Files", border_style="title"),
-        Panel(progress, title="Progress", border_style="title"),
-    )
+def mirror_playlist(variant_dir: Path, name: str):
+    # PROGRESSIVE : index.m3u8 en cours (EVENT, nom imposé en sortie multi-variantes) recopiée en <nom>.m3u8, l'URI du master
+    src, dst = variant_dir / LADDER_PLAYLIST, variant_dir / f"{name}.m3u8"
+    try:
+        if dst.exists() and dst.stat().st_mtime_ns >= src.stat().st_mtime_ns:
+            return
+        text = src.read_text(encoding="utf-8")
+    except OSError:
+        return
+    tmp = dst.with_suffix(".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, dst)
 
 # ==========================
-# MAIN PIPELINE
+# SUPERVISEUR FFMPEG (asyncio)
 # ==========================
+# Une boucle asyncio (thread dédié) porte tous les ffmpeg : stdout (-progress) et stderr lus séparément sans bloquer,
+# chien de garde anti-blocage par process. Les threads d'encodage attendent via run_ffmpeg_with_progress (façade bloquante).
+STDERR_TAIL = 20  # dernières lignes de stderr gardées pour le message d'erreur
 
-def convert_one_file(src: Path, out_root: Path, progress: Progress, file_states: List[Dict], state_idx: int, mode: str):
-    info = ffprobe_json(src)
-    fps, duration = get_video_fps_and_duration(info)
+class JobAborted(Exception):
+    # ffmpeg tués par supervisor().abort() (--worker : bail perdu) : le job n'est plus à nous, aucun repli ne doit toucher la sortie
+    pass
 
-    audio_map = get_ordered_audio_map(info)
-    audio_langs_ordered = [lang for (_pos, lang) in audio_map]
+class FfmpegJob:
+    def __init__(self, args: List[str], cwd: Optional[Path]):
+        self.args = args
+        self.cwd = cwd
+        self.lock = threading.Lock()
+        self.raw: Dict[str, str] = {}  # dernier bloc -progress complet
+        self.blocks = 0                # nombre de blocs reçus (détection des nouveautés à chaque tick)
+        self.stderr: deque = deque(maxlen=STDERR_TAIL)
+        self.marker: Tuple = ()
+        self.last_advance = time.monotonic()
+        self.stalled = False
+        self.returncode: Optional[int] = None
+        self.done = threading.Event()
 
-    gop = max(1, int(round(fps * GOP_SECONDS)))
+class FfmpegSupervisor:
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.procs: set = set()
+        self.aborted = threading.Event()  # abort() : tout ffmpeg en cours tué, les suivants échouent aussitôt
+        threading.Thread(target=self.loop.run_forever, name="ffmpeg-supervisor", daemon=True).start()
 
-    file_states[state_idx]["duration"] = duration
-    file_states[state_idx]["langs"] = audio_langs_ordered
-    file_states[state_idx]["status"] = t("pending")
+    def abort(self):
+        self.aborted.set()
+        self.loop.call_soon_threadsafe(lambda: [proc.kill() for proc in list(self.procs) if proc.returncode is None])
 
-    base_name = src.stem
-    work_dir = out_root / base_name
-    work_dir.mkdir(exist_ok=True)
-    for r, _, _, _ in RESOLUTIONS:
-        (work_dir / r).mkdir(exist_ok=True)
+    def resume(self):
+        self.aborted.clear()
 
-    # Checks GPU
-    nvenc = detect_nvenc_available()
-    cuda_scale = detect_scale_cuda_available()
-    if not nvenc:
-        raise RuntimeError(t("nvenc_missing"))
-    if cuda_scale:
-        log_info(t("cuda_filters_on"))
-    else:
-        if SOFT_SCALE_IF_NEEDED:
-            log_warn(t("cuda_filters_off"))
-        else:
-            raise RuntimeError(t("cuda_filters_required"))
+    def start(self, args: List[str], cwd: Optional[Path] = None) -> FfmpegJob:
+        job = FfmpegJob(args, cwd)
+        asyncio.run_coroutine_threadsafe(self._run(job), self.loop)
+        return job
 
-    # Task globale
-    total_for_all_res = duration * len(RESOLUTIONS)
-    task_overall = progress.add_task(f"[white]{t('file_task')}[/] {base_name}", total=total_for_all_res)
+    async def _run(self, job: FfmpegJob):
+        proc = None
+        try:
+            if self.aborted.is_set():
+                raise RuntimeError("aborted")
+            proc = await asyncio.create_subprocess_exec(*job.args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+                                                        cwd=str(job.cwd) if job.cwd else None)
+            self.procs.add(proc)
+            watchdog = asyncio.ensure_future(self._watch(job, proc))
+            readers = asyncio.ensure_future(asyncio.gather(self._read_progress(job, proc.stdout), self._read_stderr(job, proc.stderr)))
+            try:
+                while proc.returncode is None and not readers.done():
+                    await asyncio.wait({readers}, timeout=0.5)
+                if not readers.done():
+                    # Process terminé (ou tué) mais pipes encore ouverts par un descendant : fin de lecture bornée
+                    await asyncio.wait({readers}, timeout=2.0)
+                    readers.cancel()
+                    await asyncio.gather(readers, return_exceptions=True)
+                job.returncode = proc.returncode if proc.returncode is not None else await proc.wait()
+            finally:
+                watchdog.cancel()
+        except Exception as e:  # ffmpeg introuvable, cwd absent…
+            job.stderr.append(str(e))
+            job.returncode = job.returncode if job.returncode is not None else -1
+        finally:
+            self.procs.discard(proc)
+            job.done.set()
 
-    ok_rendus: List[Tuple[str, str, int]] = []  # (res_name, res_master, bitrate)
+    async def _read_progress(self, job: FfmpegJob, stream: asyncio.StreamReader):
+        block: Dict[str, str] = {}
+        async for raw_line in stream:
+            key, sep, value = raw_line.decode("utf-8", "replace").strip().partition("=")
+            if not sep:
+                continue
+            block[key] = value
+            if key == "progress":
+                marker = (block.get("out_time_ms"), block.get("frame"), block.get("total_size"))
+                with job.lock:
+                    job.raw, job.blocks = block, job.blocks + 1
+                    if marker != job.marker:
+                        job.marker, job.last_advance = marker, time.monotonic()
+                block = {}
 
-    # Encode par résolution
-    for res_name, scale_str, res_master, v_kbps in RESOLUTIONS:
-        playlist_out = work_dir / res_name / f"{res_name}.m3u8"
-        segments_out = work_dir / res_name / "%03d.ts"  # remplacé en .m4s si mode=fmp4
+    async def _read_stderr(self, job: FfmpegJob, stream: asyncio.StreamReader):
+        async for raw_line in stream:
+            line = raw_line.decode("utf-8", "replace").rstrip()
+            if line:
+                job.stderr.append(line)
 
-        args = build_ffmpeg_cmd(
-            src=src,
-            out_playlist=playlist_out,
-            out_segments_pattern=segments_out,
-            scale_str=scale_str,
-            v_bitrate_k=v_kbps,
+    async def _watch(self, job: FfmpegJob, proc):
+        while FFMPEG_STALL_TIMEOUT > 0:
+            await asyncio.sleep(min(5.0, FFMPEG_STALL_TIMEOUT / 4))
+            if time.monotonic() - job.last_advance > FFMPEG_STALL_TIMEOUT:
+                job.stalled = True
+                proc.kill()
+                return
+
+@lru_cache(maxsize=1)
+def supervisor() -> FfmpegSupervisor:
+    return FfmpegSupervisor()
+
+def run_ffmpeg_with_progress(args: List[str], total_seconds: float, task_id, progress: Progress, cwd: Optional[Path] = None,
+                             labels: Optional[List[str]] = None, on_tick: Optional[Callable[[], None]] = None):
+    # task_id : une tâche ou une liste (ladder en décodage unique → même avancement pour chaque résolution)
+    # Bloque jusqu'à la fin du ffmpeg ; barres / on_tick / métriques au plus PROGRESS_TICK_HZ fois par seconde
+    task_ids = list(task_id) if isinstance(task_id, (list, tuple)) else [task_id]
+    labels = labels or ["Encodage"] * len(task_ids)
+    attempts = 1 + max(0, FFMPEG_STALL_RETRIES)
+    for attempt in range(1, attempts + 1):
+        job = supervisor().start(args, cwd)
+        t0 = time.perf_counter()
+        seen = 0
+        finished = False
+        while not finished:
+            finished = job.done.wait(1.0 / PROGRESS_TICK_HZ)
+            with job.lock:
+                raw, blocks = job.raw, job.blocks
+            if blocks == seen:
+                continue
+            seen = blocks
+            try:
+                seconds = int(raw.get("out_time_ms", "")) / 1_000_000.0
+            except ValueError:  # "N/A" en tout début d'encodage
+                seconds = None
+            if seconds is not None and total_seconds > 0:
+                for tid in task_ids:
+                    progress.update(tid, completed=min(seconds, total_seconds))
+            if "speed" in raw:
+                for tid, label in zip(task_ids, labels):
+                    progress.update(tid, description=f"[white]{label}[/] @ {raw['speed'].strip()}")
+            if raw.get("progress") == "continue" and on_tick and not supervisor().aborted.is_set():
+                on_tick()
+            progress.stats(task_ids, ffmpeg_stats(raw), key=id(job))
+        if metrics_enabled():
+            record_ffmpeg(ffmpeg_stats(job.raw), time.perf_counter() - t0, job.returncode)
+        if supervisor().aborted.is_set():
+            raise JobAborted(" ".join(args[:1] + labels))
+        if job.stalled:
+            ctx = getattr(_metrics_ctx, "labels", {})
+            log_warn(t("ffmpeg_stalled", name=ctx.get("job", "ffmpeg"), res=ctx.get("rung", "/".join(labels)),
+                       seconds=int(FFMPEG_STALL_TIMEOUT), attempt=attempt, attempts=attempts))
+            note_fallback("stall_retry" if attempt < attempts else "stall")
+            if attempt < attempts:
+                continue
+        if job.returncode != 0:
+            raise subprocess.CalledProcessError(job.returncode, args, stderr="\n".join(job.stderr))
+        return ffmpeg_stats(job.raw)
+
+def encode_ladder_single_pass(
+    src: Path,
+    work_dir: Path,
+    rungs: List[Tuple[str, str, str, int]],
+    gop: int,
+    audio_map: List[Tuple[int, str]],
+    use_hw_scale: bool,
+    mode: str,
+    duration: float,
+    task_ids: List,
+    progress: Progress,
+    base_name: str,
+    shared_audio: bool = False,
+    on_tick: Optional[Callable[[], None]] = None,
+    plan: Optional[Dict[str, Any]] = None,
+    trickplay: Optional[Tuple[Path, Tuple[int, int]]] = None,
+    subtitles: Optional[List[Tuple[int, Path]]] = None,
+    on_restart: Optional[Callable[[], None]] = None,
+) -> bool:
+    # on_restart : appelé avant de relancer la passe (playlists réécrites depuis le segment 0)
+    labels = [res_name for res_name, _, _, _ in rungs]
+    variants = labels + (audio_rendition_names(audio_map) if shared_audio else [])
+    attempts = [use_hw_scale]
+    if use_hw_scale and SOFT_SCALE_IF_NEEDED:
+        attempts.append(False)
+    for hw in attempts:
+        if not hw and use_hw_scale:
+            log_warn(t("fallback_cpu", name=base_name, res="/".join(labels)))
+            note_fallback("cpu_scale", job=base_name, rung="/".join(labels))
+            if on_restart:
+                on_restart()
+        if trickplay:
+            shutil.rmtree(trickplay[0], ignore_errors=True)
+            trickplay[0].mkdir(parents=True)
+        args = build_ffmpeg_ladder_cmd(src, work_dir, rungs, gop, audio_map, hw, mode, shared_audio=shared_audio, plan=plan,
+                                       trickplay=trickplay, subtitles=subtitles)
+        try:
+            with ladder_slots(ladder_backends(rungs, plan), hw), stage("encode_ladder", job=base_name, rung="/".join(labels), hw_scale=hw):
+                run_ffmpeg_with_progress(args, total_seconds=duration, task_id=task_ids, progress=progress, cwd=work_dir, labels=labels,
+                                         on_tick=on_tick)
+        except subprocess.CalledProcessError as e:
+            if hw == attempts[-1]:
+                log_err(f"{base_name} [{'/'.join(labels)}]: {e}")
+            continue
+        # index.m3u8 → <res>.m3u8 (même arborescence que l'encodage par résolution)
+        for name in variants:
+            finalize_playlist(work_dir / name / LADDER_PLAYLIST, work_dir / name / f"{name}.m3u8")
+        return True
+    for name in variants:
+        (work_dir / name / LADDER_PLAYLIST).unlink(missing_ok=True)
+    return False
+
+# ==========================
+# CHUNKS (découpe / recouture)
+# ==========================
+
+def plan_chunks(duration: float, keyframes: List[float], fps: float = 25.0) -> List[Tuple[float, float]]:
+    # Bornes sur la grille GOP (segments pleins à chaque raccord), de préférence sur une keyframe source (seek sans pré-décodage)
+    grid = max(GOP_SECONDS, float(SEG_DUR))
+    step = max(1, int(round(CHUNK_SECONDS / grid))) * grid
+    bounds = [0.0]
+    target = step
+    while target < duration - grid / 2:
+        candidates = [target + k * grid for k in (0, 1, -1, 2, -2) if bounds[-1] < target + k * grid < duration - grid / 2]
+        pick = target
+        for c in candidates:
+            if any(abs(kf - c) < 0.5 / fps for kf in keyframes):
+                pick = c
+                break
+        bounds.append(pick)
+        target = pick + step
+    bounds.append(duration)
+    return [(a, b - a) for a, b in zip(bounds, bounds[1:])]
+
+def iter_boxes(data, start: int = 0, end: Optional[int] = None):
+    # Boîtes ISO-BMFF : (type, début, début du contenu, fin)
+    end = len(data) if end is None else end
+    i = start
+    while i + 8 <= end:
+        size = int.from_bytes(data[i:i + 4], "big")
+        hdr = 8
+        if size == 1:
+            size = int.from_bytes(data[i + 8:i + 16], "big")
+            hdr = 16
+        elif size == 0:
+            size = end - i
+        if size < hdr:
+            return
+        yield bytes(data[i + 4:i + 8]), i, i + hdr, i + size
+        i += size
+
+def find_box(data, path: List[bytes], start: int = 0, end: Optional[int] = None):
+    for typ, b, c, e in iter_boxes(data, start, end):
+        if typ == path[0]:
+            if len(path) == 1:
+                yield typ, b, c, e
+            else:
+                yield from find_box(data, path[1:], c, e)
+
+def mp4_timescales(init: bytes) -> Dict[int, int]:
+    # track_ID → timescale (moov/trak/tkhd + mdia/mdhd)
+    scales: Dict[int, int] = {}
+    for _t, _b, c, e in find_box(init, [b"moov", b"trak"]):
+        tk = next(find_box(init, [b"tkhd"], c, e), None)
+        md = next(find_box(init, [b"mdia", b"mdhd"], c, e), None)
+        if not tk or not md:
+            continue
+        tk_id = int.from_bytes(init[tk[2] + (20 if init[tk[2]] == 1 else 12):][:4], "big")
+        ts_off = md[2] + (20 if init[md[2]] == 1 else 12)
+        scales[tk_id] = int.from_bytes(init[ts_off:ts_off + 4], "big")
+    return scales
+
+def shift_fmp4_segment(path: Path, offset_s: float, timescales: Dict[int, int]):
+    # Décale baseMediaDecodeTime (moof/traf/tfdt) : un morceau reprend là où le précédent s'arrête
+    data = bytearray(path.read_bytes())
+    for _t, _b, c, e in find_box(data, [b"moof", b"traf"]):
+        tfhd = next(find_box(data, [b"tfhd"], c, e), None)
+        tfdt = next(find_box(data, [b"tfdt"], c, e), None)
+        if not tfhd or not tfdt:
+            continue
+        track_id = int.from_bytes(data[tfhd[2] + 4:tfhd[2] + 8], "big")
+        delta = int(round(offset_s * timescales.get(track_id, 90000)))
+        width = 8 if data[tfdt[2]] == 1 else 4
+        pos = tfdt[2] + 4
+        value = int.from_bytes(data[pos:pos + width], "big") + delta
+        data[pos:pos + width] = value.to_bytes(width, "big")
+    path.write_bytes(bytes(data))
+
+def _stsd(init: bytes) -> bytes:
+    # Description des échantillons (codec + extradata) : ce qui compte pour réutiliser un init d'un morceau à l'autre
+    i = init.find(b"stsd")
+    if i < 4:
+        return init
+    size = int.from_bytes(init[i - 4:i], "big")
+    return init[i - 4:i - 4 + size]
+
+def stitch_playlists(parts: List[Path], out_dir: Path, playlist_name: str, offsets: Optional[List[float]] = None) -> Path:
+    # Concatène les playlists des morceaux (dans l'ordre) : segments renumérotés 000, 001… et déplacés dans out_dir
+    # offsets : début de chaque morceau (s) → tfdt des segments fMP4 recalés
+    lines: List[str] = []
+    version = 3
+    max_dur = 0.0
+    n = 0
+    init_sig: Optional[bytes] = None
+    n_init = 0
+    for k, part in enumerate(parts):
+        timescales: Dict[int, int] = {}
+        offset = offsets[k] if offsets else 0.0
+        for line in part.read_text(encoding="utf-8").splitlines():
+            line = line.strip()
+            if line.startswith("#EXT-X-VERSION:"):
+                version = max(version, int(line.split(":", 1)[1]))
+            elif line.startswith("#EXT-X-MAP:"):
+                uri = re.search(r'URI="([^"]+)"', line).group(1)
+                data = (part.parent / uri).read_bytes()
+                timescales = mp4_timescales(data)
+                if init_sig is not None and _stsd(data) == init_sig:
+                    continue
+                name = uri if n_init == 0 else f"{Path(uri).stem}_{n_init}{Path(uri).suffix}"
+                (out_dir / name).write_bytes(data)
+                if n_init:
+                    lines.append("#EXT-X-DISCONTINUITY")
+                lines.append(f'#EXT-X-MAP:URI="{name}"')
+                init_sig = _stsd(data)
+                n_init += 1
+            elif line.startswith("#EXTINF:"):
+                max_dur = max(max_dur, float(line[len("#EXTINF:"):].split(",")[0]))
+                lines.append(line)
+            elif line and not line.startswith("#"):
+                name = f"{n:03d}{Path(line).suffix}"
+                if timescales and offset:
+                    shift_fmp4_segment(part.parent / line, offset, timescales)
+                os.replace(part.parent / line, out_dir / name)
+                lines.append(name)
+                n += 1
+    header = [
+        "#EXTM3U",
+        f"#EXT-X-VERSION:{version}",
+        f"#EXT-X-TARGETDURATION:{max(1, math.ceil(max_dur - 1e-3))}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+    ]
+    out = out_dir / playlist_name
+    tmp = out.with_suffix(".tmp")
+    tmp.write_text("\n".join(header + lines + ["#EXT-X-ENDLIST"]) + "\n", encoding="utf-8")
+    os.replace(tmp, out)
+    return out
+
+class ChunkProgress:
+    # Façade Progress pour run_ffmpeg_with_progress : cumule l'avancement des morceaux sur les barres des résolutions
+    def __init__(self, progress: Progress, task_ids: List, labels: List[str], n_chunks: int):
+        self.progress = progress
+        self.task_ids = task_ids
+        self.label = "/".join(labels)
+        self.n_chunks = n_chunks
+        self.done: Dict[int, float] = {}
+        self.finished = 0
+        self.lock = threading.Lock()
+
+    def update(self, chunk_idx: int, completed: Optional[float] = None, description: Optional[str] = None, **_kw):
+        if completed is None:
+            return
+        with self.lock:
+            self.done[chunk_idx] = completed
+            total = sum(self.done.values())
+        for tid in self.task_ids:
+            self.progress.update(tid, completed=total)
+
+    def stats(self, _chunk_ids: List, stats: Dict[str, Any], key: Any = None):
+        self.progress.stats(self.task_ids, stats, key=key)
+
+    def chunk_finished(self):
+        with self.lock:
+            self.finished += 1
+            desc = f"[white]{self.label}[/] [{self.finished}/{self.n_chunks}]"
+        for tid in self.task_ids:
+            self.progress.update(tid, description=desc)
+
+def encode_chunked(
+    src: Path,
+    work_dir: Path,
+    rungs: List[Tuple[str, str, str, int]],
+    gop: int,
+    audio_map: List[Tuple[int, str]],
+    use_hw_scale: bool,
+    mode: str,
+    duration: float,
+    fps: float,
+    task_ids: List,
+    progress: Progress,
+    base_name: str,
+    plan: Optional[Dict[str, Any]] = None,
+) -> bool:
+    # audio_map vide si audio partagé (encodé d'un seul tenant à côté) ; sinon muxé dans chaque morceau
+    chunks = plan_chunks(duration, get_keyframe_index(src), fps)
+    labels = [res_name for res_name, _, _, _ in rungs]
+    chunks_dir = work_dir / ".chunks"
+    # Reprise : morceaux terminés d'un run interrompu conservés si découpe, réglages et source sont identiques
+    plan_key = settings_hash(chunks, [rung_settings(r, mode, rung_backend(plan, r[0]), audio_map, plan) for r in rungs],
+                             source_fingerprint(src))
+    if (journal_read(chunks_dir, "plan") or {}).get("key") != plan_key:
+        shutil.rmtree(chunks_dir, ignore_errors=True)
+        journal_write(chunks_dir, "plan", {"key": plan_key})
+    tracker = ChunkProgress(progress, task_ids, labels, len(chunks))
+
+    def encode_chunk(n: int, start: float, length: float) -> bool:
+        out = chunks_dir / f"{n:04d}"
+        if all(playlist_complete(out / res_name / LADDER_PLAYLIST) for res_name in labels):
+            tracker.update(n, completed=length)
+            tracker.chunk_finished()
+            return True
+        shutil.rmtree(out, ignore_errors=True)
+        for res_name in labels:
+            (out / res_name).mkdir(parents=True, exist_ok=True)
+        attempts = [use_hw_scale] + ([False] if use_hw_scale and SOFT_SCALE_IF_NEEDED else [])
+        for hw in attempts:
+            if not hw and use_hw_scale:
+                note_fallback("cpu_scale", job=base_name, rung="/".join(labels), chunk=n)
+            args = build_ffmpeg_ladder_cmd(src, out, rungs, gop, audio_map, hw, mode, window=(start, length), plan=plan)
+            try:
+                with ladder_slots(ladder_backends(rungs, plan), hw), stage("encode_chunk", job=base_name, rung="/".join(labels), chunk=n, hw_scale=hw):
+                    run_ffmpeg_with_progress(args, total_seconds=length, task_id=n, progress=tracker, cwd=out)
+                tracker.chunk_finished()
+                return True
+            except subprocess.CalledProcessError as e:
+                if hw == attempts[-1]:
+                    log_err(f"{base_name} [chunk {n + 1}/{len(chunks)}]: {e}")
+        return False
+
+    with ThreadPoolExecutor(max_workers=max(1, CHUNK_WORKERS)) as pool:
+        results = list(pool.map(lambda c: encode_chunk(c[0], *c[1]), enumerate(chunks)))
+    if all(results):
+        for res_name in labels:
+            parts = [chunks_dir / f"{n:04d}" / res_name / LADDER_PLAYLIST for n in range(len(chunks))]
+            stitch_playlists(parts, work_dir / res_name, f"{res_name}.m3u8", offsets=[start for start, _l in chunks])
+    shutil.rmtree(chunks_dir, ignore_errors=True)
+    return all(results)
+
+# ==========================
+# JOURNAL (reprise après crash)
+# ==========================
+JOURNAL_DIR = ".journal"  # work_dir/.journal/<variante>.json : état, hash des réglages, empreinte source
+
+def settings_hash(*parts: Any) -> str:
+    return hashlib.blake2b(json.dumps(parts, sort_keys=True, default=str).encode(), digest_size=12).hexdigest()
+
+def rung_settings(rung: Tuple[str, str, str, int], mode: str, backend: str, audio_map: List[Tuple[int, str]],
+                  plan: Optional[Dict[str, Any]] = None) -> str:
+    # audio_map vide si audio partagé (la variante vidéo ne dépend alors pas de l'audio)
+    res_name, scale_str, _m, v_kbps = rung
+    copy = bool(plan) and plan["video_copy"] == res_name
+    audio_copy = sorted(plan["audio_copy"]) if plan and audio_map else []
+    return settings_hash("video", res_name, scale_str, v_kbps, mode, SEG_DUR, GOP_SECONDS, backend, ENCODER_PRESET,
+                         audio_map, AUDIO_BITRATE_K if audio_map else None, copy, audio_copy)
+
+def audio_settings(audio_map: List[Tuple[int, str]], mode: str, plan: Optional[Dict[str, Any]] = None) -> str:
+    return settings_hash("audio", audio_map, AUDIO_BITRATE_K, mode, SEG_DUR, sorted(plan["audio_copy"]) if plan else [])
+
+def source_fingerprint(src: Path) -> List:
+    _path, size, mtime_ns, head = _source_key(src)
+    return [size, mtime_ns, head]
+
+def journal_read(work_dir: Path, name: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads((work_dir / JOURNAL_DIR / f"{name}.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def journal_write(work_dir: Path, name: str, entry: Dict[str, Any]):
+    # Écriture atomique (tmp + fsync + rename) : un crash laisse l'ancienne ou la nouvelle version, jamais un JSON tronqué
+    path = work_dir / JOURNAL_DIR / f"{name}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump({**entry, "updated": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def read_media_playlist(path: Path) -> Tuple[List[Tuple[float, str]], Optional[str], bool]:
+    # ([(durée, segment)], init fMP4, ENDLIST) — ffmpeg réécrit la playlist après chaque segment terminé
+    segments: List[Tuple[float, str]] = []
+    init: Optional[str] = None
+    ended = False
+    dur: Optional[float] = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line.startswith("#EXTINF:"):
+            dur = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-MAP:") and init is None:
+            init = re.search(r'URI="([^"]+)"', line).group(1)
+        elif line == "#EXT-X-ENDLIST":
+            ended = True
+        elif line and not line.startswith("#") and dur is not None:
+            segments.append((dur, line))
+            dur = None
+    return segments, init, ended
+
+def playlist_complete(path: Path) -> bool:
+    # Playlist terminée ET tous ses fichiers présents (non vides)
+    try:
+        segments, init, ended = read_media_playlist(path)
+    except (OSError, ValueError, AttributeError):
+        return False
+    files = [seg for _d, seg in segments] + ([init] if init else [])
+    return ended and bool(segments) and all((path.parent / f).is_file() and (path.parent / f).stat().st_size > 0 for f in files)
+
+def partial_segments(variant_dir: Path, name: str) -> List[Tuple[float, str]]:
+    # Segments terminés d'un encodage interrompu (ladder : index.m3u8, par résolution : <res>.m3u8)
+    for playlist in (variant_dir / LADDER_PLAYLIST, variant_dir / f"{name}.m3u8"):
+        try:
+            segments, _init, ended = read_media_playlist(playlist)
+        except (OSError, ValueError, AttributeError):
+            continue
+        if not ended and all((variant_dir / seg).is_file() for _d, seg in segments):
+            return segments
+    return []
+
+def common_resume_point(partials: Dict[str, List[Tuple[float, str]]]) -> Tuple[float, Dict[str, int]]:
+    # Dernière frontière de segment commune à toutes les résolutions (mêmes keyframes → mêmes coupes)
+    bounds: Dict[str, Dict[float, int]] = {}
+    for name, segments in partials.items():
+        acc, marks = 0.0, {}
+        for k, (dur, _seg) in enumerate(segments):
+            acc += dur
+            marks[round(acc, 2)] = k + 1
+        bounds[name] = marks
+    common = set.intersection(*(set(m) for m in bounds.values())) if bounds else set()
+    if not common:
+        return 0.0, {}
+    point = max(common)
+    return point, {name: marks[point] for name, marks in bounds.items()}
+
+def truncate_partial(variant_dir: Path, name: str, keep: int, mode: str) -> Path:
+    # Ne garde que les <keep> premiers segments (+ init) dans .head.m3u8 ; supprime le reste (segment en cours compris)
+    segments = partial_segments(variant_dir, name)[:keep]
+    init = None
+    for playlist in (variant_dir / LADDER_PLAYLIST, variant_dir / f"{name}.m3u8"):
+        if playlist.exists():
+            init = init or read_media_playlist(playlist)[1]
+            playlist.unlink()
+    kept = {seg for _d, seg in segments} | ({init} if init else set())
+    for f in variant_dir.iterdir():
+        if f.suffix in (".ts", ".m4s", ".mp4") and f.name not in kept:
+            f.unlink()
+    head = variant_dir / ".head.m3u8"
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{7 if mode != 'ts' else 3}"]
+    if init:
+        lines.append(f'#EXT-X-MAP:URI="{init}"')
+    for dur, seg in segments:
+        lines += [f"#EXTINF:{dur:.6f},", seg]
+    head.write_text("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n", encoding="utf-8")
+    return head
+
+def resume_rungs(
+    src: Path,
+    work_dir: Path,
+    rungs: List[Tuple[str, str, str, int]],
+    keep: Dict[str, int],
+    start: float,
+    gop: int,
+    audio_map: List[Tuple[int, str]],
+    use_hw_scale: bool,
+    mode: str,
+    duration: float,
+    task_ids: List,
+    progress: Progress,
+    base_name: str,
+    plan: Optional[Dict[str, Any]] = None,
+) -> bool:
+    # Segments déjà faits conservés, la suite encodée comme un morceau [start, fin] puis recousue derrière
+    labels = [res_name for res_name, _, _, _ in rungs]
+    heads = {res_name: truncate_partial(work_dir / res_name, res_name, keep[res_name], mode) for res_name in labels}
+    resume_dir = work_dir / ".resume"
+    shutil.rmtree(resume_dir, ignore_errors=True)
+    for res_name in labels:
+        (resume_dir / res_name).mkdir(parents=True, exist_ok=True)
+    tracker = ChunkProgress(progress, task_ids, labels, 1)
+    tracker.done[-1] = start  # déjà encodé : compté comme un morceau terminé
+    attempts = [use_hw_scale] + ([False] if use_hw_scale and SOFT_SCALE_IF_NEEDED else [])
+    ok = False
+    for hw in attempts:
+        if not hw and use_hw_scale:
+            note_fallback("cpu_scale", job=base_name, rung="/".join(labels))
+        args = build_ffmpeg_ladder_cmd(src, resume_dir, rungs, gop, audio_map, hw, mode, window=(start, duration - start), plan=plan)
+        try:
+            with ladder_slots(ladder_backends(rungs, plan), hw), stage("resume", job=base_name, rung="/".join(labels), start=start, hw_scale=hw):
+                run_ffmpeg_with_progress(args, total_seconds=duration - start, task_id=0, progress=tracker, cwd=resume_dir)
+            ok = True
+            break
+        except subprocess.CalledProcessError as e:
+            if hw == attempts[-1]:
+                log_err(f"{base_name} [{'/'.join(labels)} resume]: {e}")
+    if ok:
+        for res_name in labels:
+            stitch_playlists([heads[res_name], resume_dir / res_name / LADDER_PLAYLIST], work_dir / res_name,
+                             f"{res_name}.m3u8", offsets=[0.0, start])
+            heads[res_name].unlink(missing_ok=True)
+    shutil.rmtree(resume_dir, ignore_errors=True)
+    return ok
+
+# ==========================
+# SCHEDULER
+# ==========================
+_slots: Dict[str, threading.BoundedSemaphore] = {}
+_slots_lock = threading.Lock()
+_tasks_lock = threading.Lock()
+
+def _slot(name: str, size: int) -> threading.BoundedSemaphore:
+    with _slots_lock:
+        if name not in _slots:
+            _slots[name] = threading.BoundedSemaphore(max(1, size))
+        return _slots[name]
+
+@contextmanager
+def encoder_slot(backend: Optional[str] = None, cpu_scale: bool = False):
+    # 1 slot = 1 ffmpeg en cours ; scale CPU pris d'abord pour ne pas bloquer une session GPU en attendant le CPU
+    backend = backend or resolve_backend() or "x264"
+    # (backend CPU : le scale fait partie du job, seul le slot du backend compte)
+    cpu = _slot("cpu_scale", CPU_SCALE_SLOTS) if cpu_scale and ENCODER_BACKENDS.get(backend, {}).get("hw_scale") else None
+    if cpu:
+        cpu.acquire()
+    try:
+        with _slot(backend_family(backend), ENCODER_SLOTS.get(backend_family(backend), 1)):
+            yield
+    finally:
+        if cpu:
+            cpu.release()
+
+def ladder_backends(rungs: List[Tuple[str, str, str, int]], plan: Optional[Dict[str, Any]]) -> List[str]:
+    # Encodeurs présents dans un ffmpeg d'échelle (résolution copiée : aucun)
+    copy = plan["video_copy"] if plan else None
+    return [rung_backend(plan, r[0]) for r in rungs if r[0] != copy]
+
+@contextmanager
+def ladder_slots(backends: List[str], hw: bool):
+    # ffmpeg d'échelle (décodage unique, morceaux, reprise) : 1 slot par famille d'encodeur présente (libsvtav1 à côté de NVENC
+    # compte dans "svtav1"), pris dans un ordre fixe → pas d'interblocage entre deux échelles ;
+    # scale CPU compté dès qu'une branche scale sur CPU dans un ffmpeg qui encode aussi sur GPU
+    backends = backends or [resolve_backend() or "x264"]
+    gpu = any(ENCODER_BACKENDS.get(b, {}).get("hw_scale") for b in backends)
+    cpu_branch = any(not (hw and ENCODER_BACKENDS.get(b, {}).get("hw_scale")) for b in backends)
+    with ExitStack() as stack:
+        if gpu and cpu_branch:
+            stack.enter_context(_slot("cpu_scale", CPU_SCALE_SLOTS))
+        for family in sorted({backend_family(b) for b in backends}):
+            stack.enter_context(_slot(family, ENCODER_SLOTS.get(family, 1)))
+        yield
+
+# ==========================
+# SOUS-TITRES (WebVTT)
+# ==========================
+SUBTITLE_GROUP_ID = "subs"
+_VTT_TIME = re.compile(r"(?:(\d+):)?(\d{2}):(\d{2})\.(\d{3})")
+
+def subtitle_settings(pos: int, lang: str, mode: str) -> str:
+    return settings_hash("subtitle", pos, lang, SEG_DUR, mode)
+
+def subtitle_output_args(subs: List[Tuple[int, Path]]) -> List[str]:
+    # Sorties supplémentaires du ffmpeg qui lit déjà la source : 1 WebVTT complet par piste (découpé ensuite, sans relecture)
+    args: List[str] = []
+    for pos, path in subs:
+        args += ["-map", f"0:s:{pos}", "-c:s", "webvtt", "-f", "webvtt", str(path)]
+    return args
+
+def _vtt_seconds(text: str) -> float:
+    h, m, sec, ms = _VTT_TIME.fullmatch(text.strip()).groups()
+    return int(h or 0) * 3600 + int(m) * 60 + int(sec) + int(ms) / 1000
+
+def ts_first_pts(path: Path) -> Optional[int]:
+    # PTS (90 kHz) de la 1ʳᵉ image vidéo d'un segment TS → X-TIMESTAMP-MAP des segments WebVTT
+    with path.open("rb") as f:
+        data = f.read(TS_PACKET * 4096)
+    for off in range(0, len(data) - TS_PACKET + 1, TS_PACKET):
+        pkt = data[off:off + TS_PACKET]
+        afc = (pkt[3] >> 4) & 3
+        if pkt[0] != 0x47 or not pkt[1] & 0x40 or not afc & 1:
+            continue
+        pl = 4 + (1 + pkt[4] if afc & 2 else 0)
+        if pkt[pl:pl + 3] == b"\0\0\1" and 0xE0 <= pkt[pl + 3] <= 0xEF and pkt[pl + 7] & 0x80:
+            b = pkt[pl + 9:pl + 14]
+            return ((b[0] >> 1) & 7) << 30 | b[1] << 22 | (b[2] >> 1) << 15 | b[3] << 7 | b[4] >> 1
+    return None
+
+def segment_webvtt(variant_dir: Path, name: str, duration: float, mpegts: Optional[int]) -> Path:
+    # <nom>.vtt complet → segments de SEG_DUR s (cues à cheval répétées, horaires absolus) + playlist VOD <nom>.m3u8
+    text = (variant_dir / f"{name}.vtt").read_text(encoding="utf-8-sig").replace("\r\n", "\n")
+    cues: List[Tuple[float, float, str]] = []
+    for block in re.split(r"\n\s*\n", text):
+        lines = block.strip("\n").split("\n")
+        k = next((i for i, line in enumerate(lines) if "-->" in line), None)
+        if k is None:
+            continue
+        start, _, rest = lines[k].partition("-->")
+        cues.append((_vtt_seconds(start), _vtt_seconds(rest.split()[0]), "\n".join(lines[k:])))  # identifiant de cue retiré
+    # TS : horaires WebVTT (source, t=0) recalés sur les PTS MPEG-TS de la vidéo
+    header = "WEBVTT\n" + (f"X-TIMESTAMP-MAP=MPEGTS:{mpegts},LOCAL:00:00:00.000\n" if mpegts is not None else "")
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{SEG_DUR}", "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for k in range(max(1, math.ceil(duration / SEG_DUR - 1e-6))):
+        a, b = k * SEG_DUR, min((k + 1) * SEG_DUR, duration)
+        body = [cue for c_start, c_end, cue in cues if c_start < b and c_end > a]
+        seg = f"{k:03d}.vtt"
+        (variant_dir / seg).write_text(header + "\n" + "".join(cue + "\n\n" for cue in body), encoding="utf-8")
+        lines += [f"#EXTINF:{b - a:.6f},", seg]
+    out = variant_dir / f"{name}.m3u8"
+    tmp = out.with_suffix(".tmp")
+    tmp.write_text("\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n", encoding="utf-8")
+    os.replace(tmp, out)
+    return out
+
+# ==========================
+# TRICKPLAY (vignettes + playlists I-frame)
+# ==========================
+TRICKPLAY_DIR = "trickplay"        # <stem>/trickplay/ : sprite_000.jpg…, thumbnails.vtt, images.m3u8
+TRICKPLAY_VTT = "thumbnails.vtt"
+TRICKPLAY_PLAYLIST = "images.m3u8"
+IFRAME_SUFFIX = "_iframes.m3u8"    # <res>/<res>_iframes.m3u8
+TS_PACKET = 188
+
+def trickplay_size(probe: Dict[str, Any]) -> Tuple[int, int]:
+    # TRICKPLAY_WIDTH de large, hauteur paire au ratio de la source
+    video = next((s for s in probe["info"].get("streams", []) if s.get("codec_type") == "video"), {})
+    w, h = int(video.get("width") or 16), int(video.get("height") or 9)
+    return TRICKPLAY_WIDTH, max(2, int(round(TRICKPLAY_WIDTH * h / w / 2)) * 2)
+
+def trickplay_settings(size: Tuple[int, int]) -> str:
+    return settings_hash("trickplay", TRICKPLAY_INTERVAL, size, list(TRICKPLAY_GRID), TRICKPLAY_FORMAT)
+
+def trickplay_filter(size: Tuple[int, int]) -> str:
+    # 1 image toutes les TRICKPLAY_INTERVAL s → vignette → planche colonnes × lignes (dernière planche complétée à la fin)
+    cols, rows = TRICKPLAY_GRID
+    return f"fps=1/{TRICKPLAY_INTERVAL},scale={size[0]}:{size[1]}:flags=bicubic,tile={cols}x{rows}"
+
+def trickplay_output_args(out_dir: Path, label: str) -> List[str]:
+    # Sortie supplémentaire du ffmpeg d'encodage (muxer image2) : les planches sortent du même décodage
+    codec = ["-c:v", "libwebp", "-quality", "75"] if TRICKPLAY_FORMAT == "webp" else ["-c:v", "mjpeg", "-q:v", "4"]
+    return ["-map", label, *codec, "-f", "image2", "-start_number", "0", str(out_dir / f"sprite_%03d.{TRICKPLAY_FORMAT}")]
+
+def build_side_outputs_cmd(src: Path, trickplay: Optional[Tuple[Path, Tuple[int, int]]] = None,
+                           subtitles: Optional[List[Tuple[int, Path]]] = None) -> List[str]:
+    # Repli quand aucune passe complète n'a lieu (reprise, morceaux, variantes déjà faites) : planches et/ou sous-titres
+    # en une seule lecture, sans encodage (pas de -skip_frame nokey : GOP source souvent > TRICKPLAY_INTERVAL → vignettes répétées)
+    args = [
+        "ffmpeg", "-hide_banner", "-y",
+        "-nostats",
+        "-progress", "pipe:1",
+        "-loglevel", "error",
+        "-i", str(input_path(src)),
+    ]
+    if trickplay:
+        args += ["-filter_complex", f"[0:v:0]{trickplay_filter(trickplay[1])}[thumbs]", *trickplay_output_args(trickplay[0], "[thumbs]")]
+    if subtitles:
+        args += subtitle_output_args(subtitles)
+    return args
+
+def _vtt_time(x: float) -> str:
+    return f"{int(x // 3600):02d}:{int(x % 3600 // 60):02d}:{x % 60:06.3f}"
+
+def finalize_trickplay(out_dir: Path, size: Tuple[int, int], duration: float) -> bool:
+    # Planches produites → index WebVTT (vignette = planche#xywh) + playlist d'images (EXT-X-IMAGES-ONLY / EXT-X-TILES)
+    cols, rows = TRICKPLAY_GRID
+    per_sheet = cols * rows
+    sheets = sorted(out_dir.glob(f"sprite_*.{TRICKPLAY_FORMAT}"))
+    n = min(math.ceil(duration / TRICKPLAY_INTERVAL), len(sheets) * per_sheet)
+    if n <= 0:
+        return False
+    for extra in sheets[math.ceil(n / per_sheet):]:  # restes d'une tentative précédente plus longue
+        extra.unlink()
+    w, h = size
+    cues = ["WEBVTT", ""]
+    for i in range(n):
+        start, end = i * TRICKPLAY_INTERVAL, duration if i == n - 1 else (i + 1) * TRICKPLAY_INTERVAL
+        sheet, cell = divmod(i, per_sheet)
+        cues += [f"{_vtt_time(start)} --> {_vtt_time(end)}", f"{sheets[sheet].name}#xywh={cell % cols * w},{cell // cols * h},{w},{h}", ""]
+    sheet_dur = per_sheet * TRICKPLAY_INTERVAL
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7", f"#EXT-X-TARGETDURATION:{math.ceil(sheet_dur)}", "#EXT-X-MEDIA-SEQUENCE:0",
+             "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-IMAGES-ONLY"]
+    for k in range(math.ceil(n / per_sheet)):
+        lines += [f"#EXTINF:{min(sheet_dur, duration - k * sheet_dur):.3f},",
+                  f"#EXT-X-TILES:RESOLUTION={w}x{h},LAYOUT={cols}x{rows},DURATION={TRICKPLAY_INTERVAL:.3f}", sheets[k].name]
+    for name, text in ((TRICKPLAY_VTT, "\n".join(cues)), (TRICKPLAY_PLAYLIST, "\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n")):
+        tmp = out_dir / f"{name}.tmp"
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, out_dir / name)
+    return True
+
+def ts_first_iframe(data: bytes) -> Optional[int]:
+    # Fin du 1ᵉʳ accès vidéo d'un segment TS (début du PES vidéo suivant) ; la plage part de 0 → PAT/PMT de tête inclus
+    pid = None
+    for off in range(0, len(data) - TS_PACKET + 1, TS_PACKET):
+        pkt = data[off:off + TS_PACKET]
+        if pkt[0] != 0x47:
+            return None
+        afc = (pkt[3] >> 4) & 3
+        if not pkt[1] & 0x40 or not afc & 1:
+            continue
+        p = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        payload = 4 + (1 + pkt[4] if afc & 2 else 0)
+        if pid is None:
+            if pkt[payload:payload + 3] == b"\0\0\1" and 0xE0 <= pkt[payload + 3] <= 0xEF:
+                pid = p
+        elif p == pid:
+            return off
+    return len(data) if pid is not None else None
+
+def fmp4_first_iframe(data: bytes) -> Optional[Tuple[int, int]]:
+    # (début, fin) : moof + 1ᵉʳ échantillon de la piste vidéo (track 1, keyframe en tête de fragment) — décodable avec l'init
+    for typ, b, c, e in iter_boxes(data):
+        if typ != b"moof":
+            continue
+        for _t, _b, tc, te in find_box(data, [b"traf"], c, e):
+            tfhd = next(find_box(data, [b"tfhd"], tc, te), None)
+            trun = next(find_box(data, [b"trun"], tc, te), None)
+            if not tfhd or not trun or int.from_bytes(data[tfhd[2] + 4:tfhd[2] + 8], "big") != 1:
+                continue
+            tf_flags = int.from_bytes(data[tfhd[2] + 1:tfhd[2] + 4], "big")
+            pos = tfhd[2] + 8
+            base = int.from_bytes(data[pos:pos + 8], "big") if tf_flags & 0x1 else b
+            pos += (8 if tf_flags & 0x1 else 0) + (4 if tf_flags & 0x2 else 0) + (4 if tf_flags & 0x8 else 0)
+            size = int.from_bytes(data[pos:pos + 4], "big") if tf_flags & 0x10 else 0
+            tr_flags = int.from_bytes(data[trun[2] + 1:trun[2] + 4], "big")
+            pos = trun[2] + 8
+            offset = int.from_bytes(data[pos:pos + 4], "big", signed=True) if tr_flags & 0x1 else 0
+            pos += (4 if tr_flags & 0x1 else 0) + (4 if tr_flags & 0x4 else 0) + (4 if tr_flags & 0x100 else 0)
+            if tr_flags & 0x200:
+                size = int.from_bytes(data[pos:pos + 4], "big")
+            return b, base + offset + size
+        return None
+    return None
+
+def write_iframe_playlist(variant_dir: Path, name: str) -> Optional[Path]:
+    # Playlist I-frame (EXT-X-I-FRAMES-ONLY) : 1 entrée par segment = sa keyframe de tête, en plage d'octets du segment existant
+    playlist = variant_dir / f"{name}.m3u8"
+    entries: List[str] = []
+    max_dur, version = 0.0, 4
+    dur: Optional[float] = None
+    byterange: Optional[Tuple[int, int]] = None
+    for line in playlist.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-MAP:") or line == "#EXT-X-DISCONTINUITY":
+            entries.append(line)  # init (fMP4) et changements d'init des morceaux recousus, à leur place
+            version = 7 if line.startswith("#EXT-X-MAP:") else version
+        elif line.startswith("#EXTINF:"):
+            dur = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, at = line.split(":", 1)[1].partition("@")
+            byterange = (int(at or 0), int(length))
+        elif line and not line.startswith("#") and dur is not None:
+            with (variant_dir / line).open("rb") as f:
+                if byterange:
+                    f.seek(byterange[0])
+                data = f.read(byterange[1] if byterange else -1)
+            start = byterange[0] if byterange else 0
+            if line.endswith(".ts"):
+                end = ts_first_iframe(data)
+                span = (0, end) if end else None
+            else:
+                span = fmp4_first_iframe(data)
+            if span:
+                entries += [f"#EXTINF:{dur:.6f},", f"#EXT-X-BYTERANGE:{span[1] - span[0]}@{start + span[0]}", line]
+                max_dur = max(max_dur, dur)
+            dur, byterange = None, None
+    if not any(e.startswith("#EXTINF:") for e in entries):
+        return None
+    out = variant_dir / f"{name}{IFRAME_SUFFIX}"
+    lines = ["#EXTM3U", f"#EXT-X-VERSION:{version}", f"#EXT-X-TARGETDURATION:{max(1, math.ceil(max_dur - 1e-3))}",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD", "#EXT-X-I-FRAMES-ONLY", *entries, "#EXT-X-ENDLIST"]
+    tmp = out.with_suffix(".tmp")
+    tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp, out)
+    return out
+
+def peak_bandwidth(playlist: Path) -> int:
+    # BANDWIDTH d'une playlist en plages d'octets (I-frames) ou en fichiers (planches) : débit crête en bit/s
+    peak, dur = 0.0, None
+    for line in playlist.read_text(encoding="utf-8").splitlines():
+        if line.startswith("#EXTINF:"):
+            dur = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-BYTERANGE:") and dur:
+            peak = max(peak, int(line.split(":", 1)[1].split("@")[0]) * 8 / dur)
+            dur = None
+        elif line and not line.startswith("#") and dur:
+            peak = max(peak, (playlist.parent / line).stat().st_size * 8 / dur)
+            dur = None
+    return max(1, int(math.ceil(peak)))
+
+# ==========================
+# PUBLICATION (scratch → sortie)
+# ==========================
+
+def _copy_tree(src: Path, dst: Path):
+    # Copie par lot : arborescence créée d'abord, fichiers copiés en parallèle (latence par fichier du stockage réseau masquée)
+    files = [p for p in src.rglob("*") if p.is_file()]
+    for d in {dst} | {dst / p.parent.relative_to(src) for p in files}:
+        d.mkdir(parents=True, exist_ok=True)
+    with ThreadPoolExecutor(max_workers=max(1, PUBLISH_COPY_WORKERS)) as pool:
+        list(pool.map(lambda p: shutil.copy2(p, dst / p.relative_to(src)), files))
+
+RENAME_EXCHANGE = 2  # renameat2(2) : échange atomique de deux chemins existants
+AT_FDCWD = -100
+
+@lru_cache(maxsize=1)
+def _renameat2():
+    # Linux (glibc ≥ 2.28) ; None ailleurs → repli sur deux renommages
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        fn = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    fn.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    return fn
+
+def rename_exchange(a: Path, b: Path) -> bool:
+    # a ↔ b en une opération (aucun instant où b manque) ; False si le noyau ou le FS ne sait pas faire
+    fn = _renameat2()
+    if fn is None:
+        return False
+    if fn(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.ENOTSUP):
+        return False
+    raise OSError(err, os.strerror(err), str(a), None, str(b))
+
+def publish_variant(work_dir: Path, pub_dir: Path, name: str):
+    # Variante terminée → sortie : dossier complet posé par renommage (ancienne version complète ou nouvelle, jamais un mélange)
+    src, dst = work_dir / name, pub_dir / name
+    if src == dst:
+        return
+    pub_dir.mkdir(parents=True, exist_ok=True)
+    for stale in [*pub_dir.glob(f".{name}.publish-*"), *pub_dir.glob(f".{name}.old-*")]:  # restes d'une publication interrompue
+        shutil.rmtree(stale, ignore_errors=True)
+    tag = uuid.uuid4().hex[:8]
+    tmp, old = pub_dir / f".{name}.publish-{tag}", pub_dir / f".{name}.old-{tag}"
+    with stage("publish", job=pub_dir.name, rung=name):
+        try:
+            os.rename(src, tmp)  # même système de fichiers : instantané
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            try:
+                _copy_tree(src, tmp)
+            except BaseException:
+                shutil.rmtree(tmp, ignore_errors=True)
+                raise
+            shutil.rmtree(src, ignore_errors=True)
+        # Republication : échange atomique, <res>/ toujours présent pour le master en ligne ; sinon (autre OS, FS) deux renommages
+        if dst.exists() and rename_exchange(tmp, dst):
+            shutil.rmtree(tmp, ignore_errors=True)  # tmp contient maintenant l'ancienne version
+            return
+        if dst.exists():
+            os.rename(dst, old)
+        os.rename(tmp, dst)
+        shutil.rmtree(old, ignore_errors=True)
+
+# ==========================
+# DÉDUPLICATION (cache par contenu)
+# ==========================
+DEDUP_BLOCK = 1 << 16
+DEDUP_MANIFEST = "manifest.json"  # <magasin>/<clé>/manifest.json + tree/ (copie liée de la sortie, sans le journal)
+FICLONE = 0x40049409
+_dedup_lock = threading.Lock()
+
+def dedup_root() -> Path:
+    return Path(DEDUP_DIR) if DEDUP_DIR else Path(CACHE_DIR) / "dedup"
+
+def content_fingerprint(path: Path) -> str:
+    # Taille + DEDUP_SAMPLES blocs régulièrement espacés (1ᵉʳ et dernier compris), lus via mmap sans tout parcourir
+    size = path.stat().st_size
+    h = hashlib.blake2b(digest_size=20)
+    h.update(str(size).encode())
+    if size:
+        with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            n, last = max(2, DEDUP_SAMPLES), max(0, size - DEDUP_BLOCK)
+            for i in range(n):
+                off = last * i // (n - 1)
+                h.update(mm[off:off + DEDUP_BLOCK])
+    return h.hexdigest()
+
+def dedup_cache_key(src: Path, mode: str, variant_settings: Dict[str, str], probe: Dict[str, Any]) -> str:
+    # Contenu + réglages de chaque variante (échelle, mode, backend, preset… : déjà dans les hash du journal) + sorties annexes
+    subs = [subtitle_settings(pos, lang, mode) for pos, lang in probe.get("subtitle_map", [])]
+    tp = trickplay_settings(trickplay_size(probe)) if TRICKPLAY else None
+    return settings_hash("dedup", content_fingerprint(input_path(src)), mode, sorted(variant_settings.items()), tp, subs,
+                         SHARED_AUDIO, SINGLE_DECODE)
+
+def _file_hash(path: Path) -> str:
+    h = hashlib.blake2b(digest_size=20)
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def link_or_copy(src: Path, dst: Path):
+    # Lien dur (même FS) → reflink (btrfs, XFS : copie à la demande) → copie
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if fcntl is not None:
+        try:
+            with src.open("rb") as fs, dst.open("wb") as fd:
+                fcntl.ioctl(fd.fileno(), FICLONE, fs.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            dst.unlink(missing_ok=True)
+    shutil.copy2(src, dst)
+
+def _tree_files(root: Path) -> List[Path]:
+    # Sortie publiée sans journal ni restes de publication (noms en ".")
+    return sorted(p.relative_to(root) for p in root.rglob("*")
+                  if p.is_file() and not any(part.startswith(".") for part in p.relative_to(root).parts))
+
+def _read_manifest(obj: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads((obj / DEDUP_MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def dedup_verify(obj: Path, manifest: Optional[Dict[str, Any]]) -> Optional[str]:
+    # None si l'entrée est intacte, sinon le 1ᵉʳ fichier fautif (sortie réécrite sur place, disque, suppression…)
+    if not manifest or "master.m3u8" not in manifest.get("files", {}):
+        return DEDUP_MANIFEST
+    for rel, (size, mtime_ns, digest) in manifest["files"].items():
+        try:
+            st = (obj / "tree" / rel).stat()
+        except OSError:
+            return rel
+        if st.st_size != size or (DEDUP_VERIFY != "hash" and st.st_mtime_ns != mtime_ns):
+            return rel
+        if DEDUP_VERIFY == "hash" and digest and _file_hash(obj / "tree" / rel) != digest:
+            return rel
+    return None
+
+def dedup_store(key: str, pub_dir: Path):
+    # Sortie complète (master écrit, toutes les variantes OK) → magasin, liée fichier par fichier ; 1ʳᵉ écriture gagnante
+    obj = dedup_root() / key
+    if obj.exists():
+        return
+    tmp = dedup_root() / f".{key}.tmp-{uuid.uuid4().hex[:8]}"
+    try:
+        files = {}
+        for rel in _tree_files(pub_dir):
+            link_or_copy(pub_dir / rel, tmp / "tree" / rel)
+            st = (tmp / "tree" / rel).stat()
+            files[rel.as_posix()] = [st.st_size, st.st_mtime_ns, _file_hash(tmp / "tree" / rel) if DEDUP_VERIFY == "hash" else None]
+        journal = {p.stem: json.loads(p.read_text(encoding="utf-8")) for p in (pub_dir / JOURNAL_DIR).glob("*.json")}
+        manifest = {"files": files, "bytes": sum(f[0] for f in files.values()), "journal": journal, "created": time.time()}
+        (tmp / DEDUP_MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+        os.rename(tmp, obj)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        return
+    dedup_evict(keep=key)
+
+def dedup_restore(key: str, out_root: Path, name: str, source_fp: List) -> bool:
+    # Entrée vérifiée → out_root/name reconstruit par liens puis posé d'un bloc (publish_variant), journal recalé sur cette source
+    obj = dedup_root() / key
+    manifest = _read_manifest(obj)
+    if manifest is None:
+        return False
+    bad = dedup_verify(obj, manifest)
+    if bad:
+        log_warn(t("dedup_corrupt", name=name, file=bad))
+        with _dedup_lock:
+            shutil.rmtree(obj, ignore_errors=True)
+        return False
+    staging = out_root / f".{name}.dedup-{uuid.uuid4().hex[:8]}"
+    try:
+        with stage("dedup_restore", job=name):
+            for rel in manifest["files"]:
+                link_or_copy(obj / "tree" / rel, staging / name / rel)
+            for j_name, entry in manifest.get("journal", {}).items():
+                journal_write(staging / name, j_name, {**entry, "source": source_fp})
+            publish_variant(staging, out_root, name)
+        os.utime(obj / DEDUP_MANIFEST)  # LRU : dernière reprise
+    except OSError as e:
+        log_warn(t("dedup_restore_failed", name=name, err=e))
+        return False
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return True
+
+def dedup_evict(keep: Optional[str] = None) -> int:
+    # Magasin ramené sous DEDUP_MAX_BYTES, entrées les moins récemment reprises d'abord → nombre d'entrées évincées
+    with _dedup_lock:
+        entries = []
+        for obj in dedup_root().glob("[!.]*"):
+            manifest = _read_manifest(obj)
+            try:
+                used = (obj / DEDUP_MANIFEST).stat().st_mtime
+            except OSError:
+                used = 0.0
+            entries.append((used, obj, (manifest or {}).get("bytes", 0)))
+        total = sum(e[2] for e in entries)
+        evicted = 0
+        for _used, obj, size in sorted(entries, key=lambda e: e[0]):
+            if total <= DEDUP_MAX_BYTES:
+                break
+            if obj.name == keep:
+                continue
+            shutil.rmtree(obj, ignore_errors=True)
+            total -= size
+            evicted += 1
+    return evicted
+
+def dedup_check() -> int:
+    # --dedup-check : chaque entrée vérifiée (fautives supprimées), restes d'écritures interrompues nettoyés, puis éviction
+    root = dedup_root()
+    ok = bad = 0
+    for obj in sorted(root.glob("*")) if root.is_dir() else []:
+        if obj.name.startswith("."):
+            shutil.rmtree(obj, ignore_errors=True)
+            continue
+        fault = dedup_verify(obj, _read_manifest(obj))
+        if fault:
+            log_warn(t("dedup_corrupt", name=obj.name, file=fault))
+            shutil.rmtree(obj, ignore_errors=True)
+            bad += 1
+        else:
+            ok += 1
+    evicted = dedup_evict()
+    log_info(t("dedup_check", ok=ok - evicted, bad=bad, evicted=evicted, path=root))
+    return EXIT_FAILED if bad else EXIT_OK
+
+# ==========================
+# CODECS (RFC 6381 : attribut CODECS du master)
+# ==========================
+AAC_OBJECT_TYPES = {"LC": 2, "HE-AAC": 5, "HE-AACv2": 29}
+
+def _rbsp(nal: bytes) -> bytes:
+    # Octets anti-émulation (00 00 03) retirés d'un NAL
+    return re.sub(b"\x00\x00\x03", b"\x00\x00", nal)
+
+def hevc_codec_string(ptl: bytes, tag: str = "hvc1") -> str:
+    # profile_tier_level général (espace/tier/profil, compatibilités, contraintes, niveau : 12 octets) → hvc1.1.6.L120.B0
+    space = "" if not ptl[0] >> 6 else "ABC"[(ptl[0] >> 6) - 1]
+    compat = int(f"{int.from_bytes(ptl[1:5], 'big'):032b}"[::-1], 2)  # bits dans l'ordre inverse
+    parts = [tag, f"{space}{ptl[0] & 0x1F}", f"{compat:X}", f"{'H' if ptl[0] & 0x20 else 'L'}{ptl[11]}"]
+    return ".".join(parts + [f"{b:X}" for b in ptl[5:11].rstrip(b"\0")])
+
+def av1_codec_string(av1c: bytes) -> str:
+    # av1C : profil, niveau, tier, profondeur → av01.0.08M.08
+    depth = 12 if av1c[2] & 0x20 else 10 if av1c[2] & 0x40 else 8
+    return f"av01.{av1c[1] >> 5}.{av1c[1] & 0x1F:02d}{'H' if av1c[2] & 0x80 else 'M'}.{depth:02d}"
+
+def fmp4_video_codec(init: bytes) -> Optional[str]:
+    # Entrée vidéo de moov/…/stsd (avcC, hvcC, av1C) ; les 78 premiers octets d'une entrée visuelle précèdent ses boîtes
+    for _t, _b, c, e in find_box(init, [b"moov", b"trak", b"mdia", b"minf", b"stbl", b"stsd"]):
+        for typ, _eb, ec, ee in iter_boxes(init, c + 8, e):
+            if typ in (b"avc1", b"avc3"):
+                cfg = next(find_box(init, [b"avcC"], ec + 78, ee), None)
+                if cfg:
+                    return f"{typ.decode()}.{init[cfg[2] + 1:cfg[2] + 4].hex()}"
+            elif typ in (b"hvc1", b"hev1"):
+                cfg = next(find_box(init, [b"hvcC"], ec + 78, ee), None)
+                if cfg:
+                    return hevc_codec_string(init[cfg[2] + 1:cfg[2] + 13], typ.decode())
+            elif typ == b"av01":
+                cfg = next(find_box(init, [b"av1C"], ec + 78, ee), None)
+                if cfg:
+                    return av1_codec_string(init[cfg[2]:cfg[2] + 4])
+    return None
+
+def ts_video_codec(data: bytes, codec: Optional[str] = None) -> Optional[str]:
+    # 1ᵉʳ PES vidéo d'un segment TS recollé → SPS (H.264 : NAL 7, HEVC : NAL 33) → avc1.640028 / hvc1.1.6.L120.B0
+    # codec None : les deux cherchés (un en-tête NAL HEVC est pair, jamais pris pour un SPS H.264)
+    pid, es = None, bytearray()
+    for off in range(0, len(data) - TS_PACKET + 1, TS_PACKET):
+        pkt = data[off:off + TS_PACKET]
+        afc = (pkt[3] >> 4) & 3
+        if pkt[0] != 0x47 or not afc & 1:
+            continue
+        p = ((pkt[1] & 0x1F) << 8) | pkt[2]
+        payload = pkt[4 + (1 + pkt[4] if afc & 2 else 0):]
+        if pid is None:
+            if pkt[1] & 0x40 and payload[:3] == b"\0\0\1" and 0xE0 <= payload[3] <= 0xEF:
+                pid = p
+                es += payload[9 + payload[8]:]
+        elif p == pid:
+            if pkt[1] & 0x40:
+                break
+            es += payload
+    for m in re.finditer(b"\x00\x00\x01", es):
+        i = m.end()
+        if codec != "hevc" and i < len(es) and es[i] & 0x1F == 7:
+            return "avc1." + _rbsp(bytes(es[i + 1:i + 8]))[:3].hex()
+        if codec != "h264" and i < len(es) and (es[i] >> 1) & 0x3F == 33:
+            return hevc_codec_string(_rbsp(bytes(es[i + 2:i + 40]))[1:13])
+    return None
+
+def fmp4_audio_codec(init: bytes) -> Optional[str]:
+    # mp4a/esds : ES_Descriptor → DecoderConfigDescriptor (objectTypeIndication) → DecoderSpecificInfo (audioObjectType)
+    def descriptor(i: int) -> Tuple[int, int, int]:
+        tag, size = init[i], 0
+        for i in range(i + 1, i + 5):
+            size = size << 7 | init[i] & 0x7F
+            if not init[i] & 0x80:
+                break
+        return tag, i + 1, size
+
+    for _t, _b, c, e in find_box(init, [b"moov", b"trak", b"mdia", b"minf", b"stbl", b"stsd"]):
+        for typ, _eb, ec, ee in iter_boxes(init, c + 8, e):
+            esds = next(find_box(init, [b"esds"], ec + 28, ee), None) if typ == b"mp4a" else None
+            if not esds:
+                continue
+            tag, i, _size = descriptor(esds[2] + 4)
+            if tag != 0x03:
+                continue
+            flags = init[i + 2]
+            i += 3 + (2 if flags & 0x80 else 0)  # ES_ID, flags, dependsOn_ES_ID
+            if flags & 0x40:
+                i += 1 + init[i]  # URL (longueur + texte), après dependsOn_ES_ID
+            i += 2 if flags & 0x20 else 0  # OCR_ES_Id
+            tag, i, _size = descriptor(i)
+            if tag != 0x04:
+                continue
+            oti = init[i]
+            if oti != 0x40:
+                return f"mp4a.{oti:02X}"
+            tag, i, _size = descriptor(i + 13)
+            return f"mp4a.40.{init[i] >> 3 if tag == 0x05 else 2}"
+    return None
+
+def ts_audio_codec(data: bytes) -> Optional[str]:
+    # 1ᵉʳ PES audio d'un segment TS → en-tête ADTS (profil + 1 = audioObjectType)
+    for off in range(0, len(data) - TS_PACKET + 1, TS_PACKET):
+        pkt = data[off:off + TS_PACKET]
+        afc = (pkt[3] >> 4) & 3
+        if pkt[0] != 0x47 or not pkt[1] & 0x40 or not afc & 1:
+            continue
+        payload = pkt[4 + (1 + pkt[4] if afc & 2 else 0):]
+        if payload[:3] == b"\0\0\1" and 0xC0 <= payload[3] <= 0xDF:
+            adts = payload[9 + payload[8]:]
+            return f"mp4a.40.{(adts[2] >> 6) + 1}" if adts[:1] == b"\xff" and adts[1] & 0xF0 == 0xF0 else None
+    return None
+
+def variant_codec(variant_dir: Path, name: str, codec: str) -> Optional[str]:
+    # Codec vidéo d'une variante terminée, lu dans son init (fMP4/CMAF) ou son 1ᵉʳ segment (TS) ; None si illisible
+    try:
+        segments, init, _ended = read_media_playlist(variant_dir / f"{name}.m3u8")
+        if init:
+            with (variant_dir / init).open("rb") as f:
+                return fmp4_video_codec(f.read(1 << 20))
+        if segments:
+            with (variant_dir / segments[0][1]).open("rb") as f:
+                return ts_video_codec(f.read(TS_PACKET * 4096), codec)
+    except (OSError, ValueError, AttributeError, IndexError):
+        pass
+    return None
+
+def audio_codec_strings(info: dict, audio_map: List[Tuple[int, str]], audio_copy=frozenset()) -> List[str]:
+    # AAC encodé ici : LC (mp4a.40.2) ; piste copiée : profil de la source (HE-AAC → mp4a.40.5)
+    audios = [st for st in info.get("streams", []) if st.get("codec_type") == "audio"]
+    found = [f"mp4a.40.{AAC_OBJECT_TYPES.get(audios[pos].get('profile'), 2) if pos in audio_copy else 2}" for pos, _lang in audio_map]
+    return list(dict.fromkeys(found))
+
+# ==========================
+# MASTER
+# ==========================
+
+HLS_LANG_CODES = {"fre": "fr", "eng": "en", "ger": "de", "deu": "de", "spa": "es", "ita": "it", "jpn": "ja", "por": "pt"}
+AUDIO_GROUP_ID = "aud"
+
+def write_master(base_dir: Path, rendus: List[Tuple[str, str, int]], audio: Optional[List[Tuple[str, str]]] = None,
+                 mode: str = "ts", trickplay: bool = False, subtitles: Optional[List[Tuple[str, str, bool]]] = None,
+                 progressive: bool = False, codecs: Optional[Dict[str, str]] = None, audio_codecs: Optional[List[str]] = None,
+                 audio_kbps: Optional[int] = None):
+    # audio : renditions partagées (nom, langue) dans l'ordre FR prioritaire → la 1ʳᵉ est DEFAULT
+    # audio_kbps : débit de la plus lourde, ajouté au BANDWIDTH de chaque variante (défaut : AUDIO_BITRATE_K)
+    # subtitles : renditions WebVTT (nom, langue, forcée), même ordre FR prioritaire, aucune par défaut
+    # trickplay : playlists I-frame présentes (<res>/<res>_iframes.m3u8) + planches (trickplay/images.m3u8) référencées
+    # codecs : variante → codec vidéo RFC 6381 (lu dans la sortie) ; audio_codecs : codecs audio ajoutés à chaque variante
+    # → CODECS sur STREAM-INF : un lecteur écarte les variantes qu'il ne sait pas décoder (HEVC/AV1) et garde les moins chères
+    # progressive : playlists de variante encore EVENT → lecture depuis le début (EXT-X-START) plutôt qu'au bord « live »
+    # Écrit en dernier, remplacé d'un coup (tmp + rename) : un lecteur ne voit jamais de master tronqué
+    master_path = base_dir / "master.m3u8"
+    tmp = master_path.with_suffix(".tmp")
+    with tmp.open("w", encoding="utf-8") as f:
+        f.write("#EXTM3U\n")
+        if mode != "ts":
+            # fMP4 / CMAF (EXT-X-MAP, BYTERANGE) : version des playlists de variante
+            f.write("#EXT-X-VERSION:7\n#EXT-X-INDEPENDENT-SEGMENTS\n")
+        if progressive:
+            f.write("#EXT-X-START:TIME-OFFSET=0,PRECISE=YES\n")
+        if audio:
+            for i, (a_name, lang) in enumerate(audio):
+                attrs = [f'TYPE=AUDIO,GROUP-ID="{AUDIO_GROUP_ID}"']
+                if lang != "und":
+                    attrs.append(f'LANGUAGE="{HLS_LANG_CODES.get(lang, lang)}"')
+                attrs.append(f'NAME="{a_name[len("audio_"):]}"')
+                attrs.append(f"DEFAULT={'YES' if i == 0 else 'NO'},AUTOSELECT=YES,CHANNELS=\"2\"")
+                attrs.append(f'URI="{a_name}/{a_name}.m3u8"')
+                f.write(f"#EXT-X-MEDIA:{','.join(attrs)}\n")
+        for s_name, lang, forced in subtitles or []:
+            attrs = [f'TYPE=SUBTITLES,GROUP-ID="{SUBTITLE_GROUP_ID}"']
+            if lang != "und":
+                attrs.append(f'LANGUAGE="{HLS_LANG_CODES.get(lang, lang)}"')
+            attrs.append(f'NAME="{s_name[len("sub_"):]}{" (forced)" if forced else ""}"')
+            attrs.append(f"DEFAULT=NO,AUTOSELECT=YES,FORCED={'YES' if forced else 'NO'}")
+            attrs.append(f'URI="{s_name}/{s_name}.m3u8"')
+            f.write(f"#EXT-X-MEDIA:{','.join(attrs)}\n")
+        groups = f',SUBTITLES="{SUBTITLE_GROUP_ID}"' if subtitles else ""
+        for res_name, res_str, bitrate in rendus:
+            video_codec = (codecs or {}).get(res_name)
+            codec_attr = f',CODECS="{",".join([video_codec, *(audio_codecs or [])])}"' if video_codec else ""
+            if audio:
+                f.write(f"#EXT-X-STREAM-INF:BANDWIDTH={(bitrate + (audio_kbps or AUDIO_BITRATE_K))*1000},RESOLUTION={res_str}{codec_attr},AUDIO=\"{AUDIO_GROUP_ID}\"{groups}\n")
+            else:
+                f.write(f"#EXT-X-STREAM-INF:BANDWIDTH={bitrate*1000},RESOLUTION={res_str}{codec_attr}{groups}\n")
+            f.write(f"{res_name}/{res_name}.m3u8\n")
+        if trickplay:
+            for res_name, res_str, _bitrate in rendus:
+                iframes = base_dir / res_name / f"{res_name}{IFRAME_SUFFIX}"
+                if iframes.is_file():
+                    video_codec = (codecs or {}).get(res_name)
+                    codec_attr = f'CODECS="{video_codec}",' if video_codec else ""
+                    f.write(f'#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH={peak_bandwidth(iframes)},RESOLUTION={res_str},'
+                            f'{codec_attr}URI="{res_name}/{iframes.name}"\n')
+            images = base_dir / TRICKPLAY_DIR / TRICKPLAY_PLAYLIST
+            tiles = re.search(r"RESOLUTION=(\d+)x(\d+),LAYOUT=(\d+)x(\d+)", images.read_text(encoding="utf-8")) if images.is_file() else None
+            if tiles:
+                w, h, cols, rows = map(int, tiles.groups())
+                codec = "jpeg" if TRICKPLAY_FORMAT == "jpg" else TRICKPLAY_FORMAT
+                f.write(f'#EXT-X-IMAGE-STREAM-INF:BANDWIDTH={peak_bandwidth(images)},RESOLUTION={w * cols}x{h * rows},'
+                        f'CODECS="{codec}",URI="{TRICKPLAY_DIR}/{TRICKPLAY_PLAYLIST}"\n')
+    os.replace(tmp, master_path)
+    log_ok(t("master_done", path=master_path))
+
+# ==========================
+# VÉRIFICATION (sortie HLS)
+# ==========================
+# 1 playlist de variante = 1 tâche d'un pool de processus : fichiers ouverts en mmap, seuls les en-têtes (paquets TS, moof)
+# sont lus → un catalogue entier se relit à la vitesse du disque, sans décodage ni ffprobe
+_verify_pool: Optional[ProcessPoolExecutor] = None
+_verify_pool_lock = threading.Lock()
+VERIFY_ORDER = ["BANDWIDTH", "AVERAGE-BANDWIDTH", "RESOLUTION", "FRAME-RATE", "CODECS"]  # attributs réécrits, les autres gardent leur ordre
+
+def mp4_tracks(init) -> Dict[int, Tuple[bytes, int]]:
+    # track_ID → (type de piste b"vide"/b"soun", default_sample_flags de mvex/trex)
+    trex = {}
+    for _t, _b, c, _e in find_box(init, [b"moov", b"mvex", b"trex"]):
+        trex[int.from_bytes(init[c + 4:c + 8], "big")] = int.from_bytes(init[c + 20:c + 24], "big")
+    tracks: Dict[int, Tuple[bytes, int]] = {}
+    for _t, _b, c, e in find_box(init, [b"moov", b"trak"]):
+        tk = next(find_box(init, [b"tkhd"], c, e), None)
+        hd = next(find_box(init, [b"mdia", b"hdlr"], c, e), None)
+        if tk and hd:
+            tk_id = int.from_bytes(init[tk[2] + (20 if init[tk[2]] == 1 else 12):][:4], "big")
+            tracks[tk_id] = (bytes(init[hd[2] + 8:hd[2] + 12]), trex.get(tk_id, 0))
+    return tracks
+
+def fmp4_segment_info(data, start: int, end: int, track: int, default_flags: int) -> Tuple[Optional[bool], int]:
+    # (1ʳᵉ image = keyframe, nombre d'images) de la piste vidéo : moof/traf/trun lus, mdat sauté
+    # flags du 1ᵉʳ échantillon : first_sample_flags (trun) > flags par échantillon > tfhd > trex ; non-sync = bit 16
+    key, frames = None, 0
+    for typ, _b, c, e in iter_boxes(data, start, end):
+        if typ != b"moof":
+            continue
+        for _t, _tb, tc, te in find_box(data, [b"traf"], c, e):
+            tfhd = next(find_box(data, [b"tfhd"], tc, te), None)
+            if not tfhd or int.from_bytes(data[tfhd[2] + 4:tfhd[2] + 8], "big") != track:
+                continue
+            tf_flags = int.from_bytes(data[tfhd[2] + 1:tfhd[2] + 4], "big")
+            pos = tfhd[2] + 8 + (8 if tf_flags & 0x1 else 0) + (4 if tf_flags & 0x2 else 0) + (4 if tf_flags & 0x8 else 0) + (4 if tf_flags & 0x10 else 0)
+            flags = int.from_bytes(data[pos:pos + 4], "big") if tf_flags & 0x20 else default_flags
+            for _r, _rb, rc, _re in find_box(data, [b"trun"], tc, te):
+                tr_flags = int.from_bytes(data[rc + 1:rc + 4], "big")
+                count = int.from_bytes(data[rc + 4:rc + 8], "big")
+                if key is None and count:
+                    pos = rc + 8 + (4 if tr_flags & 0x1 else 0)
+                    if tr_flags & 0x4:
+                        flags = int.from_bytes(data[pos:pos + 4], "big")
+                    elif tr_flags & 0x400:
+                        pos += (4 if tr_flags & 0x100 else 0) + (4 if tr_flags & 0x200 else 0)
+                        flags = int.from_bytes(data[pos:pos + 4], "big")
+                    key = not flags & 0x10000
+                frames += count
+    return key, frames
+
+def ts_segment_info(data, start: int, end: int, count_frames: bool) -> Tuple[Optional[bool], int]:
+    # (1ʳᵉ image = keyframe, nombre d'images) : random_access_indicator du 1ᵉʳ PES vidéo ; images = débuts de PES vidéo
+    # sans count_frames, arrêt au 1ᵉʳ PES vidéo (quelques paquets lus) ; None : pas de vidéo (audio seul)
+    pid, key, frames = None, None, 0
+    for off in range(start, end - TS_PACKET + 1, TS_PACKET):
+        hdr = data[off:off + 6]
+        if hdr[0] != 0x47:
+            raise ValueError(f"TS sync lost at byte {off - start}")
+        if not hdr[1] & 0x40:
+            continue
+        p = ((hdr[1] & 0x1F) << 8) | hdr[2]
+        afc = (hdr[3] >> 4) & 3
+        if pid is None:
+            payload = off + 4 + (1 + hdr[4] if afc & 2 else 0)
+            if afc & 1 and data[payload:payload + 3] == b"\0\0\1" and 0xE0 <= data[payload + 3] <= 0xEF:
+                pid, frames = p, 1
+                key = bool(afc & 2 and hdr[4] and hdr[5] & 0x40)
+                if not count_frames:
+                    break
+        elif p == pid:
+            frames += 1
+    return key, frames
+
+def peak_window(sizes: List[Tuple[float, int]], target: float) -> int:
+    # Débit crête (bit/s) au sens RFC 8216 : segments contigus totalisant 0,5 à 1,5 × TARGETDURATION
+    peak = 0.0
+    for i in range(len(sizes)):
+        dur = bits = 0.0
+        for d, n in sizes[i:]:
+            if dur + d > 1.5 * target:
+                break
+            dur, bits = dur + d, bits + n * 8
+            if dur >= 0.5 * target:
+                peak = max(peak, bits / dur)
+    if not peak:
+        total = sum(d for d, _n in sizes)
+        peak = sum(n * 8 for _d, n in sizes) / total if total else 0.0
+    return int(math.ceil(peak))
+
+def verify_playlist(playlist: str, seg_dur: float) -> Dict[str, Any]:
+    # Tâche d'un processus de vérification : 1 playlist de variante (vidéo, audio, sous-titres)
+    # problèmes : [(code, détails)] → message t(f"verify_{code}") côté parent
+    report: Dict[str, Any] = {"playlist": playlist, "problems": [], "peak": 0, "average": 0, "frame_rate": None,
+                              "video_codec": None, "audio_codecs": []}
+    problems = report["problems"]
+    path = Path(playlist)
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError as e:
+        problems.append(("unreadable", {"seg": path.name, "err": e.strerror or e}))
+        return report
+    entries: List[Tuple[str, float, Optional[Tuple[int, int]], Optional[Tuple[str, Optional[Tuple[int, int]]]]]] = []
+    target, ended, dur, byterange, init = None, False, None, None, None
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            target = int(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MAP:"):
+            uri = re.search(r'URI="([^"]+)"', line).group(1)
+            rng = re.search(r'BYTERANGE="(\d+)@(\d+)"', line)
+            init = (uri, (int(rng.group(2)), int(rng.group(1))) if rng else None)
+        elif line.startswith("#EXTINF:"):
+            dur = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-BYTERANGE:"):
+            length, _, at = line.split(":", 1)[1].partition("@")
+            byterange = (int(at or 0), int(length))
+        elif line == "#EXT-X-ENDLIST":
+            ended = True
+        elif line and not line.startswith("#") and dur is not None:
+            entries.append((line, dur, byterange, init))
+            dur, byterange = None, None
+    if not ended:
+        problems.append(("incomplete", {}))
+    if not entries:
+        problems.append(("empty", {}))
+        return report
+
+    sizes: List[Tuple[float, int]] = []
+    too_long: List[Tuple[str, float]] = []
+    no_key: List[str] = []
+    tracks: Dict[Tuple[str, Optional[Tuple[int, int]]], Dict[int, Tuple[bytes, int]]] = {}
+    with ExitStack() as stack:
+        maps: Dict[str, Any] = {}
+
+        def mapped(name: str):
+            # 1 mmap par fichier (CMAF : tous les segments d'une variante dans le même) ; None si absent ou vide
+            if name not in maps:
+                try:
+                    f = stack.enter_context((path.parent / name).open("rb"))
+                    maps[name] = stack.enter_context(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+                except (OSError, ValueError):
+                    maps[name] = None
+            return maps[name]
+
+        for k, (uri, dur, rng, init) in enumerate(entries):
+            label = f"{uri}@{rng[0]}" if rng else uri
+            if dur > seg_dur + 0.5:  # EXTINF arrondi au-delà de SEG_DUR
+                too_long.append((label, dur))
+            mm = mapped(uri)
+            start, length = rng if rng else (0, len(mm) if mm is not None else 0)
+            if mm is None or not length or start + length > len(mm):
+                problems.append(("missing", {"seg": label}))
+                continue
+            sizes.append((dur, length))
+            if uri.endswith(".vtt"):
+                continue
+            try:
+                if uri.endswith(".ts"):
+                    key, frames = ts_segment_info(mm, start, start + length, count_frames=k == 0)
+                    if k == 0:
+                        head = mm[start:start + min(length, TS_PACKET * 4096)]
+                        report["video_codec"] = ts_video_codec(head)
+                        report["audio_codecs"] = [c for c in [ts_audio_codec(head)] if c]
+                else:
+                    init_mm = mapped(init[0]) if init else None
+                    if init_mm is None:
+                        problems.append(("missing", {"seg": init[0] if init else "EXT-X-MAP"}))
+                        continue
+                    if init not in tracks:
+                        i0, il = init[1] if init[1] else (0, len(init_mm))
+                        head = init_mm[i0:i0 + min(il, 1 << 20)]
+                        tracks[init] = mp4_tracks(head)
+                        if k == 0:
+                            report["video_codec"] = fmp4_video_codec(head)
+                            report["audio_codecs"] = [c for c in [fmp4_audio_codec(head)] if c]
+                    video = next(((tid, flags) for tid, (kind, flags) in tracks[init].items() if kind == b"vide"), None)
+                    key, frames = fmp4_segment_info(mm, start, start + length, *video) if video else (None, 0)
+            except (ValueError, IndexError) as e:
+                problems.append(("corrupt", {"seg": label, "err": e}))
+                continue
+            if key is False:
+                no_key.append(label)
+            if k == 0 and frames and dur:
+                report["frame_rate"] = round(frames / dur, 3)
+    if too_long:
+        problems.append(("too_long", {"count": len(too_long), "seg": too_long[0][0], "dur": too_long[0][1], "max": seg_dur}))
+    if no_key:
+        problems.append(("no_keyframe", {"count": len(no_key), "seg": no_key[0]}))
+    longest = max(d for _u, d, _r, _i in entries)
+    if target is not None and round(longest) > target:
+        problems.append(("target", {"target": target, "dur": longest}))
+    if sizes:
+        total = sum(d for d, _n in sizes)
+        report["peak"] = peak_window(sizes, target or seg_dur)
+        report["average"] = int(math.ceil(sum(n * 8 for _d, n in sizes) / total)) if total else 0
+    return report
+
+def master_playlists(title_dir: Path) -> List[str]:
+    # Playlists référencées par le master (STREAM-INF + EXT-X-MEDIA) : ce qu'un lecteur peut réellement demander
+    uris: List[str] = []
+    lines = (title_dir / "master.m3u8").read_text(encoding="utf-8").splitlines()
+    for k, line in enumerate(lines):
+        if line.startswith("#EXT-X-STREAM-INF:") and k + 1 < len(lines):
+            uris.append(lines[k + 1].strip())
+        elif line.startswith("#EXT-X-MEDIA:"):
+            uri = re.search(r'URI="([^"]+)"', line)
+            if uri:
+                uris.append(uri.group(1))
+    return list(dict.fromkeys(uris))
+
+def _attrs(text: str) -> Dict[str, str]:
+    return dict(re.findall(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)', text))
+
+def rewrite_master(title_dir: Path, reports: Dict[str, Dict[str, Any]]) -> bool:
+    # Valeurs mesurées reportées sur le master existant (reports : URI de playlist → rapport) ; le reste est conservé tel quel
+    # BANDWIDTH / AVERAGE-BANDWIDTH = variante + rendition audio la plus lourde du groupe (RFC 8216 §4.3.4.2)
+    master_path = title_dir / "master.m3u8"
+    text = master_path.read_text(encoding="utf-8")
+    lines = text.splitlines()
+    groups: Dict[str, List[Dict[str, Any]]] = {}
+    for line in lines:
+        if line.startswith("#EXT-X-MEDIA:"):
+            a = _attrs(line.split(":", 1)[1])
+            rep = reports.get(a.get("URI", "").strip('"'))
+            if a.get("TYPE") == "AUDIO" and rep:
+                groups.setdefault(a.get("GROUP-ID", "").strip('"'), []).append(rep)
+    out: List[str] = []
+    for k, line in enumerate(lines):
+        head, _, rest = line.partition(":")
+        if head == "#EXT-X-STREAM-INF" and k + 1 < len(lines) and reports.get(lines[k + 1].strip(), {}).get("peak"):
+            a = _attrs(rest)
+            video = reports[lines[k + 1].strip()]
+            audio = groups.get(a.get("AUDIO", "").strip('"'), [])
+            a["BANDWIDTH"] = str(video["peak"] + max((r["peak"] for r in audio), default=0))
+            a["AVERAGE-BANDWIDTH"] = str(video["average"] + max((r["average"] for r in audio), default=0))
+            if video["frame_rate"]:
+                a["FRAME-RATE"] = f"{video['frame_rate']:.3f}"
+            if video["video_codec"]:
+                codecs = [video["video_codec"], *video["audio_codecs"], *(c for r in audio for c in r["audio_codecs"])]
+                a["CODECS"] = f'"{",".join(dict.fromkeys(codecs))}"'
+            line = f"{head}:{','.join(f'{n}={a[n]}' for n in sorted(a, key=lambda n: VERIFY_ORDER.index(n) if n in VERIFY_ORDER else len(VERIFY_ORDER)))}"
+        elif head == "#EXT-X-I-FRAME-STREAM-INF" and "CODECS=" not in rest:
+            a = _attrs(rest)
+            video = reports.get(a.get("URI", "").strip('"').replace(IFRAME_SUFFIX, ".m3u8"), {})
+            if video.get("video_codec"):
+                codec_attr = f'CODECS="{video["video_codec"]}",'
+                line = f"{head}:{rest.replace('URI=', codec_attr + 'URI=', 1)}"
+        out.append(line)
+    new = "\n".join(out) + "\n"
+    if new == text:
+        return False
+    tmp = master_path.with_suffix(".tmp")
+    tmp.write_text(new, encoding="utf-8")
+    os.replace(tmp, master_path)
+    return True
+
+def verify_workers() -> int:
+    return (os.cpu_count() or 1) if VERIFY_WORKERS is None else VERIFY_WORKERS
+
+def verify_pool() -> Optional[ProcessPoolExecutor]:
+    # Pool partagé par toute l'exécution (créé au 1ᵉʳ besoin) ; spawn : pas de fork d'un processus à threads (superviseur, encodages)
+    global _verify_pool
+    workers = verify_workers()
+    with _verify_pool_lock:
+        if _verify_pool is None and workers > 0:
+            try:
+                _verify_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            except (OSError, NotImplementedError):
+                return None
+        return _verify_pool
+
+def verify_titles(title_dirs: List[Path], rewrite: bool = True) -> Tuple[Dict[Path, List[Tuple[str, str, Dict[str, Any]]]], int]:
+    # Playlists de tous les titres réparties sur le pool ; masters réécrits avec les valeurs mesurées
+    # → ({titre : [(playlist, code, détails)]} (titres sans problème absents), playlists vérifiées)
+    jobs: List[Tuple[Path, str]] = []
+    found: Dict[Path, List[Tuple[str, str, Dict[str, Any]]]] = {}
+    for d in title_dirs:
+        try:
+            jobs += [(d, uri) for uri in master_playlists(d)]
+        except OSError as e:
+            found.setdefault(d, []).append(("master.m3u8", "unreadable", {"seg": "master.m3u8", "err": e.strerror or e}))
+    paths = [str(d / uri) for d, uri in jobs]
+    pool = verify_pool()
+    try:
+        if pool:
+            # lots de playlists par aller-retour : un catalogue de milliers de titres ne paie pas un échange par playlist
+            results = list(pool.map(verify_playlist, paths, [SEG_DUR] * len(paths), chunksize=max(1, len(paths) // (8 * verify_workers()))))
+        else:
+            results = [verify_playlist(p, SEG_DUR) for p in paths]
+    except BrokenProcessPool:
+        results = [verify_playlist(p, SEG_DUR) for p in paths]
+    by_title: Dict[Path, Dict[str, Dict[str, Any]]] = {}
+    for (d, uri), rep in zip(jobs, results):
+        by_title.setdefault(d, {})[uri] = rep
+        for code, details in rep["problems"]:
+            found.setdefault(d, []).append((uri, code, details))
+    if rewrite:
+        for d, reports in by_title.items():
+            try:
+                rewrite_master(d, reports)
+            except OSError as e:
+                found.setdefault(d, []).append(("master.m3u8", "unreadable", {"seg": "master.m3u8", "err": e.strerror or e}))
+    return found, len(paths)
+
+def log_verify_problems(found: Dict[Path, List[Tuple[str, str, Dict[str, Any]]]]):
+    for d, items in found.items():
+        for uri, code, details in items:
+            log_warn(t("verify_problem", title=d.name, playlist=uri, what=t(f"verify_{code}", **details)))
+
+def verify_catalog(root: Path) -> int:
+    # --verify : tous les titres (dossiers avec un master.m3u8) sous root, masters réécrits ; code 1 au moindre problème
+    t0 = time.monotonic()
+    titles = sorted(m.parent for m in root.rglob("master.m3u8")
+                    if not any(part.startswith(".") for part in m.relative_to(root).parts))
+    found, playlists = verify_titles(titles)
+    log_verify_problems(found)
+    log_info(t("verify_done", titles=len(titles), playlists=playlists, problems=sum(len(v) for v in found.values()),
+               secs=f"{time.monotonic() - t0:.1f}"))
+    return EXIT_FAILED if found else EXIT_OK
+
+# ==========================
+# RENDER (UI)
+# ==========================
+
+class ProgressTask:
+    def __init__(self, task_id: int, description: str, total: Optional[float], fields: Dict[str, Any]):
+        self.id = task_id
+        self.description = description
+        self.total = total
+        self.completed = 0.0
+        self.fields = fields
+        self.start_time: Optional[float] = time.monotonic()
+        self.stop_time: Optional[float] = None
+
+class ProgressBus:
+    # Même interface que rich.progress.Progress (sous-ensemble utilisé par le pipeline) : l'état des tâches est tenu ici,
+    # chaque changement est diffusé aux sinks (barres Rich, JSON lines, métriques) dans le thread qui l'a produit
+    # (étiquettes de métriques du job conservées) ; sans sink → suivi seul. Un sink qui lève est retiré, l'encodage continue
+    def __init__(self, sinks: Optional[List[Any]] = None):
+        self.tasks: List[ProgressTask] = []
+        self.sinks: List[Any] = list(sinks or [])
+        self._lock = threading.Lock()
+
+    def add_task(self, description: str, total: Optional[float] = 100.0, completed: float = 0, **fields) -> int:
+        with self._lock:
+            task = ProgressTask(len(self.tasks), description, total, fields)
+            task.completed = completed
+            self.tasks.append(task)
+        self.publish("task_start", task)
+        return task.id
+
+    def update(self, task_id: int, *, total: Optional[float] = None, completed: Optional[float] = None,
+               advance: Optional[float] = None, description: Optional[str] = None, **_kw):
+        task = self.tasks[task_id]
+        with self._lock:
+            if total is not None:
+                task.total = total
+            if completed is not None:
+                task.completed = completed
+            if advance is not None:
+                task.completed += advance
+            if description is not None:
+                task.description = description
+        self.publish("progress", task)
+
+    def reset(self, task_id: int, total: Optional[float] = None, **_kw):
+        task = self.tasks[task_id]
+        with self._lock:
+            task.completed = 0.0
+            task.total = total if total is not None else task.total
+            task.start_time, task.stop_time = time.monotonic(), None
+        self.publish("task_reset", task)
+
+    def stop_task(self, task_id: int):
+        task = self.tasks[task_id]
+        with self._lock:
+            task.stop_time = time.monotonic()
+        self.publish("task_end", task)
+
+    def stats(self, task_ids: List, stats: Dict[str, Any], key: Any = None):
+        # Bloc -progress d'un ffmpeg (key : ce ffmpeg) ; mêmes ticks que les barres
+        self.publish("ffmpeg_stats", self.tasks[task_ids[0]] if task_ids else None, stats=stats, key=key)
+
+    def publish(self, event: str, task: Optional[ProgressTask], **extra):
+        for sink in list(self.sinks):
+            try:
+                sink.handle(event, task, **extra)
+            except Exception as e:
+                with self._lock:
+                    if sink not in self.sinks:
+                        continue
+                    self.sinks.remove(sink)
+                log_warn(t("sink_failed", sink=type(sink).__name__, error=e))
+
+class JsonSink:
+    # --headless : avancement d'une tâche en JSON lines au plus toutes les JSON_PROGRESS_INTERVAL s, puis sa fin
+    def __init__(self):
+        self.last: Dict[int, float] = {}
+        self.lock = threading.Lock()
+
+    def handle(self, event: str, task: Optional[ProgressTask], **_extra):
+        if event == "progress":
+            now = time.monotonic()
+            with self.lock:
+                if now - self.last.get(task.id, 0.0) < JSON_PROGRESS_INTERVAL:
+                    return
+                self.last[task.id] = now
+        elif event != "task_end":
+            return
+        desc = re.sub(r"\[/?[a-z ]*\]", "", task.description)
+        speed = re.search(r"@\s*([\d.]+)x", desc)
+        json_line(event, **task.fields, task=desc.split(" @ ")[0].strip(), done=round(task.completed, 2),
+                  total=task.total, speed=float(speed.group(1)) if speed else None)
+
+class MetricsSink:
+    # Stats -progress d'un ffmpeg en cours → événement "ffmpeg_progress", au plus toutes les METRICS_PROGRESS_INTERVAL s par ffmpeg
+    def __init__(self):
+        self.last: "OrderedDict[Any, float]" = OrderedDict()  # ffmpeg → dernière écriture (borné : ffmpeg récents seulement)
+        self.lock = threading.Lock()
+
+    def handle(self, event: str, task: Optional[ProgressTask], stats: Optional[Dict[str, Any]] = None,
+               key: Any = None, **_extra):
+        if event != "ffmpeg_stats":
+            return
+        now = time.perf_counter()
+        with self.lock:
+            if key not in self.last:
+                self.last[key] = now  # 1er bloc : comme avant, première écriture après un intervalle complet
+                due = False
+            else:
+                due = now - self.last[key] >= METRICS_PROGRESS_INTERVAL
+                if due:
+                    self.last[key] = now
+            self.last.move_to_end(key)
+            while len(self.last) > 256:
+                self.last.popitem(last=False)
+        if due:
+            emit("ffmpeg_progress", **stats)
+
+class RichSink:
+    # Barres Rich : tâches en cours + les UI_DONE_BARS dernières terminées ; les plus anciennes sont retirées
+    # → le panneau (et son rendu) reste de taille bornée quelle que soit la longueur de la file
+    def __init__(self, progress: Progress):
+        self.progress = progress
+        self.ids: Dict[int, Any] = {}  # tâche du bus → tâche Rich
+        self.finished: deque = deque()
+        self.lock = threading.Lock()
+
+    def handle(self, event: str, task: Optional[ProgressTask], **_extra):
+        if task is None:
+            return
+        if event == "task_start":
+            rid = self.progress.add_task(task.description, total=task.total, completed=task.completed)
+            with self.lock:
+                self.ids[task.id] = rid
+            return
+        with self.lock:
+            rid = self.ids.get(task.id)
+        if rid is None:
+            return
+        if event == "progress":
+            self.progress.update(rid, total=task.total, completed=task.completed, description=task.description)
+        elif event == "task_reset":
+            self.progress.reset(rid, total=task.total)
+        elif event == "task_end":
+            self.progress.stop_task(rid)
+            with self.lock:
+                if task.id in self.finished:
+                    return
+                self.finished.append(task.id)
+                evicted = []
+                while len(self.finished) > max(0, UI_DONE_BARS):
+                    evicted.append(self.ids.pop(self.finished.popleft(), None))
+            for old in evicted:
+                if old is not None:
+                    self.progress.remove_task(old)
+
+class FileState(dict):
+    # État d'un fichier de la file (dict) : chaque affectation signale la ligne au tableau → seules les lignes changées sont refaites
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_change: Optional[Callable[[], None]] = None
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        if self.on_change:
+            self.on_change()
+
+class FilesView:
+    # Tableau de la file en fenêtre : derniers terminés, fichiers en cours, suivants en attente — UI_QUEUE_ROWS lignes au plus,
+    # le reste résumé par des compteurs tenus au fil des changements. Coût d'un rafraîchissement : lignes modifiées + fenêtre,
+    # indépendant de la taille de la file (seuls les fichiers nouveaux sont parcourus, une fois)
+    def __init__(self, file_states: List[Dict]):
+        self.file_states = file_states
+        self.known = 0                               # fichiers déjà suivis (la file peut grandir : --watch, --worker)
+        self.rows: Dict[int, Tuple[str, ...]] = {}   # position → cellules formatées
+        self.kind: Dict[int, str] = {}               # position → "queued" | "running" | "done" | "error"
+        self.counts = {"queued": 0, "running": 0, "done": 0, "error": 0}
+        self.running: set = set()
+        self.queued: List[int] = []                  # tas des positions en attente (entrées périmées ignorées à la lecture)
+        self.finished: deque = deque(maxlen=max(1, UI_QUEUE_ROWS))
+        self.dirty: set = set()
+        self.lock = threading.Lock()
+
+    def _mark(self, pos: int):
+        with self.lock:
+            self.dirty.add(pos)
+
+    def _update_row(self, pos: int):
+        st = self.file_states[pos]
+        dur = f"{st['duration']:.1f}s" if st["duration"] else "-"
+        langs = ", ".join(st["langs"]) if st["langs"] else "–"
+        self.rows[pos] = (str(st["idx"]), st["name"], dur, langs, st["status"])
+        if st["exit"] is not None:
+            kind = "done" if st["exit"] == EXIT_OK else "error"
+        else:
+            kind = "running" if st.get("started") else "queued"
+        prev = self.kind.get(pos)
+        if kind == prev:
+            return
+        if prev:
+            self.counts[prev] -= 1
+        self.counts[kind] += 1
+        self.kind[pos] = kind
+        self.running.discard(pos)
+        if kind == "running":
+            self.running.add(pos)
+        elif kind == "queued":
+            heapq.heappush(self.queued, pos)
+        else:
+            self.finished.append(pos)
+
+    def _next_queued(self, n: int) -> List[int]:
+        # n premières positions encore en attente ; les périmées (parties en cours/terminées) quittent le tas pour de bon
+        out: List[int] = []
+        while self.queued and len(out) < n:
+            pos = heapq.heappop(self.queued)
+            if self.kind.get(pos) == "queued" and pos not in out:
+                out.append(pos)
+        for pos in out:
+            heapq.heappush(self.queued, pos)
+        return out
+
+    def table(self) -> Table:
+        from rich import box
+        from rich.table import Table
+        with self.lock:
+            for pos in range(self.known, len(self.file_states)):
+                st = self.file_states[pos]
+                st.on_change = partial(self._mark, pos)
+                self.dirty.add(pos)
+            self.known = len(self.file_states)
+            dirty, self.dirty = self.dirty, set()
+        for pos in dirty:
+            self._update_row(pos)
+
+        limit = max(1, UI_QUEUE_ROWS)
+        running = sorted(self.running)[:limit]
+        room = limit - len(running)
+        queued = self._next_queued(room - min(len(self.finished), room // 2))
+        n_done = min(len(self.finished), room - len(queued))
+        shown = (list(self.finished)[-n_done:] if n_done else []) + running + queued
+
+        table = Table(title=t("files_title"), box=box.SIMPLE_HEAVY,
+                      caption=t("queue_summary", total=self.known, running=self.counts["running"],
+                                queued=self.counts["queued"], done=self.counts["done"], errors=self.counts["error"],
+                                hidden=self.known - len(shown)))
+        table.add_column(t("col_num"), justify="right", style="bold")
+        table.add_column(t("col_file"), overflow="fold")
+        table.add_column(t("col_dur"))
+        table.add_column(t("col_langs"))
+        table.add_column(t("col_status"), justify="center")
+        for pos in shown:
+            table.add_row(*self.rows[pos])
+        return table
+
+def build_layout(files_table: Table, progress: Progress) -> Group:
+    from rich.console import Group
+    from rich.panel import Panel
+    return Group(
+        Panel(files_table, title="Files", border_style="title"),
+        Panel(progress, title="Progress", border_style="title"),
+    )
+
+# ==========================
+# MAIN PIPELINE
+# ==========================
+
+@lru_cache(maxsize=1)
+def check_encoder_backend() -> Tuple[str, bool]:
+    with stage("capabilities"):
+        backend = resolve_backend()
+        hw_scale = backend is not None and bool(ENCODER_BACKENDS[backend].get("hw_scale")) and backend_hw_scale_available(backend)
+    if backend is None:
+        if VIDEO_BACKEND in ("auto", "nvenc"):
+            raise RuntimeError(t("nvenc_missing"))
+        raise RuntimeError(t("encoder_missing", encoder=ENCODER_BACKENDS.get(VIDEO_BACKEND, {}).get("encoder", VIDEO_BACKEND)))
+    log_info(t("encoder_backend", backend=backend, encoder=ENCODER_BACKENDS[backend]["encoder"]))
+    if not ENCODER_BACKENDS[backend].get("hw_scale"):
+        return backend, False
+    if hw_scale:
+        log_info(t("cuda_filters_on"))
+    elif SOFT_SCALE_IF_NEEDED:
+        log_warn(t("cuda_filters_off"))
+    else:
+        raise RuntimeError(t("cuda_filters_required"))
+    return backend, hw_scale
+
+def convert_one_file(src: Path, out_root: Path, progress: Progress, file_states: List[Dict], state_idx: int, mode: str,
+                     probe: Optional[Dict[str, Any]] = None, only: Optional[List[str]] = None):
+    # Fichier entier chronométré (étape "file") ; compteur par résultat final
+    # only : variantes à produire (noms de résolution, "audio") sans master ni suppression de la source — job distribué
+    stager = source_stager()
+    if stager:
+        stager.acquire(src)
+    try:
+        file_states[state_idx]["started"] = True
+        with stage("file", job=src.stem, mode=mode) as outcome:
+            _convert_one_file(src, out_root, progress, file_states, state_idx, mode, probe, only)
+            outcome["result"] = "ok" if file_states[state_idx]["status"] == "done" else "error"
+    finally:
+        st = file_states[state_idx]
+        st["exit"] = EXIT_OK if st["status"] == "done" else EXIT_PARTIAL if st.get("master") else EXIT_FAILED
+        if stager:
+            stager.release(src, success=st["exit"] == EXIT_OK)
+        if metrics_enabled():
+            prom_add("files_total", 1, result="ok" if st["exit"] == EXIT_OK else "error")
+            write_prom()
+        if HEADLESS:
+            json_line("file", job=src.stem, path=str(src), status=st["status"], exit=st["exit"], rungs=st.get("rungs", {}))
+
+def delete_source(src: Path):
+    # DELETE_SOURCE : MKV supprimé une fois sa sortie en place (échec signalé, sans arrêter le batch)
+    try:
+        src.unlink()
+        log_warn(t("source_deleted", path=src))
+    except Exception as e:
+        log_warn(t("source_delete_failed", path=src, err=e))
+
+def _convert_one_file(src: Path, out_root: Path, progress: Progress, file_states: List[Dict], state_idx: int, mode: str,
+                      probe: Optional[Dict[str, Any]] = None, only: Optional[List[str]] = None):
+    probe = probe or probe_source(src)
+    fps, duration = probe["fps"], probe["duration"]
+
+    audio_map = probe["audio_map"]
+    audio_langs_ordered = [lang for (_pos, lang) in audio_map]
+
+    gop = max(1, int(round(fps * GOP_SECONDS)))
+
+    file_states[state_idx]["duration"] = duration
+    file_states[state_idx]["langs"] = audio_langs_ordered
+    file_states[state_idx]["status"] = t("pending")
+
+    base_name = src.stem
+    # pub_dir : arbre publié (journal, variantes terminées, master) ; work_dir : encodage en cours (scratch si SCRATCH_DIR)
+    pub_dir = out_root / base_name
+    work_dir = Path(SCRATCH_DIR) / base_name if SCRATCH_DIR and not PROGRESSIVE else pub_dir
+    pub_dir.mkdir(exist_ok=True)
+    work_dir.mkdir(parents=True, exist_ok=True)
+
+    # Échelle adaptée à la source : pas d'upscale, débits plafonnés, copie de ce qui convient déjà
+    plan = plan_ladder(src, probe, mode)
+    ladder = plan["rungs"]
+    summary = describe_plan(plan)
+    if summary:
+        log_info(t("ladder_plan", name=base_name, plan=summary))
+    if plan["skipped"]:
+        log_warn(t("rungs_skipped", name=base_name, res=", ".join(plan["skipped"])))
+    for r, _, _, _ in ladder:
+        (work_dir / r).mkdir(exist_ok=True)
+    shared_audio = SHARED_AUDIO and bool(audio_map)
+    audio_names = audio_rendition_names(audio_map) if shared_audio else []
+    audio_kbps = audio_peak_kbps(probe["info"], audio_map, plan["audio_copy"])
+    for a_name in audio_names:
+        (work_dir / a_name).mkdir(exist_ok=True)
+
+    # Backend d'encodage + scale matériel (détectés une seule fois par process)
+    backend, hw_scale = check_encoder_backend()
+
+    # Journal : variantes terminées (mêmes réglages, même source) sautées, interrompues reprises, le reste repart de zéro
+    source_fp = source_fingerprint(src)
+    variant_settings = {r[0]: rung_settings(r, mode, rung_backend(plan, r[0]), [] if shared_audio else audio_map, plan) for r in ladder}
+    variant_settings.update({a_name: audio_settings(audio_map, mode, plan) for a_name in audio_names})
+    # Sous-ensemble demandé : les autres variantes (peut-être en cours sur un autre worker) ne sont pas touchées
+    wanted = {n for n in variant_settings if only is None or n in only or (n in audio_names and "audio" in only)}
+    want_audio = bool(audio_names) and audio_names[0] in wanted
+
+    def up_to_date(name: str) -> bool:
+        entry = journal_read(pub_dir, name) or {}
+        return (entry.get("state") == "done" and entry.get("settings") == variant_settings[name] and entry.get("source") == source_fp
+                and playlist_complete(pub_dir / name / f"{name}.m3u8"))
+
+    # Même contenu déjà converti avec les mêmes réglages (autre nom, autre chemin) : sortie liée depuis le cache, sans ffmpeg
+    dedup_key = dedup_cache_key(src, mode, variant_settings, probe) if DEDUP_CACHE and only is None else None
+    if dedup_key and not ((pub_dir / "master.m3u8").is_file() and all(up_to_date(n) for n in variant_settings)):
+        if dedup_restore(dedup_key, out_root, base_name, source_fp):
+            log_ok(t("dedup_hit", name=base_name))
+            file_states[state_idx]["rungs"] = {n: EXIT_OK for n in variant_settings}
+            file_states[state_idx]["master"] = True
+            file_states[state_idx]["status"] = "done"
+            if work_dir != pub_dir:
+                shutil.rmtree(work_dir, ignore_errors=True)
+            if DELETE_SOURCE:
+                delete_source(src)
+            return
+
+    def reset_variant(name: str):
+        shutil.rmtree(work_dir / name, ignore_errors=True)
+        (work_dir / name).mkdir()
+
+    def mark_done(name: str):
+        journal_write(pub_dir, name, {"state": "done", "settings": variant_settings[name], "source": source_fp})
+
+    def publish(name: str) -> bool:
+        try:
+            publish_variant(work_dir, pub_dir, name)
+        except OSError as e:
+            log_err(t("publish_failed", name=base_name, res=name, err=e))
+            return False
+        mark_done(name)
+        return True
+
+    def journal_progress(names: List[str], mirror: Optional[List[str]] = None) -> Callable[[], None]:
+        # Segments terminés consignés au fil de l'encodage (écriture seulement quand le compte change)
+        # mirror : variantes d'un ffmpeg multi-sorties dont l'index.m3u8 est recopiée pour le master (PROGRESSIVE)
+        seen: Dict[str, int] = {}
+
+        def tick():
+            for name in mirror or []:
+                mirror_playlist(work_dir / name, name)
+            for name in names:
+                n = len(partial_segments(work_dir / name, name))
+                if n and n != seen.get(name):
+                    seen[name] = n
+                    journal_write(pub_dir, name, {"state": "running", "settings": variant_settings[name], "source": source_fp,
+                                                  "segments_done": n})
+        return tick
+
+    reused: List[str] = []
+    partials: Dict[str, List[Tuple[float, str]]] = {}
+    for name, key in variant_settings.items():
+        if name not in wanted:
+            continue
+        entry = journal_read(pub_dir, name) or {}
+        same = entry.get("settings") == key and entry.get("source") == source_fp
+        if same and up_to_date(name):
+            reused.append(name)
+            continue
+        segments = partial_segments(work_dir / name, name) if same and name not in audio_names and not single_file(mode) else []
+        if segments:
+            partials[name] = segments
+        else:
+            reset_variant(name)
+        journal_write(pub_dir, name, {"state": "running", "settings": key, "source": source_fp})
+    if want_audio and not all(a_name in reused for a_name in audio_names):
+        # Audio partagé : toutes les pistes sortent du même ffmpeg → refaites ensemble
+        for a_name in audio_names:
+            if a_name in reused:
+                reused.remove(a_name)
+                reset_variant(a_name)
+
+    # Trickplay : planches tirées de la 1ʳᵉ passe complète de ce fichier (repli : décodage seul), journalisées à part
+    tp_size = trickplay_size(probe) if TRICKPLAY else (0, 0)
+    tp_dir = work_dir / TRICKPLAY_DIR
+    want_tp = TRICKPLAY and bool(ladder) and (only is None or ladder[0][0] in only)
+    tp_key = trickplay_settings(tp_size)
+    tp_entry = (journal_read(pub_dir, TRICKPLAY_DIR) or {}) if want_tp else {}
+    tp_ok = not want_tp or (tp_entry.get("state") == "done" and tp_entry.get("settings") == tp_key
+                            and tp_entry.get("source") == source_fp and (pub_dir / TRICKPLAY_DIR / TRICKPLAY_VTT).is_file())
+
+    # Sous-titres texte : extraits par la même passe complète (repli : lecture à part, sans décodage vidéo), journalisés à part
+    sub_map = probe.get("subtitle_map", [])
+    sub_names = subtitle_rendition_names(sub_map)
+    sub_forced = forced_subtitles(probe["info"])
+    sub_keys = {s_name: subtitle_settings(pos, lang, mode) for s_name, (pos, lang) in zip(sub_names, sub_map)}
+    want_subs = bool(sub_map) and bool(ladder) and (only is None or ladder[0][0] in only)
+
+    def sub_reusable(s_name: str) -> bool:
+        entry = journal_read(pub_dir, s_name) or {}
+        return (entry.get("state") == "done" and entry.get("settings") == sub_keys[s_name] and entry.get("source") == source_fp
+                and playlist_complete(pub_dir / s_name / f"{s_name}.m3u8"))
+    subs_ok = not want_subs or all(sub_reusable(s_name) for s_name in sub_names)
+
+    # Task globale
+    # (sous verrou : les barres d'un même fichier restent groupées quand plusieurs fichiers démarrent en même temps)
+    total_for_all_res = duration * sum(1 for r in ladder if r[0] in wanted)
+    with _tasks_lock:
+        task_overall = progress.add_task(f"[white]{t('file_task')}[/] {base_name}", total=total_for_all_res, job=base_name, rung=None)
+        rung_tasks = {res_name: progress.add_task(f"[white]{res_name}", total=duration, job=base_name, rung=res_name)
+                      for res_name, _, _, _ in ladder if res_name in wanted}
+        task_audio = progress.add_task("[white]audio", total=duration, job=base_name, rung="audio") if want_audio else None
+        task_tp = progress.add_task("[white]trickplay", total=duration, job=base_name, rung="trickplay") if not tp_ok else None
+        task_subs = progress.add_task("[white]subtitles", total=duration, job=base_name, rung="subtitles") if not subs_ok else None
+
+    ok_rendus: List[Tuple[str, str, int]] = []  # (res_name, res_master, bitrate)
+
+    status_lock = threading.Lock()
+
+    def trickplay_spec() -> Optional[Tuple[Path, Tuple[int, int]]]:
+        # Planches à ajouter à une passe complète (dossier vidé avant chaque tentative)
+        if tp_ok:
+            return None
+        shutil.rmtree(tp_dir, ignore_errors=True)
+        tp_dir.mkdir(parents=True)
+        return tp_dir, tp_size
+
+    def trickplay_done() -> bool:
+        nonlocal tp_ok
+        if not finalize_trickplay(tp_dir, tp_size, duration):
+            return False
+        try:
+            publish_variant(work_dir, pub_dir, TRICKPLAY_DIR)
+        except OSError as e:
+            log_err(t("publish_failed", name=base_name, res=TRICKPLAY_DIR, err=e))
+            return False
+        journal_write(pub_dir, TRICKPLAY_DIR, {"state": "done", "settings": tp_key, "source": source_fp})
+        tp_ok = True
+        progress.update(task_tp, completed=duration)
+        progress.stop_task(task_tp)
+        return True
+
+    def subtitles_spec() -> Optional[List[Tuple[int, Path]]]:
+        # Pistes à extraire par une passe complète : (pos, <work>/sub_xx/sub_xx.vtt)
+        if subs_ok:
+            return None
+        for s_name in sub_names:
+            reset_variant(s_name)
+        return [(pos, work_dir / s_name / f"{s_name}.vtt") for s_name, (pos, _lang) in zip(sub_names, sub_map)]
+
+    def subtitles_done(video_dir: Path) -> bool:
+        # WebVTT complets → segments + playlists, calés (TS) sur le PTS de la 1ʳᵉ image d'une résolution terminée
+        nonlocal subs_ok
+        try:
+            mpegts = None
+            if mode == "ts":
+                segments = read_media_playlist(video_dir / f"{video_dir.name}.m3u8")[0]
+                mpegts = ts_first_pts(video_dir / segments[0][1]) if segments else None
+            for s_name in sub_names:
+                segment_webvtt(work_dir / s_name, s_name, duration, mpegts)
+                publish_variant(work_dir, pub_dir, s_name)
+                journal_write(pub_dir, s_name, {"state": "done", "settings": sub_keys[s_name], "source": source_fp})
+        except (OSError, ValueError, AttributeError) as e:
+            log_warn(t("subtitles_failed", name=base_name, err=e))
+            return False
+        subs_ok = True
+        progress.update(task_subs, completed=duration)
+        progress.stop_task(task_subs)
+        return True
+
+    def iframes(variant_dir: Path, res_name: str):
+        # Playlist I-frame calculée sur les segments produits (aucun décodage) ; facultative : un échec n'invalide pas la résolution
+        try:
+            write_iframe_playlist(variant_dir / res_name, res_name)
+        except (OSError, ValueError) as e:
+            log_warn(t("iframes_failed", name=base_name, res=res_name, err=e))
+
+    # PROGRESSIVE : résolutions annoncées dans le master publié avant la fin (celles qui échouent en sont retirées)
+    live_rungs: Optional[List[Tuple[str, str, int]]] = None
+
+    def write_live_master():
+        with stage("master", job=base_name, progressive=True):
+            write_master(pub_dir, live_rungs, audio=list(zip(audio_names, audio_langs_ordered)) if shared_audio else None,
+                         mode=mode, progressive=True, audio_kbps=audio_kbps)
+
+    def rung_failed(res_name: str):
+        file_states[state_idx]["status"] = f"{t('error')} ({res_name})"
+        progress.stop_task(rung_tasks[res_name])
+        with status_lock:
+            if live_rungs and res_name in [r[0] for r in live_rungs]:
+                live_rungs[:] = [r for r in live_rungs if r[0] != res_name]
+                if live_rungs:
+                    write_live_master()
+                else:
+                    (pub_dir / "master.m3u8").unlink(missing_ok=True)
+
+    def withdraw_live(names: List[str], audio: bool = False):
+        # Variante relancée depuis le segment 0 : retirée du master en ligne d'abord (une playlist EVENT annoncée ne fait que grandir) ;
+        # elle revient dans le master final. Audio partagé relancé → master retiré jusqu'au master final
+        with status_lock:
+            if not live_rungs:
+                return
+            kept = [] if audio else [r for r in live_rungs if r[0] not in names]
+            if kept == live_rungs:
+                return
+            live_rungs[:] = kept
+            if live_rungs:
+                write_live_master()
+            else:
+                (pub_dir / "master.m3u8").unlink(missing_ok=True)
+
+    def rung_ok(res_name: str, res_master: str, v_kbps: int, reused: bool = False):
+        if TRICKPLAY and not (reused and (pub_dir / res_name / f"{res_name}{IFRAME_SUFFIX}").is_file()):
+            iframes(pub_dir if reused else work_dir, res_name)
+        if not reused and not publish(res_name):
+            rung_failed(res_name)
+            return
+        progress.update(task_overall, advance=duration)
+        progress.stop_task(rung_tasks[res_name])
+        log_ok(t("ok_variant", name=base_name, res=res_name))
+
+        with status_lock:
+            prev = file_states[state_idx]["status"]
+            file_states[state_idx]["status"] = f"OK ({res_name})" if prev == t("pending") else f"{prev}, {res_name}"
+            ok_rendus.append((res_name, res_master, v_kbps))
+
+    pending = [r for r in ladder if r[0] in wanted]
+    audio_ok = not want_audio
+
+    # Audio partagé (hors décodage unique) : toutes les pistes en un seul passage
+    def encode_audio():
+        nonlocal audio_ok
+        args = build_ffmpeg_audio_cmd(src, work_dir, audio_map, mode, audio_copy=plan["audio_copy"])
+        try:
+            with encoder_slot("audio"), stage("encode_audio", job=base_name, tracks=len(audio_map)):
+                run_ffmpeg_with_progress(args, total_seconds=duration, task_id=task_audio, progress=progress, cwd=work_dir, labels=["audio"],
+                                         on_tick=journal_progress([], mirror=audio_names) if live_rungs else None)
+            for a_name in audio_names:
+                finalize_playlist(work_dir / a_name / LADDER_PLAYLIST, work_dir / a_name / f"{a_name}.m3u8")
+            audio_ok = all([publish(a_name) for a_name in audio_names])
+        except subprocess.CalledProcessError as e:
+            log_err(f"{base_name} [audio]: {e}")
+            log_err(t("audio_failed", name=base_name))
+        if not audio_ok:
+            file_states[state_idx]["status"] = f"{t('error')} (audio)"
+        progress.stop_task(task_audio)
+
+    # Déjà faites lors d'un run précédent
+    for res_name, _scale_str, res_master, v_kbps in [r for r in pending if r[0] in reused]:
+        log_info(t("reused_variant", name=base_name, res=res_name))
+        progress.update(rung_tasks[res_name], completed=duration)
+        rung_ok(res_name, res_master, v_kbps, reused=True)
+    pending = [r for r in pending if r[0] not in reused]
+    if want_audio and all(a_name in reused for a_name in audio_names):
+        audio_ok = True
+        progress.update(task_audio, completed=duration)
+        progress.stop_task(task_audio)
+
+    # Lecture progressive : master posé tout de suite, chaque playlist EVENT servie au fil des segments
+    if PROGRESSIVE and only is None and (pending or not audio_ok):
+        # Sans CODECS (inconnus avant le 1ᵉʳ segment) : H.264 seul annoncé, HEVC/AV1 rejoignent le master final
+        h264_only = [r for r in ladder if plan["codecs"][r[0]] == "h264"] or ladder
+        live_rungs = [(r[0], r[2], r[3]) for r in h264_only]
+        write_live_master()
+
+    # Interrompues : segments terminés conservés, reprise à la dernière frontière de segment commune
+    resumable = [r for r in pending if r[0] in partials]
+    for group in ([resumable] if SINGLE_DECODE else [[r] for r in resumable]):
+        if not group:
+            continue
+        withdraw_live([r[0] for r in group])  # playlists tronquées (ou effacées si la reprise échoue) : hors du master en ligne
+        start, keep = common_resume_point({r[0]: partials[r[0]] for r in group})
+        labels = "/".join(r[0] for r in group)
+        ok = False
+        if start > 0:
+            for res_name, _, _, _ in group:
+                journal_write(pub_dir, res_name, {"state": "resuming", "settings": variant_settings[res_name], "source": source_fp,
+                                                  "resume_at": start, "segments_done": keep[res_name]})
+            log_info(t("resume_variant", name=base_name, res=labels, at=f"{start:.1f}"))
+            ok = resume_rungs(src, work_dir, group, keep, start, gop, [] if shared_audio else audio_map, hw_scale, mode,
+                              duration, [rung_tasks[r[0]] for r in group], progress, base_name, plan=plan)
+        if ok:
+            for res_name, _scale_str, res_master, v_kbps in group:
+                rung_ok(res_name, res_master, v_kbps)
+            pending = [r for r in pending if r not in group]
+        else:
+            for res_name, _, _, _ in group:
+                reset_variant(res_name)
+                progress.reset(rung_tasks[res_name], total=duration)
+
+    # Longues sources : morceaux en parallèle (audio partagé encodé d'un seul tenant pendant ce temps)
+    # (pas en PROGRESSIVE : les morceaux ne donnent une playlist qu'une fois recousus)
+    if CHUNKED_ENCODE and duration >= CHUNK_MIN_DURATION and pending and not single_file(mode) and not live_rungs:
+        with ThreadPoolExecutor(max_workers=1) as audio_pool:
+            audio_fut = audio_pool.submit(encode_audio) if not audio_ok else None
+            chunks_ok = encode_chunked(src, work_dir, pending, gop, [] if shared_audio else audio_map, hw_scale, mode,
+                                       duration, fps, [rung_tasks[r[0]] for r in pending], progress, base_name, plan=plan)
+            if audio_fut is not None:
+                audio_fut.result()
+        if chunks_ok:
+            for res_name, _scale_str, res_master, v_kbps in pending:
+                rung_ok(res_name, res_master, v_kbps)
+            pending = []
+        else:
+            log_warn(t("fallback_unchunked", name=base_name))
+            note_fallback("unchunked", job=base_name)
+            for res_name, _, _, _ in pending:
+                progress.reset(rung_tasks[res_name], total=duration)
+
+    # Décodage unique pour toute l'échelle (repli : encodage par résolution ci-dessous)
+    if SINGLE_DECODE and len(pending) > 1:
+        ladder_audio_map = [] if shared_audio and audio_ok else audio_map
+        ladder_names = [r[0] for r in pending]
+        ladder_audio = shared_audio and not audio_ok  # audio partagé produit par cette passe
+        tp, subs = trickplay_spec(), subtitles_spec()
+        if encode_ladder_single_pass(src, work_dir, pending, gop, ladder_audio_map, hw_scale, mode,
+                                     duration, [rung_tasks[r[0]] for r in pending], progress, base_name,
+                                     shared_audio=shared_audio, plan=plan,
+                                     on_tick=journal_progress([r[0] for r in pending],
+                                                              mirror=[r[0] for r in pending] + audio_names if live_rungs else None),
+                                     trickplay=tp, subtitles=subs,
+                                     on_restart=lambda: withdraw_live(ladder_names, audio=ladder_audio)):
+            if tp:
+                trickplay_done()
+            if subs:
+                subtitles_done(work_dir / pending[0][0])
+            for res_name, _scale_str, res_master, v_kbps in pending:
+                rung_ok(res_name, res_master, v_kbps)
+            pending = []
+            audio_ok = audio_ok or all([publish(a_name) for a_name in audio_names])
+            if task_audio is not None:
+                progress.update(task_audio, completed=duration)
+                progress.stop_task(task_audio)
+        else:
+            log_warn(t("fallback_per_rung", name=base_name))
+            note_fallback("per_rung", job=base_name)
+            withdraw_live(ladder_names, audio=ladder_audio)
+            for res_name, _, _, _ in pending:
+                progress.reset(rung_tasks[res_name], total=duration)
+
+    # Encode par résolution (vidéo seule si audio partagé)
+    rung_audio_map = [] if shared_audio else audio_map
+
+    def encode_rung(res_name: str, scale_str: str, res_master: str, v_kbps: int, side_outputs: bool = False):
+        playlist_out = work_dir / res_name / f"{res_name}.m3u8"
+        segments_out = work_dir / res_name / "%03d.ts"  # remplacé en .m4s si mode=fmp4, media.mp4 si mode=cmaf
+        tp, subs = (trickplay_spec(), subtitles_spec()) if side_outputs else (None, None)
+        backend_r = rung_backend(plan, res_name)
+
+        args = build_ffmpeg_cmd(
+            src=src,
+            out_playlist=playlist_out,
+            out_segments_pattern=segments_out,
+            scale_str=scale_str,
+            v_bitrate_k=v_kbps,
             gop=gop,
-            audio_map=audio_map,
-            use_cuda_scale=cuda_scale,
+            audio_map=rung_audio_map,
+            use_hw_scale=hw_scale,
             mode=mode,
+            backend=backend_r,
+            copy_video=res_name == plan["video_copy"],
+            audio_copy=plan["audio_copy"],
+            trickplay=tp,
+            subtitles=subs,
         )
 
-        task_res = progress.add_task(f"[white]{res_name}", total=duration)
+        task_res = rung_tasks[res_name]
         try:
             # 1) tentative CUDA/NPP
-            run_ffmpeg_with_progress(args, total_seconds=duration, task_id=task_res, progress=progress, cwd=playlist_out.parent)
+            with encoder_slot(backend_r, cpu_scale=not hw_scale), stage("encode", job=base_name, rung=res_name, hw_scale=hw_scale):
+                run_ffmpeg_with_progress(args, total_seconds=duration, task_id=task_res, progress=progress, cwd=playlist_out.parent, labels=[res_name],
+                                         on_tick=journal_progress([res_name]))
         except subprocess.CalledProcessError as e1:
             # 2) fallback CPU si autorisé
             if SOFT_SCALE_IF_NEEDED:
                 log_warn(t("fallback_cpu", name=base_name, res=res_name))
+                note_fallback("cpu_scale", job=base_name, rung=res_name)
+                withdraw_live([res_name])
+                tp, subs = (trickplay_spec(), subtitles_spec()) if side_outputs else (None, None)
                 args_fb = build_ffmpeg_cmd(
                     src=src,
                     out_playlist=playlist_out,
@@ -535,48 +4140,264 @@ def convert_one_file(src: Path, out_root: Path, progress: Progress, file_states:
                     scale_str=scale_str,
                     v_bitrate_k=v_kbps,
                     gop=gop,
-                    audio_map=audio_map,
-                    use_cuda_scale=False,
+                    audio_map=rung_audio_map,
+                    use_hw_scale=False,
                     mode=mode,
+                    backend=backend_r,
+                    copy_video=res_name == plan["video_copy"],
+                    audio_copy=plan["audio_copy"],
+                    trickplay=tp,
+                    subtitles=subs,
                 )
                 try:
-                    run_ffmpeg_with_progress(args_fb, total_seconds=duration, task_id=task_res, progress=progress, cwd=playlist_out.parent)
+                    with encoder_slot(backend_r, cpu_scale=True), stage("encode", job=base_name, rung=res_name, hw_scale=False):
+                        run_ffmpeg_with_progress(args_fb, total_seconds=duration, task_id=task_res, progress=progress, cwd=playlist_out.parent, labels=[res_name],
+                                                 on_tick=journal_progress([res_name]))
                 except subprocess.CalledProcessError as e2:
                     log_err(f"{base_name} [{res_name}]: {e2}")
-                    file_states[state_idx]["status"] = f"{t('error')} ({res_name})"
-                    progress.stop_task(task_res)
-                    continue
+                    rung_failed(res_name)
+                    return
             else:
                 log_err(f"{base_name} [{res_name}]: {e1}")
-                file_states[state_idx]["status"] = f"{t('error')} ({res_name})"
-                progress.stop_task(task_res)
-                continue
+                rung_failed(res_name)
+                return
 
         # Résolution OK
-        progress.update(task_overall, advance=duration)
-        progress.stop_task(task_res)
-        log_ok(t("ok_variant", name=base_name, res=res_name))
+        finalize_playlist(playlist_out)
+        if tp:
+            trickplay_done()
+        if subs:
+            subtitles_done(playlist_out.parent)
+        rung_ok(res_name, res_master, v_kbps)
+
+    # Audio + résolutions en parallèle (le nombre de ffmpeg simultanés est borné par encoder_slot)
+    # (planches, sous-titres : sorties en plus du ffmpeg de la 1ʳᵉ résolution restante)
+    jobs = ([encode_audio] if not audio_ok else []) + [(lambda r=r: encode_rung(*r, side_outputs=r is pending[0])) for r in pending]
+    if jobs:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            for fut in [pool.submit(job) for job in jobs]:
+                fut.result()
+    ok_rendus.sort(key=lambda r: [x[0] for x in ladder].index(r[0]))
 
-        prev = file_states[state_idx]["status"]
-        file_states[state_idx]["status"] = f"OK ({res_name})" if prev == t("pending") else f"{prev}, {res_name}"
-        ok_rendus.append((res_name, res_master, v_kbps))
+    # Planches / sous-titres sans passe complète (reprise, morceaux, tout réutilisé, échec de la passe) : une lecture à part
+    if (not tp_ok or not subs_ok) and ok_rendus:
+        tp, subs = trickplay_spec(), subtitles_spec()
+        side_tasks = [(tid, label) for tid, label in ((task_tp, "trickplay"), (task_subs, "subtitles")) if tid is not None]
+        try:
+            with encoder_slot("side"), stage("side_outputs", job=base_name):
+                run_ffmpeg_with_progress(build_side_outputs_cmd(src, tp, subs), total_seconds=duration, task_id=[tid for tid, _ in side_tasks],
+                                         progress=progress, cwd=work_dir, labels=[label for _, label in side_tasks])
+        except subprocess.CalledProcessError as e:
+            log_warn(t("side_outputs_failed", name=base_name, err=e))
+        else:
+            if tp:
+                trickplay_done()
+            if subs:
+                subtitles_done(pub_dir / ok_rendus[0][0])
+    if not tp_ok:
+        progress.stop_task(task_tp)
+    if not subs_ok:
+        progress.stop_task(task_subs)
 
-    # Master (uniquement les résolutions qui ont réussi)
-    if ok_rendus:
-        write_master(work_dir, [(rn, rstr, br) for (rn, rstr, br) in ok_rendus])
+    # Code de sortie par variante (--headless)
+    ok_names = {r[0] for r in ok_rendus}
+    file_states[state_idx]["rungs"] = {
+        **{r[0]: EXIT_OK if r[0] in ok_names else EXIT_FAILED for r in ladder if r[0] in wanted},
+        **{a_name: EXIT_OK if audio_ok else EXIT_FAILED for a_name in audio_names if a_name in wanted},
+    }
+
+    # Master (uniquement les résolutions qui ont réussi) ; job partiel : écrit par le job fichier qui suit
+    if only is not None:
+        if EXIT_FAILED in file_states[state_idx]["rungs"].values():
+            file_states[state_idx]["status"] = t("error")
+    elif ok_rendus and audio_ok:
+        playable = True
+        with stage("master", job=base_name):
+            codecs = {rn: variant_codec(pub_dir / rn, rn, plan["codecs"][rn]) for rn, _rs, _br in ok_rendus}
+            write_master(pub_dir, [(rn, rstr, br) for (rn, rstr, br) in ok_rendus],
+                         audio=list(zip(audio_names, audio_langs_ordered)) if shared_audio else None, mode=mode,
+                         codecs=codecs, audio_codecs=audio_codec_strings(probe["info"], audio_map, plan["audio_copy"]),
+                         audio_kbps=audio_kbps,
+                         trickplay=TRICKPLAY,
+                         subtitles=[(s_name, lang, pos in sub_forced) for s_name, (pos, lang) in zip(sub_names, sub_map)]
+                         if sub_map and subs_ok else None)
+        if VERIFY_OUTPUT:
+            # Segments relus : débits crête/moyen, cadence et codecs mesurés remplacent les valeurs de consigne du master
+            with stage("verify", job=base_name):
+                found, _checked = verify_titles([pub_dir])
+            log_verify_problems(found)
+            if found:
+                # Sortie fautive : fichier en erreur (code de sortie, pas de cache dédup), variantes touchées refaites au prochain passage
+                bad = {Path(uri).parts[0] for items in found.values() for uri, _code, _details in items}
+                for name in bad - {"master.m3u8"}:
+                    journal_write(pub_dir, name, {"state": "invalid"})
+                    if name in file_states[state_idx]["rungs"]:
+                        file_states[state_idx]["rungs"][name] = EXIT_FAILED
+                file_states[state_idx]["status"] = f"{t('error')} (verify)"
+                # master illisible ou aucune résolution saine : compté sans master (échec plutôt que partiel)
+                playable = "master.m3u8" not in bad and any(rn not in bad for rn, _rs, _br in ok_rendus)
+        file_states[state_idx]["master"] = playable
     else:
         file_states[state_idx]["status"] = t("error")
-
-    if DELETE_SOURCE:
-        try:
-            src.unlink()
-            log_warn(f"Source supprimée : {src}")
-        except Exception as e:
-            log_warn(f"Impossible de supprimer la source : {e}")
+        if live_rungs is not None:
+            (pub_dir / "master.m3u8").unlink(missing_ok=True)  # master progressif sans rien de lisible derrière
 
     progress.stop_task(task_overall)
     if t("error") not in file_states[state_idx]["status"]:
         file_states[state_idx]["status"] = "done"
+        if dedup_key and len(ok_rendus) == len(ladder) and tp_ok and subs_ok:
+            with stage("dedup_store", job=base_name):
+                dedup_store(dedup_key, pub_dir)
+        if work_dir != pub_dir:
+            # Scratch libéré une fois tout publié (après un échec il reste pour la reprise)
+            for name in wanted:
+                shutil.rmtree(work_dir / name, ignore_errors=True)
+            if only is None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        if DELETE_SOURCE and only is None:  # sortie complète et vérifiée seulement (après une erreur, source gardée pour la refaire)
+            delete_source(src)
+
+def probe_for_schedule(src: Path, file_states: List[Dict], state_idx: int) -> Optional[Dict[str, Any]]:
+    try:
+        with stage("probe", job=src.stem):
+            probe = probe_source(src)
+    except Exception as e:
+        log_err(f"{src.name}: {e}")
+        return None
+    file_states[state_idx]["duration"] = probe["duration"]
+    file_states[state_idx]["langs"] = [lang for (_pos, lang) in probe["audio_map"]]
+    file_states[state_idx]["status"] = t("pending")
+    return probe
+
+# ==========================
+# CONFIG FILE & WATCH
+# ==========================
+
+def load_config(path: Path):
+    # JSON → constantes du module, ex. {"HLS_MODE": "fmp4", "RESOLUTIONS": [["720p", "1280:720", "1280x720", 4000]]}
+    data = json.loads(path.read_text(encoding="utf-8"))
+    g = globals()
+    for key, value in data.items():
+        if not key.isupper() or key not in g or callable(g[key]):
+            raise ValueError(t("config_unknown_key", name=key, path=path))
+        if key == "RESOLUTIONS":
+            value = [tuple(r) for r in value]
+        g[key] = value
+    if "VAAPI_DEVICE" in data:
+        for backend, conf in ENCODER_BACKENDS.items():
+            if backend_family(backend) == "vaapi":
+                conf["input_args"] = ["-vaapi_device", VAAPI_DEVICE]
+
+def iter_sources(root: Path) -> Iterator[Path]:
+    return (p for p in root.rglob("*.mkv") if p.is_file())
+
+class InotifyWatcher:
+    # Linux : inotify via la libc (ctypes), 1 watch par dossier ; sous-dossiers créés/déplacés ajoutés à la volée
+    IN_MODIFY, IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x2, 0x8, 0x40, 0x80, 0x100, 0x200
+    IN_Q_OVERFLOW, IN_ISDIR = 0x4000, 0x40000000
+    MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE  # départs : fichier oublié de la file
+
+    def __init__(self, root: Path):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.dirs: Dict[int, Path] = {}
+        self._add_tree(root)
+
+    def _add_tree(self, root: Path):
+        for dirpath, _dirs, _files in os.walk(root):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), self.MASK)
+            if wd >= 0:
+                self.dirs[wd] = Path(dirpath)
+
+    def poll(self, timeout: float) -> Tuple[List[Path], bool]:
+        # (fichiers touchés, rescan complet nécessaire)
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        paths: List[Path] = []
+        i = 0
+        while i + 16 <= len(data):
+            wd, mask, _cookie, length = struct.unpack_from("iIII", data, i)
+            name = data[i + 16:i + 16 + length].split(b"\0", 1)[0]
+            i += 16 + length
+            if mask & self.IN_Q_OVERFLOW:
+                return [], True
+            base = self.dirs.get(wd)
+            if base is None or not name:
+                continue
+            path = base / os.fsdecode(name)
+            if mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                    self._add_tree(path)
+                    paths.extend(iter_sources(path))  # dossier arrivé déjà rempli (mv)
+                continue
+            paths.append(path)
+        return paths, False
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    # Repli portable : rescan de l'arborescence toutes les WATCH_POLL_INTERVAL s
+    def __init__(self, root: Path):
+        self.root = root
+        self.next_scan = 0.0
+
+    def poll(self, timeout: float) -> Tuple[List[Path], bool]:
+        now = time.monotonic()
+        if now < self.next_scan:
+            time.sleep(min(timeout, self.next_scan - now))
+            return [], False
+        self.next_scan = now + WATCH_POLL_INTERVAL
+        return [], True
+
+    def close(self):
+        pass
+
+def watch_ready_files(root: Path, stop: threading.Event) -> Iterator[Optional[Path]]:
+    # Fichiers prêts (taille + mtime stables depuis WATCH_SETTLE_SECONDS) ; None à chaque tour (rafraîchissement UI)
+    try:
+        watcher = InotifyWatcher(root)
+    except (OSError, AttributeError):
+        watcher = PollingWatcher(root)
+        log_info(t("watch_polling", interval=WATCH_POLL_INTERVAL))
+    pending: Dict[Path, Tuple[int, int, float]] = {}  # chemin → (taille, mtime_ns, stable depuis)
+    queued: Dict[Path, Tuple[int, int]] = {}          # déjà mis en file (dans cet état), tant que le fichier est là
+    paths, rescan = list(iter_sources(root)), False
+    try:
+        while not stop.is_set():
+            if rescan:
+                paths = list(iter_sources(root))
+                for p in set(queued) - set(paths):  # supprimés (DELETE_SOURCE) ou déplacés après conversion
+                    del queued[p]
+            now = time.monotonic()
+            for p in paths:
+                if p.suffix == ".mkv" and p not in pending:
+                    pending[p] = (-1, -1, now)
+            for p, (size, mtime_ns, since) in list(pending.items()):
+                try:
+                    st = p.stat()
+                except OSError:
+                    del pending[p]
+                    queued.pop(p, None)
+                    continue
+                sig = (st.st_size, st.st_mtime_ns)
+                if sig != (size, mtime_ns):
+                    pending[p] = (*sig, now)
+                elif now - since >= WATCH_SETTLE_SECONDS:
+                    del pending[p]
+                    if queued.get(p) != sig:
+                        queued[p] = sig
+                        yield p
+            yield None
+            paths, rescan = watcher.poll(1.0)
+    finally:
+        watcher.close()
 
 def ask_mode_interactive() -> str:
     while True:
@@ -585,29 +4406,38 @@ def ask_mode_interactive() -> str:
             return "ts"
         if ans == "2":
             return "fmp4"
+        if ans == "3":
+            return "cmaf"
         print(t("ask_mode_invalid"))
 
-def main():
-    mode = ask_mode_interactive()
-
-    scan = Path(INPUT_DIR).resolve()
-    out_root = Path(OUTPUT_DIR).resolve()
-    out_root.mkdir(parents=True, exist_ok=True)
-    # Récursif + tri pour un ordre stable
-    mkvs = sorted(p for p in scan.rglob("*.mkv") if p.is_file())
-    if not mkvs:
-        console.print(Panel(t("no_mkv"), title=t("app_title"), style="warn"))
-        return
-
-    file_states: List[Dict] = [{
-        "idx": i+1,
-        "name": f.stem,
+def new_file_state(idx: int, path: Path) -> Dict:
+    return FileState({
+        "idx": idx,
+        "name": path.stem,
         "duration": 0.0,
         "langs": [],
         "status": t("scanning"),
-        "path": f,
-    } for i, f in enumerate(mkvs)]
+        "path": path,
+        "rungs": {},     # variante → code de sortie
+        "master": False,
+        "started": False,  # conversion commencée (tableau : en cours / en attente)
+        "exit": None,
+    })
 
+@contextmanager
+def live_ui(file_states: List[Dict]):
+    # (progress, refresh) : bus de progression → barres Rich + tableau de la file en fenêtre, rafraîchi à la demande ;
+    # --headless : JSON lines, rien à rafraîchir. Métriques activées → stats ffmpeg en plus, quel que soit l'affichage
+    sinks: List[Any] = [MetricsSink()] if METRICS_EVENTS else []
+    if HEADLESS:
+        yield ProgressBus([JsonSink()] + sinks), lambda: None
+        return
+    from rich.live import Live
+    from rich.panel import Panel
+    from rich.progress import (
+        Progress, BarColumn, TimeRemainingColumn, TimeElapsedColumn,
+        TaskProgressColumn, SpinnerColumn, TextColumn
+    )
     progress = Progress(
         SpinnerColumn(),
         TextColumn("[progress.description]{task.description}"),
@@ -618,24 +4448,443 @@ def main():
         expand=True,
     )
 
+    view = FilesView(file_states)
     progress.start()
-    with Live(refresh_per_second=10, auto_refresh=False, console=console) as live:
-        files_table = build_files_table(file_states)
-        live.update(Panel(build_layout(files_table, progress), title=t("app_title"), border_style="title"))
-        live.refresh()
+    try:
+        with Live(refresh_per_second=10, auto_refresh=False, console=get_console()) as live:
+            def refresh():
+                live.update(Panel(build_layout(view.table(), progress), title=t("app_title"), border_style="title"))
+                live.refresh()
+
+            refresh()
+            yield ProgressBus([RichSink(progress)] + sinks), refresh
+    finally:
+        progress.stop()
+
+def file_workers() -> int:
+    # Fichiers en parallèle : le nombre réel de ffmpeg est borné par encoder_slot
+    return max(1, ENCODER_SLOTS.get(resolve_backend() or "x264", 1))
+
+def batch_exit_code(file_states: List[Dict]) -> int:
+    codes = [st["exit"] if st["exit"] is not None else EXIT_FAILED for st in file_states]
+    return EXIT_FAILED if EXIT_FAILED in codes else EXIT_PARTIAL if EXIT_PARTIAL in codes else EXIT_OK
+
+def run_batch(mode: str, scan: Path, out_root: Path, files: Optional[List[Path]] = None) -> int:
+    # Récursif + tri pour un ordre stable (ou fichiers donnés en ligne de commande, dans cet ordre)
+    mkvs = files if files else sorted(iter_sources(scan))
+    if not mkvs:
+        if HEADLESS:
+            log_warn(t("no_mkv"))
+        else:
+            from rich.panel import Panel
+            get_console().print(Panel(t("no_mkv"), title=t("app_title"), style="warn"))
+        return EXIT_NO_INPUT
 
-        for i, f in enumerate(mkvs):
+    file_states: List[Dict] = [new_file_state(i + 1, f) for i, f in enumerate(mkvs)]
+
+    with live_ui(file_states) as (progress, refresh):
+        # Probe de toute la file → durées connues pour planifier les plus longs d'abord
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            probes = list(pool.map(lambda i: probe_for_schedule(mkvs[i], file_states, i), range(len(mkvs))))
+        refresh()
+        order = sorted(range(len(mkvs)), key=lambda i: file_states[i]["duration"], reverse=True)
+        if source_stager():
+            source_stager().enqueue([mkvs[i] for i in order])
+
+        with ThreadPoolExecutor(max_workers=file_workers()) as pool:
+            futures = {
+                pool.submit(convert_one_file, mkvs[i], out_root, progress, file_states, i, mode, probes[i]): i
+                for i in order
+            }
+            running = set(futures)
+            while running:
+                done, running = wait(running, timeout=0.5, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        log_err(f"{mkvs[futures[fut]].name}: {e}")
+                refresh()
+    return batch_exit_code(file_states)
+
+def run_watch(mode: str, scan: Path, out_root: Path):
+    # Service : fichiers convertis dès qu'ils ont fini d'arriver, jusqu'à Ctrl+C
+    log_info(t("watch_start", path=scan, settle=WATCH_SETTLE_SECONDS))
+    file_states: List[Dict] = []
+    futures: Dict[Any, int] = {}
+    stop = threading.Event()
+    with live_ui(file_states) as (progress, refresh), ThreadPoolExecutor(max_workers=file_workers()) as pool:
+        def ingest(path: Path, idx: int):
+            probe = probe_for_schedule(path, file_states, idx)
+            if probe:
+                convert_one_file(path, out_root, progress, file_states, idx, mode, probe)
+
+        try:
+            for path in watch_ready_files(scan, stop):
+                if path is not None:
+                    if source_stager():
+                        source_stager().enqueue([path])
+                    file_states.append(new_file_state(len(file_states) + 1, path))
+                    futures[pool.submit(ingest, path, len(file_states) - 1)] = len(file_states) - 1
+                for fut in [f for f in futures if f.done()]:
+                    try:
+                        fut.result()
+                    except Exception as e:
+                        log_err(f"{file_states[futures[fut]]['name']}: {e}")
+                    del futures[fut]
+                refresh()
+        except KeyboardInterrupt:
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+            log_warn(t("watch_stop"))
+
+# ==========================
+# DISTRIBUÉ (coordinateur / workers, HTTP JSON)
+# ==========================
+# Le coordinateur possède la file ; les workers louent un job (POST /lease), envoient des heartbeats (POST /heartbeat)
+# et rendent le résultat (POST /complete). Bail expiré → job remis en file ; le journal de reprise évite de tout refaire.
+# Chemins identiques sur tous les nœuds (INPUT_DIR / OUTPUT_DIR sur un partage commun).
+
+class JobQueue:
+    def __init__(self, mode: str, out_root: Path, clock: Callable[[], float] = time.monotonic):
+        self.mode = mode
+        self.out_root = out_root
+        self.clock = clock  # échéances des baux (remplaçable : horloge factice)
+        self.lock = threading.Lock()
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.leases: Dict[str, Dict[str, Any]] = {}  # bail → {"job", "worker", "expires"}
+        self.closed = False  # batch : plus aucun fichier à venir
+
+    def _add(self, path: str, duration: float, only: Optional[List[str]] = None, after: Optional[List[str]] = None) -> str:
+        job_id = uuid.uuid4().hex[:12]
+        self.jobs[job_id] = {"id": job_id, "path": path, "only": only, "after": after or [], "duration": duration,
+                             "state": "queued", "attempts": 0, "worker": None, "exit": None, "rungs": {}}
+        return job_id
+
+    def _queued(self, src: Path) -> bool:
+        return any(j["path"] == str(src) and j["state"] in ("queued", "leased") for j in self.jobs.values())
+
+    def add_file(self, src: Path, probe: Optional[Dict[str, Any]]):
+        # COORD_SPLIT_RUNGS : 1 job par résolution (+ audio partagé), puis le job fichier qui réutilise tout et écrit le master
+        with self.lock:
+            if self._queued(src):
+                return
+        names = []
+        if probe is not None and COORD_SPLIT_RUNGS:
+            # Hors verrou : plan_ladder peut scanner les keyframes et lancer l'encodage d'essai (HTTP et reaper non bloqués)
+            names = [r[0] for r in plan_ladder(src, probe, self.mode)["rungs"]]
+            names += ["audio"] if SHARED_AUDIO and probe["audio_map"] else []
+        with self.lock:
+            if self._queued(src):  # ajouté entre-temps
+                return
+            if probe is None:
+                job_id = self._add(str(src), 0.0)
+                self.jobs[job_id].update(state="failed", exit=EXIT_FAILED)
+                return
+            after = [self._add(str(src), probe["duration"], only=[name]) for name in names]
+            self._add(str(src), probe["duration"], after=after)
+
+    def _finished(self, job_id: str) -> bool:
+        return self.jobs[job_id]["state"] in ("done", "failed")
+
+    def _retry_or_fail(self, job: Dict[str, Any]):
+        job["attempts"] += 1
+        job["state"] = "queued" if job["attempts"] < COORD_MAX_ATTEMPTS else "failed"
+        job["worker"] = None
+
+    def reap(self):
+        now = self.clock()
+        with self.lock:
+            for lease_id, lease in list(self.leases.items()):
+                if lease["expires"] < now:
+                    del self.leases[lease_id]
+                    job = self.jobs[lease["job"]]
+                    log_warn(t("lease_expired", name=Path(job["path"]).stem, worker=lease["worker"]))
+                    self._retry_or_fail(job)
+
+    def lease(self, worker: str) -> Dict[str, Any]:
+        self.reap()
+        with self.lock:
+            ready = [j for j in self.jobs.values()
+                     if j["state"] == "queued" and all(self._finished(dep) for dep in j["after"])]
+            if not ready:
+                return {"job": None, "done": self.closed and all(self._finished(j) for j in self.jobs)}
+            job = max(ready, key=lambda j: j["duration"])  # plus longs d'abord
+            lease_id = uuid.uuid4().hex
+            self.leases[lease_id] = {"job": job["id"], "worker": worker, "expires": self.clock() + COORD_LEASE_TTL}
+            job.update(state="leased", worker=worker)
+        return {"lease": lease_id, "ttl": COORD_LEASE_TTL,
+                "job": {"id": job["id"], "path": job["path"], "only": job["only"], "mode": self.mode, "out_root": str(self.out_root)}}
+
+    def heartbeat(self, lease_id: str) -> bool:
+        with self.lock:
+            lease = self.leases.get(lease_id)
+            if lease is None:
+                return False
+            lease["expires"] = self.clock() + COORD_LEASE_TTL
+            return True
+
+    def complete(self, lease_id: str, exit_code: int, rungs: Dict[str, int]) -> bool:
+        with self.lock:
+            lease = self.leases.pop(lease_id, None)
+            if lease is None:
+                return False  # bail expiré entre-temps : le job a été remis en file
+            job = self.jobs[lease["job"]]
+            job.update(exit=exit_code, rungs=rungs)
+            if exit_code in (EXIT_OK, EXIT_PARTIAL):
+                job["state"] = "done"
+            else:
+                self._retry_or_fail(job)
+        log_info(t("coord_job_done", name=Path(job["path"]).stem, part="/".join(job["only"] or ["file"]),
+                   worker=lease["worker"], exit=exit_code, state=job["state"]))
+        return True
+
+    def finished(self) -> bool:
+        with self.lock:
+            return self.closed and all(self._finished(j) for j in self.jobs)
+
+    def exit_code(self) -> int:
+        # Jobs fichier seuls : celui-ci refait toute résolution dont le job partiel a échoué
+        with self.lock:
+            jobs = [j for j in self.jobs.values() if j["only"] is None]
+        if any(j["state"] == "failed" for j in jobs):
+            return EXIT_FAILED
+        return EXIT_PARTIAL if any(j["exit"] == EXIT_PARTIAL for j in jobs) else EXIT_OK
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            jobs = [dict(j) for j in self.jobs.values()]
+        counts: Dict[str, int] = {}
+        for j in jobs:
+            counts[j["state"]] = counts.get(j["state"], 0) + 1
+        return {"mode": self.mode, "closed": self.closed, "counts": counts, "jobs": jobs}
+
+def coordinator_handler(queue: JobQueue):
+    from http.server import BaseHTTPRequestHandler
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code: int, payload: Dict[str, Any]):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/status":
+                self._reply(200, queue.status())
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
             try:
-                convert_one_file(f, out_root, progress, file_states, i, mode)
+                data = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if self.path == "/lease":
+                    self._reply(200, queue.lease(str(data.get("worker", self.client_address[0]))))
+                elif self.path == "/heartbeat":
+                    ok = queue.heartbeat(data["lease"])
+                    self._reply(200 if ok else 410, {"ok": ok})
+                elif self.path == "/complete":
+                    ok = queue.complete(data["lease"], int(data["exit"]), data.get("rungs") or {})
+                    self._reply(200 if ok else 410, {"ok": ok})
+                else:
+                    self._reply(404, {"error": "not found"})
+            except (KeyError, ValueError, TypeError) as e:
+                self._reply(400, {"error": str(e)})
+
+        def log_message(self, *_args):
+            pass
+
+    return Handler
+
+def run_coordinator(mode: str, scan: Path, out_root: Path, listen: str, files: Optional[List[Path]] = None,
+                    watch: bool = False) -> int:
+    from http.server import ThreadingHTTPServer
+    host, _, port = listen.rpartition(":")
+    queue = JobQueue(mode, out_root)
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), coordinator_handler(queue))
+    threading.Thread(target=server.serve_forever, name="coordinator-http", daemon=True).start()
+    log_info(t("coord_listen", addr=f"{host or '0.0.0.0'}:{server.server_address[1]}", mode=mode))
+    stop = threading.Event()
+
+    def reaper():
+        while not stop.wait(1.0):
+            queue.reap()
+
+    threading.Thread(target=reaper, name="coordinator-reaper", daemon=True).start()
+
+    def safe_probe(path: Path) -> Optional[Dict[str, Any]]:
+        try:
+            with stage("probe", job=path.stem):
+                return probe_source(path)
+        except Exception as e:
+            log_err(f"{path.name}: {e}")
+            return None
+
+    try:
+        if watch:
+            for path in watch_ready_files(scan, stop):
+                if path is not None:
+                    queue.add_file(path, safe_probe(path))
+            return EXIT_OK
+        sources = files or sorted(iter_sources(scan))
+        if not sources:
+            log_warn(t("no_mkv"))
+            return EXIT_NO_INPUT
+        with ThreadPoolExecutor(max_workers=PROBE_WORKERS) as pool:
+            probes = list(pool.map(safe_probe, sources))
+        for src, probe in zip(sources, probes):
+            queue.add_file(src, probe)
+        queue.closed = True
+        while not queue.finished():
+            time.sleep(1.0)
+        time.sleep(COORD_POLL_INTERVAL + 1.0)  # les workers en attente apprennent que la file est terminée
+        return queue.exit_code()
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    finally:
+        stop.set()
+        server.shutdown()
+
+def http_json(url: str, payload: Dict[str, Any], timeout: float = 10.0) -> Tuple[int, Dict[str, Any]]:
+    import urllib.error
+    import urllib.request
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST",
+                                 headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+
+def run_worker(coordinator: str) -> int:
+    # Un job à la fois (plusieurs workers par machine possibles) ; bail perdu → ffmpeg tués, résultat non rendu
+    base = coordinator.rstrip("/") if "://" in coordinator else f"http://{coordinator.rstrip('/')}"
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    log_info(t("worker_start", worker=worker_id, url=base))
+    file_states: List[Dict] = []
+    with live_ui(file_states) as (progress, refresh):
+        while True:
+            try:
+                _code, reply = http_json(f"{base}/lease", {"worker": worker_id})
+            except OSError as e:
+                log_warn(t("coord_unreachable", url=base, error=e))
+                time.sleep(COORD_POLL_INTERVAL)
+                continue
+            except KeyboardInterrupt:
+                return EXIT_INTERRUPTED
+            job = reply.get("job")
+            if not job:
+                if reply.get("done"):
+                    return batch_exit_code(file_states) if file_states else EXIT_OK
+                time.sleep(COORD_POLL_INTERVAL)
+                refresh()
+                continue
+
+            src = Path(job["path"])
+            idx = len(file_states)
+            file_states.append(new_file_state(idx + 1, src))
+            lost = threading.Event()
+            finished = threading.Event()
+
+            def heartbeat(lease_id: str = reply["lease"], interval: float = reply["ttl"] / 3):
+                while not finished.wait(interval):
+                    try:
+                        code, _ = http_json(f"{base}/heartbeat", {"lease": lease_id})
+                    except OSError:
+                        continue  # coordinateur momentanément injoignable : le bail court encore
+                    if code == 410:
+                        lost.set()
+                        log_warn(t("lease_lost", name=src.stem))
+                        supervisor().abort()
+                        return
+
+            hb = threading.Thread(target=heartbeat, name="worker-heartbeat", daemon=True)
+            hb.start()
+            try:
+                probe = probe_for_schedule(src, file_states, idx)
+                if probe:
+                    convert_one_file(src, Path(job["out_root"]), progress, file_states, idx, job["mode"], probe, job["only"])
+            except JobAborted:
+                pass  # bail perdu, déjà signalé : la sortie appartient maintenant à un autre worker
             except Exception as e:
-                log_err(f"{f.name}: {e}")
-            files_table = build_files_table(file_states)
-            live.update(Panel(build_layout(files_table, progress), title=t("app_title"), border_style="title"))
-            live.refresh()
-    progress.stop()
+                log_err(f"{src.name}: {e}")
+            finally:
+                finished.set()
+                hb.join()
+                supervisor().resume()
+            st = file_states[idx]
+            if st["exit"] is None:
+                st["exit"] = EXIT_FAILED
+            if not lost.is_set():
+                try:
+                    http_json(f"{base}/complete", {"lease": reply["lease"], "exit": st["exit"], "rungs": st["rungs"]})
+                except OSError as e:
+                    log_warn(t("coord_unreachable", url=base, error=e))
+            refresh()
 
-    mode_name = t("mode_name_fmp4") if mode == "fmp4" else t("mode_name_ts")
-    console.print(Panel(f"{t('done')}  ({mode_name})", title=t("app_title"), style="ok"))
+def main(argv: Optional[List[str]] = None) -> int:
+    global HEADLESS, INPUT_DIR, OUTPUT_DIR
+    parser = argparse.ArgumentParser(description="MKV → HLS")
+    parser.add_argument("files", nargs="*", type=Path, help="convert these files instead of scanning INPUT_DIR")
+    parser.add_argument("--config", type=Path, help="JSON: module constants (HLS_MODE, RESOLUTIONS, INPUT_DIR, …)")
+    parser.add_argument("--mode", choices=HLS_MODES, help="HLS segments; cmaf = one byte-range .mp4 per rendition (default: HLS_MODE, else interactive prompt)")
+    parser.add_argument("--input", help="input folder (INPUT_DIR)")
+    parser.add_argument("--output", help="output folder (OUTPUT_DIR)")
+    parser.add_argument("--watch", action="store_true", help="keep running and convert new files in INPUT_DIR as they arrive")
+    parser.add_argument("--headless", action="store_true", help="no TUI, no prompt: JSON-lines progress on stdout, exit code per run")
+    parser.add_argument("--coordinator", metavar="HOST:PORT", help="own the job queue and lease jobs to --worker processes over HTTP")
+    parser.add_argument("--worker", metavar="URL", help="take jobs from a --coordinator (e.g. http://encoder1:8750)")
+    parser.add_argument("--dedup-check", action="store_true", help="verify the dedup cache (drop damaged entries), apply DEDUP_MAX_BYTES and exit")
+    parser.add_argument("--verify", nargs="?", const="", metavar="DIR",
+                        help="check every title under DIR (default: OUTPUT_DIR), rewrite masters with measured bitrates and exit")
+    args = parser.parse_args(argv)
+    if args.config:
+        try:
+            load_config(args.config)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    HEADLESS = HEADLESS or args.headless
+    INPUT_DIR = args.input or INPUT_DIR
+    OUTPUT_DIR = args.output or OUTPUT_DIR
+    if args.coordinator and args.worker:
+        parser.error(t("coord_or_worker"))
+    if args.dedup_check:
+        return dedup_check()
+    if args.verify is not None:
+        return verify_catalog(Path(args.verify or OUTPUT_DIR).resolve())
+    mode = args.mode or HLS_MODE
+    if mode not in HLS_MODES and not args.worker:  # worker : mode fourni par le coordinateur avec chaque job
+        if args.watch or HEADLESS or args.coordinator:
+            parser.error(t("mode_required"))
+        mode = ask_mode_interactive()
+    missing = [f for f in args.files if not f.is_file()]
+    if missing:
+        parser.error(t("file_not_found", path=missing[0]))
+
+    scan = Path(INPUT_DIR).resolve()
+    out_root = Path(OUTPUT_DIR).resolve()
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    if args.worker:
+        return run_worker(args.worker)
+    if args.coordinator:
+        return run_coordinator(mode, scan, out_root, args.coordinator, [f.resolve() for f in args.files], watch=args.watch)
+    try:
+        if args.watch:
+            run_watch(mode, scan, out_root)
+            return EXIT_OK
+        code = run_batch(mode, scan, out_root, [f.resolve() for f in args.files])
+    except KeyboardInterrupt:
+        return EXIT_INTERRUPTED
+    if HEADLESS:
+        json_line("done", mode=mode, exit=code)
+    elif code != EXIT_NO_INPUT:
+        from rich.panel import Panel
+        mode_name = t(f"mode_name_{mode}")
+        get_console().print(Panel(f"{t('done')}  ({mode_name})", title=t("app_title"), style="ok"))
+    return code
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
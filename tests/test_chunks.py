@@ -0,0 +1,158 @@
+# Découpe en morceaux (plan_chunks), recalage tfdt et recouture des playlists — boîtes ISO-BMFF synthétiques
+import struct
+
+import pytest
+
+import main as m
+
+
+def box(typ: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + typ + payload
+
+
+def init_mp4(tracks, codec: bytes = b"avc1") -> bytes:
+    # tracks : [(track_ID, timescale)] — tkhd/mdhd version 0
+    traks = b""
+    for track_id, timescale in tracks:
+        tkhd = box(b"tkhd", b"\0\0\0\0" + b"\0" * 8 + struct.pack(">I", track_id) + b"\0" * 68)
+        mdhd = box(b"mdhd", b"\0\0\0\0" + b"\0" * 8 + struct.pack(">II", timescale, 0) + b"\0" * 4)
+        stsd = box(b"stsd", b"\0\0\0\0" + struct.pack(">I", 1) + box(codec, b"\0" * 8))
+        traks += box(b"trak", tkhd + box(b"mdia", mdhd + box(b"minf", box(b"stbl", stsd))))
+    return box(b"ftyp", b"iso6") + box(b"moov", traks)
+
+
+def segment(fragments, tfdt_version: int = 1) -> bytes:
+    # fragments : [(track_ID, baseMediaDecodeTime)]
+    trafs = b""
+    for track_id, base in fragments:
+        tfhd = box(b"tfhd", b"\0\0\0\0" + struct.pack(">I", track_id))
+        if tfdt_version == 1:
+            tfdt = box(b"tfdt", b"\x01\0\0\0" + struct.pack(">Q", base))
+        else:
+            tfdt = box(b"tfdt", b"\0\0\0\0" + struct.pack(">I", base))
+        trafs += box(b"traf", tfhd + tfdt + box(b"trun", b"\0" * 8))
+    return box(b"moof", box(b"mfhd", b"\0" * 8) + trafs) + box(b"mdat", b"x" * 16)
+
+
+def tfdts(data: bytes):
+    out = []
+    for _t, _b, c, e in m.find_box(data, [b"moof", b"traf"]):
+        tfhd = next(m.find_box(data, [b"tfhd"], c, e))
+        tfdt = next(m.find_box(data, [b"tfdt"], c, e))
+        width = 8 if data[tfdt[2]] == 1 else 4
+        out.append((int.from_bytes(data[tfhd[2] + 4:tfhd[2] + 8], "big"),
+                    int.from_bytes(data[tfdt[2] + 4:tfdt[2] + 4 + width], "big")))
+    return out
+
+
+def playlist(entries, init=None) -> str:
+    lines = ["#EXTM3U", "#EXT-X-VERSION:7" if init else "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4"]
+    if init:
+        lines.append(f'#EXT-X-MAP:URI="{init}"')
+    for name, dur in entries:
+        lines += [f"#EXTINF:{dur:.6f},", name]
+    return "\n".join(lines + ["#EXT-X-ENDLIST"]) + "\n"
+
+
+# ---------- plan_chunks ----------
+
+@pytest.fixture
+def grid(monkeypatch):
+    monkeypatch.setattr(m, "GOP_SECONDS", 2.0)
+    monkeypatch.setattr(m, "SEG_DUR", 4)
+    monkeypatch.setattr(m, "CHUNK_SECONDS", 30.0)
+
+
+def test_plan_chunks_bounds_on_segment_grid(grid):
+    chunks = m.plan_chunks(125.0, [], 25.0)
+    starts = [s for s, _ in chunks]
+    assert starts[0] == 0.0
+    assert all(s % 4.0 == 0 for s in starts)
+    assert sum(d for _, d in chunks) == pytest.approx(125.0)
+    assert all(a + d == pytest.approx(b) for (a, d), (b, _) in zip(chunks, chunks[1:]))
+
+
+def test_plan_chunks_prefers_source_keyframes(grid):
+    # Pas de 32 s (30 s arrondi à la grille de 4 s) ; keyframe une case plus loin → borne à 36, suivante à 36 + 32
+    chunks = m.plan_chunks(100.0, [0.0, 36.0], 25.0)
+    assert [s for s, _ in chunks] == [0.0, 36.0, 68.0]
+
+
+def test_plan_chunks_no_tiny_tail(grid):
+    # Reste < une demi-case : absorbé par le dernier morceau
+    chunks = m.plan_chunks(57.0, [], 25.0)
+    assert chunks[-1][1] >= 2.0
+    assert sum(d for _, d in chunks) == pytest.approx(57.0)
+
+
+# ---------- tfdt ----------
+
+def test_mp4_timescales():
+    assert m.mp4_timescales(init_mp4([(1, 90000), (2, 48000)])) == {1: 90000, 2: 48000}
+
+
+@pytest.mark.parametrize("version", [0, 1])
+def test_shift_fmp4_segment_per_track_timescale(tmp_path, version):
+    seg = tmp_path / "0.m4s"
+    seg.write_bytes(segment([(1, 1000), (2, 500)], tfdt_version=version))
+    m.shift_fmp4_segment(seg, 10.0, {1: 90000, 2: 48000})
+    data = seg.read_bytes()
+    assert tfdts(data) == [(1, 1000 + 900000), (2, 500 + 480000)]
+    assert data.endswith(b"x" * 16)  # mdat intact, tailles inchangées
+
+
+# ---------- stitch_playlists ----------
+
+def test_stitch_ts_renumbers_and_moves(tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    parts = []
+    for k in range(2):
+        d = tmp_path / f"c{k}"
+        d.mkdir()
+        for i in range(2):
+            (d / f"seg{i}.ts").write_bytes(bytes([k, i]))
+        p = d / "360p.m3u8"
+        p.write_text(playlist([("seg0.ts", 4.0), ("seg1.ts", 3.5 + k)]), encoding="utf-8")
+        parts.append(p)
+    text = m.stitch_playlists(parts, out, "360p.m3u8").read_text(encoding="utf-8")
+    assert [ln for ln in text.splitlines() if not ln.startswith("#")] == ["000.ts", "001.ts", "002.ts", "003.ts"]
+    assert (out / "002.ts").read_bytes() == bytes([1, 0])
+    assert "#EXT-X-TARGETDURATION:5" in text
+    assert "#EXT-X-PLAYLIST-TYPE:VOD" in text and text.rstrip().endswith("#EXT-X-ENDLIST")
+    assert "#EXT-X-DISCONTINUITY" not in text
+
+
+def _fmp4_parts(tmp_path, codecs):
+    parts = []
+    for k, codec in enumerate(codecs):
+        d = tmp_path / f"c{k}"
+        d.mkdir()
+        (d / "init.mp4").write_bytes(init_mp4([(1, 90000)], codec))
+        (d / "s0.m4s").write_bytes(segment([(1, 0)]))
+        (d / "s1.m4s").write_bytes(segment([(1, 360000)]))
+        p = d / "360p.m3u8"
+        p.write_text(playlist([("s0.m4s", 4.0), ("s1.m4s", 4.0)], init="init.mp4"), encoding="utf-8")
+        parts.append(p)
+    out = tmp_path / "out"
+    out.mkdir()
+    return parts, out
+
+
+def test_stitch_fmp4_shifts_tfdt_and_shares_init(tmp_path):
+    parts, out = _fmp4_parts(tmp_path, [b"avc1", b"avc1"])
+    text = m.stitch_playlists(parts, out, "360p.m3u8", offsets=[0.0, 8.0]).read_text(encoding="utf-8")
+    assert text.count("#EXT-X-MAP:") == 1
+    assert "#EXT-X-DISCONTINUITY" not in text
+    assert tfdts((out / "001.m4s").read_bytes()) == [(1, 360000)]
+    assert tfdts((out / "002.m4s").read_bytes()) == [(1, 8 * 90000)]
+    assert tfdts((out / "003.m4s").read_bytes()) == [(1, 8 * 90000 + 360000)]
+
+
+def test_stitch_fmp4_new_init_adds_discontinuity(tmp_path):
+    parts, out = _fmp4_parts(tmp_path, [b"avc1", b"avc3"])
+    text = m.stitch_playlists(parts, out, "360p.m3u8", offsets=[0.0, 8.0]).read_text(encoding="utf-8")
+    lines = text.splitlines()
+    assert '#EXT-X-MAP:URI="init.mp4"' in lines and '#EXT-X-MAP:URI="init_1.mp4"' in lines
+    assert lines.index("#EXT-X-DISCONTINUITY") == lines.index('#EXT-X-MAP:URI="init_1.mp4"') - 1
+    assert (out / "init_1.mp4").exists()
@@ -0,0 +1,53 @@
+# Mode cmaf : un media.mp4 par variante, playlist en plages d'octets (EXT-X-MAP/EXT-X-BYTERANGE)
+from pathlib import Path
+
+import main as m
+
+CMAF_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-TARGETDURATION:4
+#EXT-X-MEDIA-SEQUENCE:0
+#EXT-X-PLAYLIST-TYPE:VOD
+#EXT-X-INDEPENDENT-SEGMENTS
+#EXT-X-MAP:URI="media.mp4",BYTERANGE="720@0"
+#EXTINF:4.000000,
+#EXT-X-BYTERANGE:51234@720
+media.mp4
+#EXTINF:4.000000,
+#EXT-X-BYTERANGE:48770@51954
+media.mp4
+#EXTINF:1.500000,
+#EXT-X-BYTERANGE:20010
+media.mp4
+#EXT-X-ENDLIST
+"""
+
+
+def flag(args, name):
+    return args[args.index(name) + 1]
+
+
+def test_muxer_writes_one_file_per_variant():
+    args = m.hls_muxer_args(Path("/out/360p/%03d.ts"), "cmaf")
+    assert "single_file" in flag(args, "-hls_flags").split("+")
+    assert flag(args, "-hls_segment_type") == "fmp4"
+    assert Path(flag(args, "-hls_segment_filename")) == Path("/out/360p") / m.SINGLE_FILE_NAME
+    assert "-hls_fmp4_init_filename" not in args  # init au début de media.mp4
+    assert m.single_file("cmaf") and not m.single_file("fmp4") and not m.single_file("ts")
+
+
+def test_byterange_playlist_is_read_as_one_file(tmp_path):
+    playlist = tmp_path / "360p.m3u8"
+    playlist.write_text(CMAF_PLAYLIST, encoding="utf-8")
+    segments, init, ended = m.read_media_playlist(playlist)
+    assert segments == [(4.0, "media.mp4"), (4.0, "media.mp4"), (1.5, "media.mp4")]
+    assert init == "media.mp4" and ended
+    assert not m.playlist_complete(playlist)  # media.mp4 absent
+    (tmp_path / m.SINGLE_FILE_NAME).write_bytes(b"\0" * 64)
+    assert m.playlist_complete(playlist)
+
+
+def test_master_declares_version_7(tmp_path):
+    m.write_master(tmp_path, [("360p", "640x360", 800)], mode="cmaf")
+    lines = (tmp_path / "master.m3u8").read_text(encoding="utf-8").splitlines()
+    assert lines[:3] == ["#EXTM3U", "#EXT-X-VERSION:7", "#EXT-X-INDEPENDENT-SEGMENTS"]
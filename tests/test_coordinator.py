@@ -0,0 +1,144 @@
+# File du coordinateur (JobQueue) : baux, heartbeats, expiration, fin de job, dépendances "after" — horloge factice
+import pytest
+
+import main as m
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    monkeypatch.setattr(m, "COORD_LEASE_TTL", 30.0)
+    monkeypatch.setattr(m, "COORD_MAX_ATTEMPTS", 2)
+    monkeypatch.setattr(m, "COORD_SPLIT_RUNGS", False)
+    monkeypatch.setattr(m, "SHARED_AUDIO", True)
+    monkeypatch.setattr(m, "HEADLESS", True)
+    clock = Clock()
+    return m.JobQueue("ts", tmp_path, clock=clock), clock
+
+
+def probe(duration: float = 60.0):
+    return {"duration": duration, "audio_map": [(1, "fre")]}
+
+
+def test_lease_longest_first_and_exclusive(queue, tmp_path):
+    q, _clock = queue
+    q.add_file(tmp_path / "short.mkv", probe(10.0))
+    q.add_file(tmp_path / "long.mkv", probe(100.0))
+    q.add_file(tmp_path / "long.mkv", probe(100.0))  # déjà en file : ignoré
+    first = q.lease("w1")
+    second = q.lease("w2")
+    assert first["job"]["path"].endswith("long.mkv")
+    assert second["job"]["path"].endswith("short.mkv")
+    assert q.lease("w3") == {"job": None, "done": False}
+    assert first["ttl"] == 30.0
+
+
+def test_heartbeat_extends_lease(queue, tmp_path):
+    q, clock = queue
+    q.add_file(tmp_path / "a.mkv", probe())
+    lease = q.lease("w1")["lease"]
+    clock.now += 25
+    assert q.heartbeat(lease)
+    clock.now += 25  # 50 s depuis le bail, 25 s depuis le heartbeat
+    q.reap()
+    assert q.jobs[next(iter(q.jobs))]["state"] == "leased"
+    assert q.heartbeat("unknown") is False
+
+
+def test_reap_requeues_then_fails(queue, tmp_path):
+    q, clock = queue
+    q.add_file(tmp_path / "a.mkv", probe())
+    job_id = next(iter(q.jobs))
+    lease = q.lease("w1")["lease"]
+    clock.now += 31
+    again = q.lease("w2")  # lease() expire d'abord les baux échus
+    assert again["job"]["id"] == job_id
+    assert q.jobs[job_id]["attempts"] == 1
+    assert q.heartbeat(lease) is False
+    assert q.complete(lease, m.EXIT_OK, {}) is False  # bail expiré : résultat du worker perdu ignoré
+    clock.now += 31
+    q.reap()
+    assert q.jobs[job_id]["state"] == "failed"  # COORD_MAX_ATTEMPTS atteint
+    q.closed = True
+    assert q.finished()
+    assert q.exit_code() == m.EXIT_FAILED
+
+
+def test_complete_ok_partial_and_retry(queue, tmp_path):
+    q, _clock = queue
+    for name in ("ok", "partial", "bad"):
+        q.add_file(tmp_path / f"{name}.mkv", probe())
+    leases = {}
+    for _ in range(3):
+        reply = q.lease("w")
+        leases[reply["job"]["path"].rsplit("/", 1)[-1]] = reply["lease"]
+    assert q.complete(leases["ok.mkv"], m.EXIT_OK, {"360p": 0})
+    assert q.complete(leases["partial.mkv"], m.EXIT_PARTIAL, {"360p": 1})
+    assert q.complete(leases["bad.mkv"], m.EXIT_FAILED, {})
+    states = {j["path"].rsplit("/", 1)[-1]: (j["state"], j["attempts"]) for j in q.jobs.values()}
+    assert states == {"ok.mkv": ("done", 0), "partial.mkv": ("done", 0), "bad.mkv": ("queued", 1)}
+    assert q.complete(leases["ok.mkv"], m.EXIT_OK, {}) is False  # bail déjà rendu
+    retry = q.lease("w")
+    assert retry["job"]["path"].endswith("bad.mkv")
+    q.complete(retry["lease"], m.EXIT_OK, {})
+    q.closed = True
+    assert q.lease("w") == {"job": None, "done": True}
+    assert q.exit_code() == m.EXIT_PARTIAL
+
+
+def test_split_rungs_file_job_waits_for_parts(queue, tmp_path, monkeypatch):
+    q, _clock = queue
+    monkeypatch.setattr(m, "COORD_SPLIT_RUNGS", True)
+    monkeypatch.setattr(m, "plan_ladder", lambda src, probe, mode=None: {"rungs": [("360p",), ("240p",)]})
+    q.add_file(tmp_path / "a.mkv", probe())
+    parts = [q.lease(f"w{k}") for k in range(3)]
+    assert sorted(p["job"]["only"][0] for p in parts) == ["240p", "360p", "audio"]
+    assert q.lease("w9")["job"] is None  # job fichier bloqué tant que ses parties ne sont pas finies
+    for p in parts[:2]:
+        q.complete(p["lease"], m.EXIT_OK, {})
+    assert q.lease("w9")["job"] is None
+    q.complete(parts[2]["lease"], m.EXIT_FAILED, {})  # remise en file : toujours pas fini
+    assert q.lease("w9")["job"]["only"] is not None
+    file_job = q.lease("w9")
+    assert file_job["job"] is None
+
+
+def test_failed_part_releases_file_job(queue, tmp_path, monkeypatch):
+    q, clock = queue
+    monkeypatch.setattr(m, "COORD_SPLIT_RUNGS", True)
+    monkeypatch.setattr(m, "plan_ladder", lambda src, probe, mode=None: {"rungs": [("360p",)]})
+    q.add_file(tmp_path / "a.mkv", probe())
+    for _ in range(2):  # 360p + audio
+        q.lease("w")
+    clock.now += 31
+    q.reap()
+    q.reap()
+    for _ in range(2):
+        q.lease("w")
+    clock.now += 31
+    q.reap()  # 2ᵉ expiration : parties abandonnées (finies, en échec)
+    file_job = q.lease("w")
+    assert file_job["job"]["only"] is None
+    q.complete(file_job["lease"], m.EXIT_OK, {})
+    q.closed = True
+    assert q.exit_code() == m.EXIT_OK  # le job fichier a refait les parties en échec
+
+
+def test_aborted_supervisor_raises_job_aborted(monkeypatch):
+    # Bail perdu : ffmpeg refusé d'emblée → JobAborted (pas CalledProcessError, que les replis rattrapent)
+    monkeypatch.setattr(m, "FFMPEG_STALL_RETRIES", 0)
+    sup = m.supervisor()
+    sup.abort()
+    try:
+        with pytest.raises(m.JobAborted):
+            m.run_ffmpeg_with_progress(["ffmpeg", "-version"], 1.0, 0, None, labels=["360p"])
+    finally:
+        sup.resume()
+    assert not issubclass(m.JobAborted, m.subprocess.CalledProcessError)
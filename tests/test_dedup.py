@@ -0,0 +1,81 @@
+# Cache de déduplication : stockage d'une sortie publiée, reprise sous un autre nom, vérification avant reprise, éviction LRU
+import json
+import os
+
+import pytest
+
+import main as m
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch, tmp_path):
+    monkeypatch.setattr(m, "DEDUP_DIR", str(tmp_path / "store"))
+    monkeypatch.setattr(m, "DEDUP_VERIFY", "stat")
+    monkeypatch.setattr(m, "DEDUP_MAX_BYTES", 1 << 30)
+    monkeypatch.setattr(m, "HEADLESS", True)
+
+
+def published(root, name: str = "a"):
+    pub = root / name
+    (pub / "360p").mkdir(parents=True)
+    (pub / "master.m3u8").write_text("#EXTM3U\n", encoding="utf-8")
+    (pub / "360p" / "360p.m3u8").write_text("#EXTM3U\n#EXT-X-ENDLIST\n", encoding="utf-8")
+    (pub / "360p" / "000.ts").write_bytes(b"\x47" * 376)
+    (pub / ".360p.old-1234").mkdir()  # reste de publication : jamais stocké
+    m.journal_write(pub, "360p", {"state": "done", "settings": "s", "source": ["a.mkv", 1, 1]})
+    return pub
+
+
+def test_store_then_restore_under_another_name(tmp_path):
+    pub = published(tmp_path / "out")
+    m.dedup_store("k1", pub)
+    manifest = json.loads((m.dedup_root() / "k1" / m.DEDUP_MANIFEST).read_text(encoding="utf-8"))
+    assert sorted(manifest["files"]) == ["360p/000.ts", "360p/360p.m3u8", "master.m3u8"]
+    assert manifest["journal"]["360p"]["state"] == "done"
+
+    assert m.dedup_restore("k1", tmp_path / "out", "b", ["b.mkv", 2, 2])
+    restored = tmp_path / "out" / "b"
+    assert (restored / "360p" / "000.ts").read_bytes() == b"\x47" * 376
+    assert os.path.samefile(restored / "360p" / "000.ts", pub / "360p" / "000.ts")  # lien dur, pas de copie
+    assert m.journal_read(restored, "360p")["source"] == ["b.mkv", 2, 2]  # journal recalé sur la nouvelle source
+    assert not any(p.name.startswith(".b.") for p in (tmp_path / "out").iterdir())
+
+
+def test_store_is_first_writer_wins(tmp_path):
+    m.dedup_store("k1", published(tmp_path / "out", "a"))
+    other = published(tmp_path / "out", "b")
+    (other / "master.m3u8").write_text("#EXTM3U\n#autre\n", encoding="utf-8")
+    m.dedup_store("k1", other)
+    assert (m.dedup_root() / "k1" / "tree" / "master.m3u8").read_text(encoding="utf-8") == "#EXTM3U\n"
+
+
+@pytest.mark.parametrize("verify", ["stat", "hash"])
+def test_changed_entry_is_dropped(tmp_path, monkeypatch, verify):
+    monkeypatch.setattr(m, "DEDUP_VERIFY", verify)
+    pub = published(tmp_path / "out")
+    m.dedup_store("k1", pub)
+    seg = m.dedup_root() / "k1" / "tree" / "360p" / "000.ts"
+    st = seg.stat()
+    seg.write_bytes(b"\x00" * 376)  # sortie réécrite sur place (liens durs partagés) : même taille
+    if verify == "hash":
+        os.utime(seg, ns=(st.st_atime_ns, st.st_mtime_ns))  # même mtime : seul le contenu diffère
+    assert m.dedup_verify(m.dedup_root() / "k1", m._read_manifest(m.dedup_root() / "k1")) == "360p/000.ts"
+    assert not m.dedup_restore("k1", tmp_path / "out", "b", ["b.mkv", 2, 2])
+    assert not (m.dedup_root() / "k1").exists()
+    assert not (tmp_path / "out" / "b").exists()
+
+
+def test_missing_master_is_invalid(tmp_path):
+    m.dedup_store("k1", published(tmp_path / "out"))
+    (m.dedup_root() / "k1" / "tree" / "master.m3u8").unlink()
+    assert m.dedup_verify(m.dedup_root() / "k1", m._read_manifest(m.dedup_root() / "k1")) == "master.m3u8"
+    assert m.dedup_verify(m.dedup_root() / "nope", None) == m.DEDUP_MANIFEST
+
+
+def test_evict_least_recently_restored(tmp_path, monkeypatch):
+    for key, name in (("old", "a"), ("new", "b")):
+        m.dedup_store(key, published(tmp_path / "out", name))
+    os.utime(m.dedup_root() / "old" / m.DEDUP_MANIFEST, (1, 1))
+    monkeypatch.setattr(m, "DEDUP_MAX_BYTES", 500)  # une seule entrée tient
+    assert m.dedup_evict() == 1
+    assert sorted(p.name for p in m.dedup_root().iterdir()) == ["new"]
@@ -0,0 +1,157 @@
+# Échelle adaptée à la source (plan_ladder) : pas d'upscale, débits plafonnés, copie vidéo/audio — probes synthétiques
+from pathlib import Path
+
+import pytest
+
+import main as m
+
+LADDER = [
+    ["1080p", "1920:1080", "1920x1080", 5000],
+    ["720p", "1280:720", "1280x720", 3000],
+    ["480p", "854:480", "854x480", 1400],
+]
+
+
+@pytest.fixture(autouse=True)
+def ladder(monkeypatch):
+    monkeypatch.setattr(m, "RESOLUTIONS", [list(r) for r in LADDER])
+    monkeypatch.setattr(m, "LADDER_PRUNE", True)
+    monkeypatch.setattr(m, "LADDER_CLAMP_BITRATE", True)
+    monkeypatch.setattr(m, "VIDEO_PASSTHROUGH", True)
+    monkeypatch.setattr(m, "AUDIO_PASSTHROUGH", True)
+    monkeypatch.setattr(m, "GOP_SECONDS", 2.0)
+    monkeypatch.setattr(m, "resolve_backend", lambda: "x264")
+    monkeypatch.setattr(m, "codec_backend", lambda codec: {"h264": "x264", "hevc": "x265", "av1": "svtav1"}[codec])
+    monkeypatch.setattr(m, "get_keyframe_index", lambda src: [2.0 * k for k in range(30)])
+
+
+def probe(width: int, height: int, kbps=None, codec: str = "h264", audios=()) -> dict:
+    video = {"codec_type": "video", "codec_name": codec, "pix_fmt": "yuv420p", "width": width, "height": height}
+    if kbps:
+        video["bit_rate"] = str(kbps * 1000)
+    streams = [video] + [{"codec_type": "audio", **a} for a in audios]
+    return {"info": {"streams": streams, "format": {}}, "duration": 60.0, "fps": 25.0}
+
+
+def rungs(plan) -> list:
+    return [(r[0], r[3]) for r in plan["rungs"]]
+
+
+def test_prune_upscales_with_margin():
+    assert [n for n, _k in rungs(m.plan_ladder(Path("a.mkv"), probe(1280, 720)))] == ["720p", "480p"]
+    # 1916×1076 : à 5 % près de 1080p, gardé
+    assert [n for n, _k in rungs(m.plan_ladder(Path("a.mkv"), probe(1916, 1076)))] == ["1080p", "720p", "480p"]
+
+
+def test_prune_keeps_smallest_rung():
+    assert rungs(m.plan_ladder(Path("a.mkv"), probe(320, 180))) == [("480p", 1400)]
+
+
+def test_clamp_to_source_bits_per_pixel():
+    plan = m.plan_ladder(Path("a.mkv"), probe(1920, 1080, kbps=2000, codec="hevc"))
+    # même nombre de bits par pixel que la source : 2000 kbps × surface de la résolution / surface source
+    assert rungs(plan) == [("1080p", 2000), ("720p", 888), ("480p", 395)]
+    assert plan["video_copy"] is None  # HEVC : pas de copie
+
+
+def test_clamp_from_container_bitrate():
+    p = probe(1280, 720, audios=[{"codec_name": "aac", "channels": 2, "bit_rate": "128000"}])
+    p["info"]["format"]["bit_rate"] = "1128000"  # conteneur - audio = 1000 kbps de vidéo
+    assert rungs(m.plan_ladder(Path("a.mkv"), p))[0] == ("720p", 1000)
+
+
+def test_passthrough_top_rung_and_stereo_aac():
+    audios = [{"codec_name": "aac", "channels": 2}, {"codec_name": "ac3", "channels": 6}, {"codec_name": "aac", "channels": 6}]
+    plan = m.plan_ladder(Path("a.mkv"), probe(1280, 720, kbps=2500, audios=audios))
+    assert plan["video_copy"] == "720p"
+    assert plan["audio_copy"] == {0}
+
+
+@pytest.mark.parametrize("keyframes, kbps", [
+    ([0.0, 2.0, 5.0], 2500),  # keyframes hors grille GOP : segments différents des variantes encodées
+    (None, 3500),             # au-dessus de la cible de la résolution
+])
+def test_no_passthrough(monkeypatch, keyframes, kbps):
+    if keyframes is not None:
+        monkeypatch.setattr(m, "get_keyframe_index", lambda src: keyframes)
+    assert m.plan_ladder(Path("a.mkv"), probe(1280, 720, kbps=kbps))["video_copy"] is None
+
+
+def test_passthrough_disabled(monkeypatch):
+    monkeypatch.setattr(m, "VIDEO_PASSTHROUGH", False)
+    monkeypatch.setattr(m, "AUDIO_PASSTHROUGH", False)
+    plan = m.plan_ladder(Path("a.mkv"), probe(1280, 720, kbps=2500, audios=[{"codec_name": "aac", "channels": 2}]))
+    assert plan["video_copy"] is None and plan["audio_copy"] == set()
+
+
+MULTI = [
+    ["720p", "1280:720", "1280x720", 3000],
+    ["720p_hevc", "1280:720", "1280x720", 2000, "hevc"],
+    ["720p_av1", "1280:720", "1280x720", 1500, "av1"],
+]
+
+
+@pytest.mark.parametrize("mode, kept", [
+    ("ts", ["720p"]),  # HEVC/AV1 : fMP4 ou CMAF seulement
+    ("fmp4", ["720p", "720p_hevc", "720p_av1"]),
+    ("cmaf", ["720p", "720p_hevc", "720p_av1"]),
+])
+def test_hevc_and_av1_need_fmp4(monkeypatch, mode, kept):
+    monkeypatch.setattr(m, "RESOLUTIONS", [list(r) for r in MULTI])
+    plan = m.plan_ladder(Path("a.mkv"), probe(1280, 720), mode)
+    assert [n for n, _k in rungs(plan)] == kept
+    assert plan["skipped"] == [r[0] for r in MULTI if r[0] not in kept]
+    assert plan["backends"] == {n: {"720p": "x264", "720p_hevc": "x265", "720p_av1": "svtav1"}[n] for n in kept}
+
+
+def test_codec_without_encoder_is_skipped(monkeypatch):
+    monkeypatch.setattr(m, "RESOLUTIONS", [list(r) for r in MULTI])
+    monkeypatch.setattr(m, "codec_backend", lambda codec: None if codec == "av1" else {"h264": "x264", "hevc": "x265"}[codec])
+    plan = m.plan_ladder(Path("a.mkv"), probe(1280, 720), "fmp4")
+    assert plan["skipped"] == ["720p_av1"]
+
+
+@pytest.fixture
+def complexity(monkeypatch):
+    monkeypatch.setattr(m, "RESOLUTIONS", [list(r) for r in LADDER] + [["360p", "640:360", "640x360", 800]])
+    monkeypatch.setattr(m, "COMPLEXITY_ANALYSIS", True)
+    monkeypatch.setattr(m, "COMPLEXITY_REFERENCE_KBPS", 800)
+    monkeypatch.setattr(m, "COMPLEXITY_FACTOR_RANGE", (0.4, 1.5))
+    monkeypatch.setattr(m, "COMPLEXITY_MIN_STEP_K", 250)
+
+    def measured(kbps):
+        monkeypatch.setattr(m, "title_complexity", lambda src, probe: {"kbps": kbps} if kbps else None)
+    return measured
+
+
+@pytest.mark.parametrize("kbps, score, expected", [
+    (400, 0.5, [("1080p", 2500), ("720p", 1500), ("480p", 700), ("360p", 400)]),
+    (2400, 3.0, [("1080p", 7500), ("720p", 4500), ("480p", 2100), ("360p", 1200)]),  # facteur borné à 1.5
+    # borné à 0.4 : 480p (560) à moins de 250 kbps du 360p (320) → retirée
+    (160, 0.2, [("1080p", 2000), ("720p", 1200), ("360p", 320)]),
+])
+def test_complexity_scales_ladder(complexity, kbps, score, expected):
+    complexity(kbps)
+    plan = m.plan_ladder(Path("a.mkv"), probe(1920, 1080))
+    assert plan["complexity"] == pytest.approx(score)
+    assert rungs(plan) == expected
+
+
+def test_min_step_disabled(complexity, monkeypatch):
+    complexity(160)
+    monkeypatch.setattr(m, "COMPLEXITY_MIN_STEP_K", 0)
+    assert len(m.plan_ladder(Path("a.mkv"), probe(1920, 1080))["rungs"]) == 4
+
+
+def test_complexity_keeps_copied_rung(complexity):
+    complexity(160)
+    plan = m.plan_ladder(Path("a.mkv"), probe(1280, 720, kbps=2500))
+    assert plan["video_copy"] == "720p"
+    assert rungs(plan) == [("720p", 2500), ("360p", 320)]  # copie : débit de la source (non réduit), jamais retirée
+
+
+def test_failed_analysis_leaves_ladder(complexity):
+    complexity(None)
+    plan = m.plan_ladder(Path("a.mkv"), probe(1920, 1080))
+    assert plan["complexity"] is None
+    assert rungs(plan) == [("1080p", 5000), ("720p", 3000), ("480p", 1400), ("360p", 800)]
@@ -0,0 +1,65 @@
+# Master : renditions audio partagées (EXT-X-MEDIA), ordre et DEFAULT, BANDWIDTH des variantes
+import pytest
+
+import main as m
+
+
+@pytest.fixture(autouse=True)
+def audio_bitrate(monkeypatch):
+    monkeypatch.setattr(m, "AUDIO_BITRATE_K", 128)
+
+
+def master_lines(tmp_path, rendus, **kwargs):
+    m.write_master(tmp_path, rendus, **kwargs)
+    return (tmp_path / "master.m3u8").read_text(encoding="utf-8").splitlines()
+
+
+def attrs(line: str) -> dict:
+    out = {}
+    for part in line.split(":", 1)[1].split(","):
+        key, _, value = part.partition("=")
+        out[key] = value.strip('"')
+    return out
+
+
+def test_audio_rendition_names_unique():
+    assert m.audio_rendition_names([(1, "fre"), (2, "eng"), (3, "fre"), (4, "und")]) == \
+        ["audio_fre", "audio_eng", "audio_fre_2", "audio_und"]
+
+
+def test_shared_audio_group(tmp_path):
+    names = m.audio_rendition_names([(1, "fre"), (2, "eng"), (3, "und")])
+    lines = master_lines(tmp_path, [("720p", "1280x720", 3000)], audio=list(zip(names, ["fre", "eng", "und"])))
+    media = [attrs(line) for line in lines if line.startswith("#EXT-X-MEDIA:")]
+    assert [a["NAME"] for a in media] == ["fre", "eng", "und"]
+    assert [a["DEFAULT"] for a in media] == ["YES", "NO", "NO"]  # 1ʳᵉ piste (FR prioritaire) par défaut
+    assert [a.get("LANGUAGE") for a in media] == ["fr", "en", None]  # "und" : pas de LANGUAGE
+    assert all(a["TYPE"] == "AUDIO" and a["GROUP-ID"] == m.AUDIO_GROUP_ID for a in media)
+    assert media[0]["URI"] == "audio_fre/audio_fre.m3u8"
+
+
+def test_bandwidth_counts_shared_audio(tmp_path):
+    lines = master_lines(tmp_path, [("720p", "1280x720", 3000), ("360p", "640x360", 800)], audio=[("audio_fre", "fre")])
+    inf = [attrs(line) for line in lines if line.startswith("#EXT-X-STREAM-INF:")]
+    assert [a["BANDWIDTH"] for a in inf] == ["3128000", "928000"]
+    assert all(a["AUDIO"] == m.AUDIO_GROUP_ID for a in inf)
+    assert lines[lines.index(next(line for line in lines if "1280x720" in line)) + 1] == "720p/720p.m3u8"
+
+
+def test_without_shared_audio(tmp_path):
+    lines = master_lines(tmp_path, [("360p", "640x360", 800)])
+    assert not any(line.startswith("#EXT-X-MEDIA:") for line in lines)
+    inf = attrs(next(line for line in lines if line.startswith("#EXT-X-STREAM-INF:")))
+    assert inf["BANDWIDTH"] == "800000"  # audio multiplexé dans la variante : débit de consigne vidéo seul
+    assert "AUDIO" not in inf
+
+
+def test_bandwidth_counts_copied_audio_at_source_bitrate(tmp_path):
+    info = {"streams": [{"codec_type": "video"}, {"codec_type": "audio", "bit_rate": "96000"},
+                        {"codec_type": "audio", "tags": {"BPS": "192000"}}, {"codec_type": "audio"}]}
+    assert m.audio_peak_kbps(info, [(0, "fre")], {0}) == 96
+    assert m.audio_peak_kbps(info, [(0, "fre"), (1, "eng")], {0, 1}) == 192  # la plus lourde du groupe
+    assert m.audio_peak_kbps(info, [(0, "fre"), (2, "ger")], {0}) == 128  # piste réencodée : AUDIO_BITRATE_K
+    assert m.audio_peak_kbps(info, [(2, "ger")], {2}) == 128  # copiée, débit inconnu
+    lines = master_lines(tmp_path, [("360p", "640x360", 800)], audio=[("audio_fre", "fre")], audio_kbps=96)
+    assert attrs(next(line for line in lines if line.startswith("#EXT-X-STREAM-INF:")))["BANDWIDTH"] == "896000"
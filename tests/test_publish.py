@@ -0,0 +1,47 @@
+# Publication d'une variante (scratch → sortie) : échange atomique renameat2, repli sur deux renommages
+import pytest
+
+import main as m
+
+
+def make_variant(root, name: str, payload: bytes):
+    d = root / name
+    d.mkdir(parents=True)
+    (d / f"{name}.m3u8").write_bytes(payload)
+    (d / "000.ts").write_bytes(payload)
+
+
+@pytest.mark.parametrize("exchange", [True, False])
+def test_republish_replaces_whole_variant(tmp_path, monkeypatch, exchange):
+    if not exchange:
+        monkeypatch.setattr(m, "rename_exchange", lambda a, b: False)
+    work, pub = tmp_path / "work", tmp_path / "pub"
+    make_variant(work, "360p", b"v1")
+    m.publish_variant(work, pub, "360p")
+    make_variant(work, "360p", b"v2")
+    (work / "360p" / "001.ts").write_bytes(b"v2")
+    m.publish_variant(work, pub, "360p")
+    assert sorted(p.name for p in (pub / "360p").iterdir()) == ["000.ts", "001.ts", "360p.m3u8"]
+    assert (pub / "360p" / "360p.m3u8").read_bytes() == b"v2"
+    assert sorted(p.name for p in pub.iterdir()) == ["360p"]  # ni .publish-* ni .old-*
+    assert not (work / "360p").exists()
+
+
+def test_rename_exchange_swaps(tmp_path):
+    a, b = tmp_path / "a", tmp_path / "b"
+    a.mkdir()
+    b.mkdir()
+    (a / "x").write_text("a")
+    (b / "x").write_text("b")
+    if not m.rename_exchange(a, b):
+        pytest.skip("renameat2(RENAME_EXCHANGE) indisponible ici")
+    assert (a / "x").read_text() == "b" and (b / "x").read_text() == "a"
+
+
+def test_publish_cleans_stale_leftovers(tmp_path):
+    work, pub = tmp_path / "work", tmp_path / "pub"
+    make_variant(work, "360p", b"v1")
+    (pub / ".360p.old-dead").mkdir(parents=True)
+    (pub / ".360p.publish-dead").mkdir()
+    m.publish_variant(work, pub, "360p")
+    assert sorted(p.name for p in pub.iterdir()) == ["360p"]
@@ -0,0 +1,67 @@
+# Slots d'encodage d'un ffmpeg d'échelle à codecs mêlés : une famille d'encodeur = un slot, scale CPU compté à côté d'un GPU
+import threading
+
+import pytest
+
+import main as m
+
+
+@pytest.fixture(autouse=True)
+def slots(monkeypatch):
+    monkeypatch.setattr(m, "_slots", {})
+    monkeypatch.setattr(m, "ENCODER_SLOTS", {"nvenc": 1, "x264": 1, "x265": 1, "svtav1": 1})
+    monkeypatch.setattr(m, "CPU_SCALE_SLOTS", 1)
+
+
+def busy(name: str) -> bool:
+    # 1 slot par famille : pris ⇔ un acquire non bloquant échoue
+    sem = m._slot(name, 1)
+    if sem.acquire(blocking=False):
+        sem.release()
+        return False
+    return True
+
+
+def test_one_slot_per_family():
+    with m.ladder_slots(["nvenc", "nvenc_hevc", "svtav1"], hw=True):
+        assert busy("nvenc") and busy("svtav1")  # nvenc_hevc compte dans nvenc (sinon 2ᵉ acquire bloquant)
+        assert busy("cpu_scale")  # branche SVT-AV1 : scale CPU dans un ffmpeg GPU
+        assert not busy("x264")
+    assert not (busy("nvenc") or busy("svtav1") or busy("cpu_scale"))
+
+
+@pytest.mark.parametrize("backends, hw, cpu", [
+    (["nvenc"], True, False),
+    (["nvenc"], False, True),
+    (["x264", "x265"], False, False),  # backends CPU : le scale fait partie du job
+])
+def test_cpu_scale_slot(backends, hw, cpu):
+    with m.ladder_slots(backends, hw=hw):
+        assert busy("cpu_scale") == cpu
+
+
+def test_mixed_ladders_share_the_av1_slot():
+    inside = threading.Event()
+    release = threading.Event()
+
+    def first():
+        with m.ladder_slots(["nvenc", "svtav1"], hw=True):
+            inside.set()
+            release.wait(5)
+
+    t = threading.Thread(target=first)
+    t.start()
+    assert inside.wait(5)
+    second = threading.Event()
+
+    def other():
+        with m.ladder_slots(["x264", "svtav1"], hw=False):
+            second.set()
+
+    t2 = threading.Thread(target=other)
+    t2.start()
+    assert not second.wait(0.3)  # ENCODER_SLOTS["svtav1"] = 1 : la 2ᵉ échelle attend
+    release.set()
+    assert second.wait(5)
+    t.join()
+    t2.join()
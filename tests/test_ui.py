@@ -0,0 +1,66 @@
+# Tableau de la file en fenêtre (FilesView) : terminés récents + en cours + suivants, compteurs, lignes refaites à la demande
+from pathlib import Path
+
+import pytest
+
+import main as m
+
+
+@pytest.fixture(autouse=True)
+def window(monkeypatch):
+    monkeypatch.setattr(m, "UI_QUEUE_ROWS", 6)
+    monkeypatch.setattr(m, "LANG", "en")
+
+
+@pytest.fixture
+def files():
+    return [m.new_file_state(i + 1, Path(f"f{i:02d}.mkv")) for i in range(50)]
+
+
+def shown(view) -> list:
+    return list(view.table().columns[1].cells)
+
+
+def test_window_shows_next_queued(files):
+    view = m.FilesView(files)
+    table = view.table()
+    assert list(table.columns[1].cells) == ["f00", "f01", "f02", "f03", "f04", "f05"]
+    assert "50 files" in table.caption and "44 not shown" in table.caption
+    assert view.counts == {"queued": 50, "running": 0, "done": 0, "error": 0}
+
+
+def test_running_then_finished(files):
+    view = m.FilesView(files)
+    view.table()
+    files[10]["started"] = files[11]["started"] = True
+    assert shown(view) == ["f10", "f11", "f00", "f01", "f02", "f03"]
+    files[10]["exit"] = m.EXIT_OK
+    files[11]["exit"] = m.EXIT_FAILED
+    # derniers terminés (au plus la moitié de la fenêtre), puis les suivants en attente
+    assert shown(view) == ["f10", "f11", "f00", "f01", "f02", "f03"]
+    assert view.counts == {"queued": 48, "running": 0, "done": 1, "error": 1}
+    files[0]["started"] = True
+    assert shown(view) == ["f10", "f11", "f00", "f01", "f02", "f03"]
+    assert view.counts["running"] == 1 and view.counts["queued"] == 47
+
+
+def test_finished_rows_are_capped(files):
+    view = m.FilesView(files)
+    view.table()
+    for st in files[:10]:
+        st["exit"] = m.EXIT_OK
+    assert shown(view) == ["f07", "f08", "f09", "f10", "f11", "f12"]
+
+
+def test_only_changed_rows_are_rebuilt(files, monkeypatch):
+    view = m.FilesView(files)
+    view.table()
+    rebuilt = []
+    update = view._update_row
+    monkeypatch.setattr(view, "_update_row", lambda pos: (rebuilt.append(pos), update(pos)))
+    files[30]["status"] = "OK (360p)"
+    view.table()
+    assert rebuilt == [30]
+    files.append(m.new_file_state(51, Path("late.mkv")))  # --watch : la file grandit
+    table = view.table()
+    assert rebuilt == [30, 50] and "51 files" in table.caption
@@ -0,0 +1,218 @@
+# Vérificateur : lecture des en-têtes TS / ISO-BMFF, débit crête RFC 8216, réécriture du master — paquets et boîtes synthétiques
+import struct
+
+import pytest
+
+import main as m
+
+
+def box(typ: bytes, payload: bytes = b"") -> bytes:
+    return struct.pack(">I", 8 + len(payload)) + typ + payload
+
+
+def full(typ: bytes, flags: int, payload: bytes = b"", version: int = 0) -> bytes:
+    return box(typ, bytes([version]) + flags.to_bytes(3, "big") + payload)
+
+
+# ---------- TS ----------
+
+def ts_packet(pid: int, payload: bytes = b"", pusi: bool = False, rai: bool = False) -> bytes:
+    head = bytes([0x47, (0x40 if pusi else 0) | (pid >> 8), pid & 0xFF])
+    if rai:
+        adapt = bytes([1, 0x40])
+        head += bytes([0x30])
+    else:
+        adapt = b""
+        head += bytes([0x10])
+    pkt = head + adapt + payload
+    return pkt + b"\xff" * (m.TS_PACKET - len(pkt))
+
+
+def pes(stream_id: int, body: bytes = b"") -> bytes:
+    pts = b"\x21\x00\x01\x00\x01"
+    return b"\0\0\1" + bytes([stream_id]) + b"\0\0" + bytes([0x80, 0x80, len(pts)]) + pts + body
+
+
+def ts_segment(frames: int, key: bool, audio: bytes = b"") -> bytes:
+    data = b""
+    if audio:
+        data += ts_packet(0x101, pes(0xC0, audio), pusi=True)
+    for k in range(frames):
+        data += ts_packet(0x100, pes(0xE0), pusi=True, rai=key and k == 0)
+        data += ts_packet(0x100)  # suite du PES
+    return data
+
+
+def test_ts_segment_info_keyframe_and_frames():
+    data = ts_segment(3, key=True, audio=b"\xff\xf1\x50\x80")
+    assert m.ts_segment_info(data, 0, len(data), True) == (True, 3)
+    assert m.ts_segment_info(data, 0, len(data), False) == (True, 1)  # arrêt au 1ᵉʳ PES vidéo
+
+
+def test_ts_segment_info_no_keyframe_audio_only_and_range():
+    data = ts_segment(2, key=False)
+    assert m.ts_segment_info(data, 0, len(data), True) == (False, 2)
+    audio = ts_packet(0x101, pes(0xC0, b"\xff\xf1\x50\x80"), pusi=True)
+    assert m.ts_segment_info(audio, 0, len(audio), True) == (None, 0)
+    both = audio + data  # CMAF/TS en octets : seule la plage demandée compte
+    assert m.ts_segment_info(both, len(audio), len(both), True) == (False, 2)
+
+
+def test_ts_segment_info_sync_lost():
+    data = bytearray(ts_segment(2, key=True))
+    data[m.TS_PACKET] = 0x00
+    with pytest.raises(ValueError):
+        m.ts_segment_info(data, 0, len(data), True)
+
+
+@pytest.mark.parametrize("profile, codec", [(1, "mp4a.40.2"), (0, "mp4a.40.1")])
+def test_ts_audio_codec_from_adts(profile, codec):
+    adts = bytes([0xFF, 0xF1, (profile << 6) | 0x10, 0x80])
+    data = ts_segment(1, key=True) + ts_packet(0x101, pes(0xC0, adts), pusi=True)
+    assert m.ts_audio_codec(data) == codec
+    assert m.ts_audio_codec(ts_segment(1, key=True)) is None
+
+
+# ---------- fMP4 ----------
+
+SYNC, NON_SYNC = 0x02000000, 0x01010000
+
+
+def init_mp4(tracks) -> bytes:
+    # tracks : [(track_ID, handler, trex default_sample_flags)]
+    traks, trexs = b"", b""
+    for track_id, handler, flags in tracks:
+        tkhd = full(b"tkhd", 3, b"\0" * 8 + struct.pack(">I", track_id) + b"\0" * 68)
+        hdlr = full(b"hdlr", 0, b"\0" * 4 + handler + b"\0" * 12 + b"\0")
+        traks += box(b"trak", tkhd + box(b"mdia", hdlr))
+        trexs += full(b"trex", 0, struct.pack(">IIIII", track_id, 1, 0, 0, flags))
+    return box(b"ftyp", b"iso6") + box(b"moov", traks + box(b"mvex", trexs))
+
+
+def moof(track_id: int, count: int, tfhd_flags=None, first=None, per_sample=None) -> bytes:
+    tf = 0x20000 | (0x20 if tfhd_flags is not None else 0)
+    tfhd = full(b"tfhd", tf, struct.pack(">I", track_id) + (struct.pack(">I", tfhd_flags) if tfhd_flags is not None else b""))
+    tr = 0x1 | (0x4 if first is not None else 0) | (0x100 | 0x200 | 0x400 if per_sample else 0)
+    body = struct.pack(">I", count) + struct.pack(">i", 0)
+    if first is not None:
+        body += struct.pack(">I", first)
+    for k in range(count if per_sample else 0):
+        body += struct.pack(">III", 1000, 500, per_sample[k])
+    trun = full(b"trun", tr, body)
+    return box(b"moof", full(b"mfhd", 0, b"\0\0\0\1") + box(b"traf", tfhd + trun)) + box(b"mdat", b"\0" * 32)
+
+
+def test_mp4_tracks_types_and_trex_flags():
+    init = init_mp4([(1, b"vide", NON_SYNC), (2, b"soun", SYNC)])
+    assert m.mp4_tracks(init) == {1: (b"vide", NON_SYNC), 2: (b"soun", SYNC)}
+
+
+@pytest.mark.parametrize("kwargs, trex, key", [
+    ({"first": SYNC}, NON_SYNC, True),                         # first_sample_flags
+    ({"first": NON_SYNC}, SYNC, False),
+    ({"per_sample": [SYNC, NON_SYNC, NON_SYNC]}, NON_SYNC, True),  # flags par échantillon (après durée + taille)
+    ({"per_sample": [NON_SYNC, SYNC, SYNC]}, SYNC, False),
+    ({"tfhd_flags": NON_SYNC}, SYNC, False),                  # tfhd default_sample_flags
+    ({}, SYNC, True),                                          # trex
+    ({}, NON_SYNC, False),
+])
+def test_fmp4_segment_info_flag_precedence(kwargs, trex, key):
+    data = moof(1, 3, **kwargs)
+    assert m.fmp4_segment_info(data, 0, len(data), 1, trex) == (key, 3)
+
+
+def test_fmp4_segment_info_other_track_and_several_fragments():
+    data = moof(2, 5, first=NON_SYNC) + moof(1, 4, first=SYNC) + moof(1, 2, first=NON_SYNC)
+    assert m.fmp4_segment_info(data, 0, len(data), 1, NON_SYNC) == (True, 6)
+    assert m.fmp4_segment_info(data, 0, len(data), 3, NON_SYNC) == (None, 0)
+    second = len(moof(2, 5, first=NON_SYNC)) + len(moof(1, 4, first=SYNC))
+    assert m.fmp4_segment_info(data, second, len(data), 1, SYNC) == (False, 2)  # plage d'octets (CMAF)
+
+
+def descriptor(tag: int, body: bytes, long_size: bool = False) -> bytes:
+    size = bytes([0x80, 0x80, 0x80, len(body)]) if long_size else bytes([len(body)])
+    return bytes([tag]) + size + body
+
+
+def init_audio(oti: int, aot: int, es_flags: int = 0, long_size: bool = False) -> bytes:
+    dsi = descriptor(0x05, bytes([aot << 3, 0x10]), long_size)
+    dcd = descriptor(0x04, bytes([oti, 0x15]) + b"\0" * 11 + dsi, long_size)
+    es_extra = ((b"\0\2" if es_flags & 0x80 else b"") + (b"\3abc" if es_flags & 0x40 else b"")
+                + (b"\0\7" if es_flags & 0x20 else b""))
+    es = descriptor(0x03, b"\0\1" + bytes([es_flags]) + es_extra + dcd, long_size)
+    mp4a = box(b"mp4a", b"\0" * 28 + full(b"esds", 0, es))
+    stsd = full(b"stsd", 0, struct.pack(">I", 1) + mp4a)
+    stbl = box(b"stbl", stsd)
+    return box(b"moov", box(b"trak", box(b"mdia", box(b"minf", stbl))))
+
+
+@pytest.mark.parametrize("oti, aot, es_flags, long_size, codec", [
+    (0x40, 2, 0, False, "mp4a.40.2"),
+    (0x40, 5, 0, True, "mp4a.40.5"),         # tailles de descripteur sur 4 octets
+    (0x40, 29, 0xC0, False, "mp4a.40.29"),   # dependsOn_ES_ID + URL
+    (0x40, 2, 0xE0, False, "mp4a.40.2"),     # + OCR_ES_Id
+    (0x6B, 0, 0, False, "mp4a.6B"),          # MP3 : objectTypeIndication seul
+])
+def test_fmp4_audio_codec(oti, aot, es_flags, long_size, codec):
+    assert m.fmp4_audio_codec(init_audio(oti, aot, es_flags, long_size)) == codec
+
+
+def test_fmp4_audio_codec_without_audio():
+    assert m.fmp4_audio_codec(init_mp4([(1, b"vide", SYNC)])) is None
+
+
+# ---------- débit crête ----------
+
+def test_peak_window_single_segments():
+    assert m.peak_window([(2.0, 1000), (2.0, 3000), (2.0, 1000)], 2) == 12000
+
+
+def test_peak_window_short_segments_are_grouped():
+    # 0,5 s seul < 0,5 × 2 s : pas une fenêtre ; 2 segments = 1 s → 32 kbit/s
+    assert m.peak_window([(0.5, 4000), (0.5, 0), (2.0, 100)], 2) == 32000
+
+
+def test_peak_window_fallback_and_empty():
+    assert m.peak_window([(0.2, 100)], 10) == 4000  # trop court pour une fenêtre : moyenne
+    assert m.peak_window([], 10) == 0
+
+
+# ---------- master ----------
+
+MASTER = """#EXTM3U
+#EXT-X-VERSION:7
+#EXT-X-INDEPENDENT-SEGMENTS
+#EXT-X-MEDIA:TYPE=AUDIO,GROUP-ID="aud",NAME="fre",LANGUAGE="fre",DEFAULT=YES,AUTOSELECT=YES,URI="audio_fre/audio_fre.m3u8"
+#EXT-X-STREAM-INF:BANDWIDTH=900000,RESOLUTION=640x360,CODECS="avc1.640028",AUDIO="aud",CLOSED-CAPTIONS=NONE
+360p/360p.m3u8
+#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=50000,RESOLUTION=640x360,URI="360p/360p_iframes.m3u8"
+"""
+
+
+def report(peak: int, average: int, video=None, audio=(), frame_rate=None):
+    return {"problems": [], "peak": peak, "average": average, "frame_rate": frame_rate,
+            "video_codec": video, "audio_codecs": list(audio)}
+
+
+def test_rewrite_master_measured_values(tmp_path):
+    (tmp_path / "master.m3u8").write_text(MASTER, encoding="utf-8")
+    assert m.master_playlists(tmp_path) == ["audio_fre/audio_fre.m3u8", "360p/360p.m3u8"]
+    reports = {
+        "360p/360p.m3u8": report(700000, 500000, video="avc1.64001e", frame_rate=25.0),
+        "audio_fre/audio_fre.m3u8": report(130000, 128000, audio=["mp4a.40.2"]),
+    }
+    assert m.rewrite_master(tmp_path, reports)
+    lines = (tmp_path / "master.m3u8").read_text(encoding="utf-8").splitlines()
+    inf = lines[4]
+    assert inf == ('#EXT-X-STREAM-INF:BANDWIDTH=830000,AVERAGE-BANDWIDTH=628000,RESOLUTION=640x360,FRAME-RATE=25.000,'
+                   'CODECS="avc1.64001e,mp4a.40.2",AUDIO="aud",CLOSED-CAPTIONS=NONE')
+    assert lines[5] == "360p/360p.m3u8"
+    assert lines[6] == '#EXT-X-I-FRAME-STREAM-INF:BANDWIDTH=50000,RESOLUTION=640x360,CODECS="avc1.64001e",URI="360p/360p_iframes.m3u8"'
+    assert lines[3] == MASTER.splitlines()[3]  # EXT-X-MEDIA inchangé
+    assert not m.rewrite_master(tmp_path, reports)  # déjà à jour : pas de réécriture
+
+
+def test_rewrite_master_without_measure_keeps_line(tmp_path):
+    (tmp_path / "master.m3u8").write_text(MASTER, encoding="utf-8")
+    assert not m.rewrite_master(tmp_path, {"360p/360p.m3u8": report(0, 0)})
+    assert (tmp_path / "master.m3u8").read_text(encoding="utf-8") == MASTER
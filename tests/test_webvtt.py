@@ -0,0 +1,65 @@
+# Sous-titres WebVTT segmentés (segment_webvtt) : cues à cheval répétées, X-TIMESTAMP-MAP en TS, playlist VOD
+import pytest
+
+import main as m
+
+VTT = "\ufeffWEBVTT\r\n\r\n1\r\n00:00:00.500 --> 00:00:01.500\r\nun\r\n\r\n" \
+      "2\r\n00:00:01.800 --> 00:00:02.500 align:start\r\ndeux\r\nlignes\r\n\r\n" \
+      "00:04.200 --> 00:05.000\r\ntrois\r\n"
+
+
+@pytest.fixture(autouse=True)
+def seg_dur(monkeypatch):
+    monkeypatch.setattr(m, "SEG_DUR", 2)
+
+
+def cues(path) -> list:
+    return [line for line in path.read_text(encoding="utf-8").splitlines() if "-->" in line]
+
+
+def test_cues_split_on_segment_grid(tmp_path):
+    (tmp_path / "sub_fre.vtt").write_text(VTT, encoding="utf-8")
+    m.segment_webvtt(tmp_path, "sub_fre", 5.0, None)
+    assert cues(tmp_path / "000.vtt") == ["00:00:00.500 --> 00:00:01.500", "00:00:01.800 --> 00:00:02.500 align:start"]
+    assert cues(tmp_path / "001.vtt") == ["00:00:01.800 --> 00:00:02.500 align:start"]  # à cheval : répétée, horaires absolus
+    assert cues(tmp_path / "002.vtt") == ["00:04.200 --> 00:05.000"]
+    seg0 = (tmp_path / "000.vtt").read_text(encoding="utf-8")
+    assert seg0.startswith("WEBVTT\n\n") and "deux\nlignes" in seg0
+    assert "\n1\n" not in seg0  # identifiant de cue retiré
+
+
+def test_playlist_durations(tmp_path):
+    (tmp_path / "sub_fre.vtt").write_text(VTT, encoding="utf-8")
+    out = m.segment_webvtt(tmp_path, "sub_fre", 5.0, None)
+    lines = out.read_text(encoding="utf-8").splitlines()
+    assert out.name == "sub_fre.m3u8"
+    assert "#EXT-X-TARGETDURATION:2" in lines and lines[-1] == "#EXT-X-ENDLIST"
+    assert [line for line in lines if line.startswith("#EXTINF:")] == ["#EXTINF:2.000000,", "#EXTINF:2.000000,", "#EXTINF:1.000000,"]
+    assert [line for line in lines if line.endswith(".vtt")] == ["000.vtt", "001.vtt", "002.vtt"]
+
+
+def test_timestamp_map_for_ts(tmp_path):
+    (tmp_path / "sub_fre.vtt").write_text("WEBVTT\n", encoding="utf-8")
+    m.segment_webvtt(tmp_path, "sub_fre", 3.0, 90000 + 126000)
+    for seg in ("000.vtt", "001.vtt"):
+        head = (tmp_path / seg).read_text(encoding="utf-8").splitlines()[:2]
+        assert head == ["WEBVTT", "X-TIMESTAMP-MAP=MPEGTS:216000,LOCAL:00:00:00.000"]
+
+
+def pts_bytes(pts: int) -> bytes:
+    return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1, (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1])
+
+
+def ts_packet(pid: int, payload: bytes, pusi: bool = True) -> bytes:
+    pkt = bytes([0x47, (0x40 if pusi else 0) | (pid >> 8), pid & 0xFF, 0x10]) + payload
+    return pkt + b"\xff" * (m.TS_PACKET - len(pkt))
+
+
+def test_first_video_pts(tmp_path):
+    seg = tmp_path / "000.ts"
+    audio = ts_packet(0x101, b"\0\0\1\xc0\0\0\x80\x80\x05" + pts_bytes(1234))
+    video = ts_packet(0x100, b"\0\0\1\xe0\0\0\x80\x80\x05" + pts_bytes(2**32 + 216000))
+    seg.write_bytes(audio + ts_packet(0x100, b"", pusi=False) + video)
+    assert m.ts_first_pts(seg) == 2**32 + 216000  # audio ignoré : PTS de la 1ʳᵉ image vidéo
+    seg.write_bytes(audio)
+    assert m.ts_first_pts(seg) is None